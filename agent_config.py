@@ -0,0 +1,124 @@
+"""
+エージェント構成: ワークフローで使うLLM・エージェントをレジストリに登録する
+test.py や batch_runner.py など、ワークフローを実行するスクリプトで共通に使用します。
+"""
+
+from typing import Any, Dict, List, Optional
+
+from agents.registry import AgentRegistry, Factory, Ref
+from llm.cache import LLMCache
+
+
+def openai_llm_factory(api_key: Optional[str], model: str = "gpt-4o", temperature: float = 0,
+                       base_url: Optional[str] = None, max_retries: int = 2,
+                       http_client: Any = None, http_async_client: Any = None) -> Factory:
+    """
+    ChatOpenAI を生成するファクトリを返す（langchain_openai は生成時にimportする）。
+    base_url を指定すると、llm.mock_server などOpenAI互換のサーバーに接続する。
+    http_client / http_async_client には llm.gateway.shared_http_clients() の接続プールを渡せる。
+    """
+    def create_llm(registry: AgentRegistry) -> Any:
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            temperature=temperature,
+            model=model,
+            openai_api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            http_client=http_client,
+            http_async_client=http_async_client
+        )
+    return create_llm
+
+
+def recording_llm_factory(inner: Factory, cassette_path: str, store_requests: bool = False) -> Factory:
+    """inner が生成するLLMを RecordingChatModel で包み、やりとりを cassette_path に追記するファクトリを返す"""
+    def create_llm(registry: AgentRegistry) -> Any:
+        from llm.cassette import Cassette, RecordingChatModel
+        return RecordingChatModel(inner=inner(registry), cassette=Cassette(cassette_path, store_requests=store_requests))
+    return create_llm
+
+
+def replay_llm_factory(cassette_path: str, realtime: bool = False, speed: float = 1.0) -> Factory:
+    """記録済みのカセットを再生する ReplayChatModel のファクトリを返す（ネットワーク不要）"""
+    def create_llm(registry: AgentRegistry) -> Any:
+        from llm.cassette import Cassette, ReplayChatModel
+        return ReplayChatModel(cassette=Cassette.load(cassette_path), realtime=realtime, speed=speed)
+    return create_llm
+
+
+# 抽出・コマンド生成だけを行うエージェントは小さいモデル、コードと計画は大きいモデルを優先する
+DEFAULT_ROUTES = {
+    "file_operation_agent": ["small", "large"],
+    "command_generation_agent": ["small", "large"],
+    "terminal_agent": ["small", "large"],
+    "coding_agent": ["large", "small"],
+    "planning_agent": ["large", "small"],
+    "review_agent": ["large", "small"],
+    "default": ["large", "small"],
+}
+
+
+def model_routing(large: Factory, small: Factory, routes: Optional[Dict[str, List[str]]] = None,
+                  **options: Any) -> Dict[str, Any]:
+    """build_registry(routing=...) に渡す、大小2つのモデルの routing を作成する（options は ModelRouter の引数）"""
+    return {"models": {"large": large, "small": small}, "routes": routes or DEFAULT_ROUTES, **options}
+
+
+def build_registry(llm_factory: Factory, tools: List[Any], llm_cache: Optional[LLMCache] = None,
+                   gateway: Optional[Dict[str, Any]] = None,
+                   routing: Optional[Dict[str, Any]] = None) -> AgentRegistry:
+    """
+    LLMと各エージェントを登録したレジストリを作成する。
+    いずれも初回利用時に生成される。
+    gateway（LLMGateway の引数の辞書）を指定すると、エージェントは "llm_gateway" を経由してLLMを呼び出す
+    （BrowserAgent は browser_use にモデルを渡すため "llm" のまま）。
+    routing を指定すると、エージェントごとに llm.router.ModelRouter が選んだモデルを使う。
+        routing = {"models": {"large": factory, "small": factory}, "routes": {"file_operation_agent": ["small", "large"],
+                   "default": ["large", "small"]}, ...ModelRouter のその他の引数}
+    各モデルは "model.<名前>" として登録され、gateway を指定した場合はモデルごとの "llm_gateway.<名前>" を経由する。
+    """
+    registry = AgentRegistry()
+    registry.register("llm", llm_factory)
+    agent_llm = Ref("llm")
+    if gateway is not None:
+        registry.register_class("llm_gateway", "llm.gateway:LLMGateway", Ref("llm"), **gateway)
+        agent_llm = Ref("llm_gateway")
+    if routing is not None:
+        _register_router(registry, routing, gateway)
+
+    def llm_for(agent: str) -> Ref:
+        if routing is None:
+            return agent_llm
+        registry.register(f"llm.{agent}", lambda r: r.get("model_router").for_agent(agent))
+        return Ref(f"llm.{agent}")
+
+    registry.register_class("coding_agent", "agents.coding_agent:CodingAgent", llm_for("coding_agent"), tools, llm_cache)
+    registry.register_class("planning_agent", "agents.planning_agent:PlanningAgent", llm_for("planning_agent"), tools, llm_cache)
+    registry.register_class("review_agent", "agents.review_agent:ReviewAgent", llm_for("review_agent"), tools, llm_cache)
+    registry.register_class("file_operation_agent", "agents.file_operation_agent:FileOperationAgent", llm_for("file_operation_agent"), tools, llm_cache)
+    registry.register_class("terminal_agent", "agents.terminal_agent:TerminalAgent", llm_for("terminal_agent"), tools)
+    registry.register_class("browser_pool", "tools.browser_pool:BrowserPool", size=2)
+    registry.register_class("browser_agent", "agents.browser_agent:BrowserAgent", Ref("llm"), tools, pool=Ref("browser_pool"))
+    registry.register_class("command_generation_agent", "agents.command_generation_agent:CommandGenerationAgent", llm_for("command_generation_agent"), tools, llm_cache)
+    return registry
+
+
+def _register_router(registry: AgentRegistry, routing: Dict[str, Any], gateway: Optional[Dict[str, Any]]) -> None:
+    """routing の各モデルと "model_router" を登録する（モデルは最初に選ばれたときに生成される）"""
+    options = dict(routing)
+    factories: Dict[str, Factory] = options.pop("models")
+    routes = options.pop("routes")
+    models = {}
+    for name, factory in factories.items():
+        registry.register(f"model.{name}", factory)
+        target = f"model.{name}"
+        if gateway is not None:
+            registry.register_class(f"llm_gateway.{name}", "llm.gateway:LLMGateway", Ref(target), **gateway)
+            target = f"llm_gateway.{name}"
+        models[name] = lambda target=target: registry.get(target)
+
+    def create_router(r: AgentRegistry) -> Any:
+        from llm.router import ModelRouter
+        return ModelRouter(models, routes, **options)
+    registry.register("model_router", create_router)
@@ -4,7 +4,10 @@ BaseAgent: 抽象基底クラス
 """
 
 from langchain_core.runnables import RunnableConfig
-from typing import Any, Optional
+from typing import Any, Callable, Optional, Sequence
+from llm.cache import LLMCache
+from utils.budget import RunBudget, current_node, get_budget
+from utils.tracing import span, traced, record_llm_usage
 
 class BaseAgent:
     """
@@ -12,10 +15,18 @@ class BaseAgent:
     LLM呼び出し、ログ管理、ツール管理などの共通機能を集約します。
     """
 
-    def __init__(self, llm, tools=None):
+    def __init_subclass__(cls, **kwargs):
+        """サブクラスで定義された run / arun をトレース用のスパンで包む"""
+        super().__init_subclass__(**kwargs)
+        for method_name in ("run", "arun"):
+            if method_name in cls.__dict__:
+                setattr(cls, method_name, traced(f"{cls.__name__}.{method_name}", "agent")(cls.__dict__[method_name]))
+
+    def __init__(self, llm, tools=None, cache: Optional[LLMCache] = None):
         self.llm = llm
         self.tools = tools or []
         self.tool_map = {tool.name: tool for tool in self.tools}
+        self.cache = cache
 
     def get_llm(self):
         """LLMインスタンスを取得する"""
@@ -29,6 +40,101 @@ class BaseAgent:
         """指定された名前のツールを取得する"""
         return self.tool_map.get(tool_name)
 
+    def _charge_budget(self, config: Optional[RunnableConfig]) -> Optional[RunBudget]:
+        """run_budget が設定されていれば、呼び出し前に上限を確認して返す（超過時は BudgetExceeded）"""
+        budget = get_budget(config)
+        if budget is not None:
+            budget.check()
+        return budget
+
+    def _record_budget(self, budget: Optional[RunBudget], config: Optional[RunnableConfig],
+                       messages: Sequence[Any], response: Any) -> None:
+        if budget is not None and response is not None:
+            budget.record_llm(current_node(config, type(self).__name__), messages, response)
+
+    def invoke_llm(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Any:
+        """キャッシュを経由してLLMを呼び出す"""
+        with span("llm.invoke", "llm", agent=type(self).__name__) as span_args:
+            if self.cache is None:
+                budget = self._charge_budget(config)
+                response = self.llm.invoke(messages, config)
+                self._record_budget(budget, config, messages, response)
+            else:
+                key = self.cache.make_key(messages, self.llm, config)
+                response = self.cache.get(key)
+                span_args["cache_hit"] = response is not None
+                if response is None:
+                    budget = self._charge_budget(config)
+                    response = self.llm.invoke(messages, config)
+                    self.cache.set(key, response)
+                    self._record_budget(budget, config, messages, response)
+            record_llm_usage(span_args, messages, response)
+            return response
+
+    async def ainvoke_llm(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Any:
+        """キャッシュを経由してLLMを非同期で呼び出す"""
+        with span("llm.ainvoke", "llm", agent=type(self).__name__) as span_args:
+            if self.cache is None:
+                budget = self._charge_budget(config)
+                response = await self.llm.ainvoke(messages, config)
+                self._record_budget(budget, config, messages, response)
+            else:
+                key = self.cache.make_key(messages, self.llm, config)
+                response = self.cache.get(key)
+                span_args["cache_hit"] = response is not None
+                if response is None:
+                    budget = self._charge_budget(config)
+                    response = await self.llm.ainvoke(messages, config)
+                    self.cache.set(key, response)
+                    self._record_budget(budget, config, messages, response)
+            record_llm_usage(span_args, messages, response)
+            return response
+
+    def stream_llm(self, messages: Sequence[Any], on_chunk: Callable[[str], None],
+                   config: Optional[RunnableConfig] = None) -> Any:
+        """
+        LLMをストリーミングで呼び出し、テキストの断片ごとに on_chunk を呼ぶ。
+        結合した応答メッセージを返す（キャッシュにヒットした場合は全文を1回で渡す）。
+        """
+        with span("llm.stream", "llm", agent=type(self).__name__) as span_args:
+            key = self.cache.make_key(messages, self.llm, config) if self.cache is not None else None
+            response = self.cache.get(key) if key is not None else None
+            if response is not None:
+                span_args["cache_hit"] = True
+                on_chunk(response.content)
+            else:
+                budget = self._charge_budget(config)
+                for chunk in self.llm.stream(messages, config):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        on_chunk(chunk.content)
+                if key is not None and response is not None:
+                    self.cache.set(key, response)
+                self._record_budget(budget, config, messages, response)
+            record_llm_usage(span_args, messages, response)
+            return response
+
+    async def astream_llm(self, messages: Sequence[Any], on_chunk: Callable[[str], None],
+                          config: Optional[RunnableConfig] = None) -> Any:
+        """stream_llm の非同期版（astream を使用する）"""
+        with span("llm.astream", "llm", agent=type(self).__name__) as span_args:
+            key = self.cache.make_key(messages, self.llm, config) if self.cache is not None else None
+            response = self.cache.get(key) if key is not None else None
+            if response is not None:
+                span_args["cache_hit"] = True
+                on_chunk(response.content)
+            else:
+                budget = self._charge_budget(config)
+                async for chunk in self.llm.astream(messages, config):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        on_chunk(chunk.content)
+                if key is not None and response is not None:
+                    self.cache.set(key, response)
+                self._record_budget(budget, config, messages, response)
+            record_llm_usage(span_args, messages, response)
+            return response
+
     def run(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
         """エージェントを実行する"""
         raise NotImplementedError
@@ -1,26 +1,66 @@
 import logging
 from typing import Any, Optional
 from langchain_core.runnables import RunnableConfig
-from langchain_openai import ChatOpenAI
-from browser_use import Agent as BrowserUseAgent, Controller, Browser, BrowserConfig
-from browser_use.browser.context import BrowserContext
 from agents.base_agent import BaseAgent
+from tools.browser_pool import BrowserPool
+from utils.loop_bridge import run_sync
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+logger = logging.getLogger(__name__)
 
 class BrowserAgent(BaseAgent):
-    def __init__(self, llm=None, tools=None, task: str = ""):
+    def __init__(self, llm=None, tools=None, task: str = "", pool: Optional[BrowserPool] = None):
         super().__init__(llm, tools)
         self.task = task
-        self.controller = Controller()
-        self.browser = Browser(config=BrowserConfig(headless=True))
-        logging.info("BrowserAgent 初期化完了")
+        # pool を指定した場合は、実行ごとにプールからブラウザとコンテキストを借りる
+        self.pool = pool
+        # Controller / Browser は初回利用時に生成する（browser_use のimportとブラウザ起動を遅延）
+        self._controller = None
+        self._browser = None
+        logger.info("BrowserAgent 初期化完了")
+
+    @property
+    def controller(self):
+        if self._controller is None:
+            from browser_use import Controller
+            self._controller = Controller()
+        return self._controller
+
+    @property
+    def browser(self):
+        if self._browser is None:
+            from browser_use import Browser, BrowserConfig
+            self._browser = Browser(config=BrowserConfig(headless=True))
+        return self._browser
+
+    def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
+        """
+        同期版。常駐するイベントループで arun を実行する。
+        ループをまたいで使えないブラウザとプールを、呼び出しごとに作り直さずに済む。
+        """
+        logger.info("BrowserAgent.runを開始します。")
+        return run_sync(self.arun(input, config))
+
+    async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
+        logger.info("BrowserAgent.arunを開始します。")
+        from browser_use import Agent as BrowserUseAgent
+
+        if self.pool is not None:
+            # プールから借りたブラウザ・コンテキストを渡す（browser_use 側では閉じられない）
+            try:
+                async with self.pool.lease() as lease:
+                    agent = BrowserUseAgent(
+                        task=self.task,
+                        llm=self.llm,
+                        browser=lease.browser,
+                        browser_context=lease.context,
+                        controller=self.controller
+                    )
+                    await agent.run()
+                return "BrowserAgent: タスクが完了しました。"
+            except Exception as e:
+                logger.error("BrowserAgent 実行中にエラーが発生しました: %s", e)
+                return "BrowserAgent 実行中にエラーが発生しました。"
 
-    async def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        logging.info("BrowserAgent.runを開始します。")
         # browser_use の Agent クラスを使って任意のタスクを実行
         agent = BrowserUseAgent(
             task=self.task,
@@ -33,10 +73,5 @@ class BrowserAgent(BaseAgent):
             await agent.run()
             return "BrowserAgent: タスクが完了しました。"
         except Exception as e:
-            logging.error(f"BrowserAgent 実行中にエラーが発生しました: {e}")
-            return "BrowserAgent 実行中にエラーが発生しました。"
-
-    async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        logging.info("BrowserAgent.arunを開始します。")
-        # 同期的に run() を呼ぶか、必要に応じて非同期化
-        return await self.run(input, config)
\ No newline at end of file
+            logger.error("BrowserAgent 実行中にエラーが発生しました: %s", e)
+            return "BrowserAgent 実行中にエラーが発生しました。"
\ No newline at end of file
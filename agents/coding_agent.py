@@ -6,25 +6,68 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage
 from agents.base_agent import BaseAgent
 from langchain_core.runnables import RunnableConfig
-from typing import Any, Optional, Literal
+from typing import Any, List, Optional, Literal
+from dataclasses import dataclass, field
 import logging
+import time
+from tools.patch_applier import PatchMetrics, apply_patch, atomic_write
+from tools.streaming_writer import StreamMetrics, StreamStats, StreamingFileWriter, WriteCallback
+from utils.speculation import SpeculationMetrics
+from utils.tokens import count_tokens
+from utils.log import preview
+from utils.workspace import get_work_dir
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CodeStreamResult:
+    """ストリーミング生成の結果"""
+    text: str
+    files: List[str] = field(default_factory=list)        # 書き込みが完了したファイル
+    incomplete: List[str] = field(default_factory=list)   # ブロックが閉じられず破棄したファイル
+    stats: StreamStats = field(default_factory=StreamStats)
+
+
+@dataclass
+class PatchEditResult:
+    """差分モードの結果。error が None なら files に書き込み済み"""
+    text: str
+    files: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    patch_tokens: int = 0
+    full_file_tokens: int = 0
+
+    @property
+    def applied(self) -> bool:
+        return self.error is None
+
+
 class CodingAgent(BaseAgent):
     """
     コード生成・修正に特化した機能を実装するエージェント。
     """
 
-    def __init__(self, llm, tools=None):
-        super().__init__(llm, tools)
+    def __init__(self, llm, tools=None, cache=None):
+        super().__init__(llm, tools, cache)
         self.coding_prompt = ChatPromptTemplate.from_messages([
             ("system", "あなたは有能なコーディングアシスタントです。ユーザーの指示に従ってコードを生成し、ファイルパスとコードを以下の形式で提供してください。\n\nファイルパス: <生成するファイルのパス>\nコード: \n```\n<生成されたコード>\n```"),
             MessagesPlaceholder(variable_name="messages")
         ])
+        self.patch_prompt = ChatPromptTemplate.from_messages([
+            ("system", "あなたは既存のコードを最小限の差分で修正するアシスタントです。ファイル全体は出力せず、変更箇所だけを以下の検索/置換形式で出力してください。SEARCH には既存のコードをインデントも含めてそのまま、置換箇所を一意に特定できる行数だけ書いてください。\n\nファイルパス: <修正するファイルのパス>\n<<<<<<< SEARCH\n<既存のコード>\n=======\n<置き換え後のコード>\n>>>>>>> REPLACE\n\n複数の箇所を修正する場合はブロックを繰り返してください。新規ファイルは SEARCH を空にしてください。unified diff 形式で出力しても構いません。"),
+            MessagesPlaceholder(variable_name="messages")
+        ])
+        self.stream_metrics = StreamMetrics()
+        self.patch_metrics = PatchMetrics()
+        # review_node がレビューと並行して投機的に実行したコーディングの集計
+        self.speculation_metrics = SpeculationMetrics()
 
     def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        logging.info("########################## coding_agent")
-        logging.info(f"CodingAgent - input: {input}")
+        logger.info("########################## coding_agent")
+        logger.debug("CodingAgent - input: %s", preview(input))
         code_gen_messages = self.coding_prompt.format_messages(messages=input)
-        response = self.llm.invoke(code_gen_messages, config)
+        response = self.invoke_llm(code_gen_messages, config)
 
         if not isinstance(response.content, str):
             raise ValueError("Unexpected response type (not a string).")
@@ -34,10 +77,105 @@ class CodingAgent(BaseAgent):
 
     async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
         code_gen_messages = self.coding_prompt.format_messages(messages=input)
-        response = await self.llm.ainvoke(code_gen_messages, config)
+        response = await self.ainvoke_llm(code_gen_messages, config)
 
         if not isinstance(response.content, str):
             raise ValueError("Unexpected response type (not a string).")
 
         # 生成したテキストをそのまま返すのみ
-        return response.content 
\ No newline at end of file
+        return response.content
+
+    def _start_stream(self, default_path: Optional[str], on_write: Optional[WriteCallback],
+                      config: Optional[RunnableConfig]):
+        stats = StreamStats()
+        writer = StreamingFileWriter(default_path, on_write, stats, work_dir=get_work_dir(config))
+
+        def on_chunk(text: str) -> None:
+            stats.on_chunk(text)
+            writer.feed(text)
+
+        return stats, writer, on_chunk
+
+    def _finish_stream(self, response: Any, stats: StreamStats, writer: StreamingFileWriter) -> CodeStreamResult:
+        files = writer.close()
+        stats.finished = time.perf_counter()
+        usage = getattr(response, "usage_metadata", None) or {}
+        if usage.get("output_tokens"):
+            stats.completion_tokens = usage["output_tokens"]
+        self.stream_metrics.record(stats)
+        text = response.content if response is not None else ""
+        if not isinstance(text, str):
+            raise ValueError("Unexpected response type (not a string).")
+        return CodeStreamResult(text=text, files=files, incomplete=writer.incomplete, stats=stats)
+
+    def stream_to_files(self, input: Any, config: Optional[RunnableConfig] = None,
+                        default_path: Optional[str] = None, on_write: Optional[WriteCallback] = None) -> CodeStreamResult:
+        """
+        コードを生成しながら、届いたコードブロックを順次ファイルに書き込む。
+        各ファイルは一時ファイルに書き込み、ブロックが閉じた時点でリネームする。
+        """
+        code_gen_messages = self.coding_prompt.format_messages(messages=input)
+        stats, writer, on_chunk = self._start_stream(default_path, on_write, config)
+        try:
+            response = self.stream_llm(code_gen_messages, on_chunk, config)
+        except BaseException:
+            writer.abort()
+            raise
+        return self._finish_stream(response, stats, writer)
+
+    async def astream_to_files(self, input: Any, config: Optional[RunnableConfig] = None,
+                               default_path: Optional[str] = None, on_write: Optional[WriteCallback] = None) -> CodeStreamResult:
+        """stream_to_files の非同期版"""
+        code_gen_messages = self.coding_prompt.format_messages(messages=input)
+        stats, writer, on_chunk = self._start_stream(default_path, on_write, config)
+        try:
+            response = await self.astream_llm(code_gen_messages, on_chunk, config)
+        except BaseException:
+            writer.abort()
+            raise
+        return self._finish_stream(response, stats, writer)
+
+    def _apply_patch_response(self, response: Any, default_path: Optional[str],
+                              config: Optional[RunnableConfig]) -> PatchEditResult:
+        """
+        差分を適用して書き込む。適用できなければ何も書き込まずに error を返す。
+        config の work_dir が指定されていれば、読み込み・書き込みともその下のファイルを対象にする。
+        """
+        text = response.content
+        if not isinstance(text, str):
+            raise ValueError("Unexpected response type (not a string).")
+        result = apply_patch(text, default_path, work_dir=get_work_dir(config))
+        if not result.ok:
+            self.patch_metrics.record_fallback()
+            return PatchEditResult(text=text, error=result.error)
+
+        for file_path, content in result.files.items():
+            atomic_write(file_path, content)
+        usage = getattr(response, "usage_metadata", None) or {}
+        patch_tokens = usage.get("output_tokens") or count_tokens(text)
+        # 同じ変更をファイル全体の出力で行った場合のトークン数
+        full_file_tokens = sum(
+            count_tokens(f"ファイルパス: {file_path}\nコード: \n```\n{content}```")
+            for file_path, content in result.files.items()
+        )
+        self.patch_metrics.record_applied(patch_tokens, full_file_tokens)
+        return PatchEditResult(
+            text=text, files=list(result.files), patch_tokens=patch_tokens, full_file_tokens=full_file_tokens
+        )
+
+    def run_patch(self, input: Any, config: Optional[RunnableConfig] = None,
+                  default_path: Optional[str] = None) -> PatchEditResult:
+        """
+        変更箇所だけを差分として生成し、既存のファイルに適用する。
+        適用できなかった場合は error を設定して返すので、呼び出し側でファイル全体の生成に切り替える。
+        """
+        patch_messages = self.patch_prompt.format_messages(messages=input)
+        response = self.invoke_llm(patch_messages, config)
+        return self._apply_patch_response(response, default_path, config)
+
+    async def arun_patch(self, input: Any, config: Optional[RunnableConfig] = None,
+                         default_path: Optional[str] = None) -> PatchEditResult:
+        """run_patch の非同期版"""
+        patch_messages = self.patch_prompt.format_messages(messages=input)
+        response = await self.ainvoke_llm(patch_messages, config)
+        return self._apply_patch_response(response, default_path, config)
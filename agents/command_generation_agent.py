@@ -10,14 +10,17 @@ from langchain_core.runnables import RunnableConfig
 from typing import Any, Optional, Literal
 import json
 import logging
+from utils.log import preview
+
+logger = logging.getLogger(__name__)
 
 class CommandGenerationAgent(BaseAgent):
     """
     コマンド生成に特化した機能を実装するエージェント。
     """
 
-    def __init__(self, llm, tools=None):
-        super().__init__(llm, tools)
+    def __init__(self, llm, tools=None, cache=None):
+        super().__init__(llm, tools, cache)
         self.command_generation_prompt = ChatPromptTemplate.from_messages([
             ("system", "あなたは有能なコマンド生成アシスタントです。ユーザーの指示に従って、実行可能なターミナルコマンドを生成し、以下の**厳密なJSON形式**で提供してください。\n\n```json\n{{\"command\": \"生成するコマンド\"}}\n```\n\n**JSONオブジェクトのみを返し、それ以外のテキストは含めないでください。**"),
             MessagesPlaceholder(variable_name="messages")
@@ -25,10 +28,10 @@ class CommandGenerationAgent(BaseAgent):
 
     def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
         command_gen_messages = self.command_generation_prompt.format_messages(messages=input)
-        logging.info(f"CommandGenerationAgent - command_gen_messages: {command_gen_messages}")
-        response = self.llm.invoke(command_gen_messages, config)
-        logging.info("##########################")
-        logging.info(f"CommandGenerationAgent - LLM response: {response.content}")
+        logger.debug("CommandGenerationAgent - command_gen_messages: %s", preview(command_gen_messages))
+        response = self.invoke_llm(command_gen_messages, config)
+        logger.info("##########################")
+        logger.info("CommandGenerationAgent - LLM response: %s", preview(response.content))
 
         if not isinstance(response.content, str):
             raise ValueError("Unexpected response type (not a string).")
@@ -43,7 +46,7 @@ class CommandGenerationAgent(BaseAgent):
         if start_index != -1 and end_index > start_index:
             content = content[start_index:end_index]
         else:
-            logging.error(f"CommandGenerationAgent - JSON形式の文字列が見つかりませんでした: {response.content}")
+            logger.error("CommandGenerationAgent - JSON形式の文字列が見つかりませんでした: %s", preview(response.content))
             return json.dumps({"command": ""})
 
         try:
@@ -51,19 +54,19 @@ class CommandGenerationAgent(BaseAgent):
             if "command" in data:
                 return json.dumps({"command": data["command"]})
             else:
-                logging.error(f"CommandGenerationAgent - 'command' key not found in response: {content}")
+                logger.error("CommandGenerationAgent - 'command' key not found in response: %s", preview(content))
                 return json.dumps({"command": ""})
         except json.JSONDecodeError as e:
-            logging.error(f"CommandGenerationAgent - JSON decoding error: {e}")
-            logging.error(f"Failed to parse: {content}")
+            logger.error("CommandGenerationAgent - JSON decoding error: %s", e)
+            logger.error("Failed to parse: %s", preview(content))
             return json.dumps({"command": ""})
 
     async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
         command_gen_messages = self.command_generation_prompt.format_messages(messages=input)
-        logging.info(f"CommandGenerationAgent - command_gen_messages: {command_gen_messages}")
-        response = await self.llm.ainvoke(command_gen_messages, config)
+        logger.debug("CommandGenerationAgent - command_gen_messages: %s", preview(command_gen_messages))
+        response = await self.ainvoke_llm(command_gen_messages, config)
 
-        logging.info(f"CommandGenerationAgent - LLM response: {response.content}")
+        logger.info("CommandGenerationAgent - LLM response: %s", preview(response.content))
 
         if not isinstance(response.content, str):
             raise ValueError("Unexpected response type (not a string).")
@@ -77,7 +80,7 @@ class CommandGenerationAgent(BaseAgent):
         if start_index != -1 and end_index > start_index:
             content = content[start_index:end_index]
         else:
-            logging.error(f"CommandGenerationAgent - JSON形式の文字列が見つかりませんでした (非同期): {response.content}")
+            logger.error("CommandGenerationAgent - JSON形式の文字列が見つかりませんでした (非同期): %s", preview(response.content))
             return json.dumps({"command": ""})
 
         try:
@@ -85,9 +88,9 @@ class CommandGenerationAgent(BaseAgent):
             if "command" in data:
                 return json.dumps({"command": data["command"]})
             else:
-                logging.error(f"CommandGenerationAgent - 'command' key not found in response: {response.content}")
+                logger.error("CommandGenerationAgent - 'command' key not found in response: %s", preview(response.content))
                 return json.dumps({"command": ""})
         except json.JSONDecodeError as e:
-            logging.error(f"CommandGenerationAgent - JSON decoding error: {e}")
-            logging.error(f"Failed to parse: {response.content}")
+            logger.error("CommandGenerationAgent - JSON decoding error: %s", e)
+            logger.error("Failed to parse: %s", preview(response.content))
             return json.dumps({"command": ""})
\ No newline at end of file
@@ -1,116 +1,170 @@
 from agents.base_agent import BaseAgent
 from langchain_core.runnables import RunnableConfig
-from typing import Any, Optional
+from typing import Any, List, Optional
 import json
 from langchain_core.prompts import ChatPromptTemplate
 import logging
-import aiofiles
+import os
+from tools.code_extractor import ExtractedFile, ExtractionMetrics, extract_files
+from utils.tracing import span
+from utils.log import preview
+from utils.workspace import get_work_dir, resolve_path
+
+logger = logging.getLogger(__name__)
 
 class FileOperationAgent(BaseAgent):
     """
     コーディングエージェントの出力（テキスト形式）を渡すと、
     ファイルパスとコード内容を抽出し、JSON形式で出力するエージェント。
+
+    「ファイルパス: ...」行とコードブロックからローカルで抽出できる場合はLLMを呼ばずに書き込み（ファストパス）、
+    抽出できない場合のみLLMで抽出します。入力は文字列、または {"raw_text": ..., "file_path": ...} の辞書。
     """
 
-    def __init__(self, llm, tools=None):
-        super().__init__(llm, tools)
+    def __init__(self, llm, tools=None, cache=None):
+        super().__init__(llm, tools, cache)
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", "あなたはコーディングエージェントの出力を解析し、ファイルパスとコード内容を抽出するアシスタントです。"),
             ("user", "コーディングエージェントの出力: {raw_text}"),
             ("system", "抽出されたfile_pathとcodeをJSON形式で出力してください。")
         ])
+        self.extraction_metrics = ExtractionMetrics()
+
+    @staticmethod
+    def _split_input(input: Any):
+        """入力から (生テキスト, デフォルトのファイルパス, LLMに渡すテキスト) を取り出す"""
+        if isinstance(input, dict):
+            raw_text = input.get("raw_text", "")
+            default_path = input.get("file_path")
+            return raw_text, default_path, f'{{"file_path": "{default_path}", "code": "{raw_text}"}}'
+        return str(input), None, str(input)
+
+    def _extract_fast(self, raw_text: str, default_path: Optional[str]) -> List[ExtractedFile]:
+        """LLMを使わずに抽出する。抽出できなければ空リスト"""
+        with span("file_operation.extract", "tool") as span_args:
+            files = extract_files(raw_text, default_path)
+            span_args["fast_path"] = bool(files)
+            span_args["files"] = len(files)
+        self.extraction_metrics.record(bool(files))
+        return files
+
+    @staticmethod
+    def _prepare_dir(file_path: str) -> None:
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _write_files(self, files: List[ExtractedFile], work_dir: Optional[str] = None) -> str:
+        """files を書き込む。work_dir 指定時はその下に解決し、外を指すパスは書き込まずに失敗とする"""
+        written = []
+        for extracted in files:
+            try:
+                file_path = resolve_path(work_dir, extracted.file_path)
+                self._prepare_dir(file_path)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(extracted.code)
+            except Exception as e:
+                logger.error("ファイルの書き込みエラー: %s", e)
+                return f"ファイルの書き込みに失敗しました: {e}"
+            written.append(f"{file_path} にコードを書き込みました。")
+        return "\n".join(written)
+
+    async def _awrite_files(self, files: List[ExtractedFile], work_dir: Optional[str] = None) -> str:
+        import aiofiles
+        written = []
+        for extracted in files:
+            try:
+                file_path = resolve_path(work_dir, extracted.file_path)
+                self._prepare_dir(file_path)
+                async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
+                    await f.write(extracted.code)
+            except Exception as e:
+                logger.error("ファイルの書き込みエラー (非同期): %s", e)
+                return f"ファイルの書き込みに失敗しました (非同期): {e}"
+            written.append(f"{file_path} にコードを書き込みました (非同期)。")
+        return "\n".join(written)
 
     def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        import logging
-        logging.basicConfig(level=logging.DEBUG)
-        # logging.info(f"FileOperationAgent run開始: input={input}")
-        raw_text = str(input)
-        messages = self.prompt.format_messages(raw_text=raw_text)
-        response = self.llm.invoke(messages, config)
-        # logging.info(f"LLM response content: {response.content}")
+        # logger.info("FileOperationAgent run開始: input=%s", preview(input))
+        raw_text, default_path, llm_text = self._split_input(input)
+        files = self._extract_fast(raw_text, default_path)
+        if files:
+            return self._write_files(files, get_work_dir(config))
+
+        messages = self.prompt.format_messages(raw_text=llm_text)
+        response = self.invoke_llm(messages, config)
+        # logger.info("LLM response content: %s", preview(response.content))
 
         try:
-            # logging.info(f"JSONパース前: {response.content}")  # JSONパース前の内容を出力
+            # logger.info("JSONパース前: %s", preview(response.content))  # JSONパース前の内容を出力
             # JSON形式の開始と終了のインデックスを見つける
             start_index = response.content.find('{')
             end_index = response.content.rfind('}') + 1
 
             if start_index != -1 and end_index > start_index:
                 json_string = response.content[start_index:end_index]
-                # logging.info(f"抽出されたJSON文字列: {json_string}")
+                # logger.info("抽出されたJSON文字列: %s", preview(json_string))
                 json_output = json.loads(json_string)
             else:
-                logging.error(f"JSON形式の文字列が見つかりませんでした: {response.content}")
+                logger.error("JSON形式の文字列が見つかりませんでした: %s", preview(response.content))
                 return "出力テキストからJSON形式の文字列を抽出できませんでした。"
 
             file_path = json_output.get("file_path")
             code_content = json_output.get("code")
-            logging.info(f"抽出されたfile_path: {file_path}")
-            # logging.info(f"抽出されたcode_content: {code_content}")
+            logger.info("抽出されたfile_path: %s", file_path)
+            # logger.info("抽出されたcode_content: %s", code_content)
 
             if not file_path or not code_content:
                 return "JSON出力からファイルパスまたはコードの内容を抽出できませんでした。"
 
             # ファイル書き込み処理
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(code_content)
-                result = f"{file_path} にコードを書き込みました。"
-                logging.info(f"FileOperationAgent run終了: result={result}")
-                return result
-            except Exception as e:
-                logging.error(f"ファイルの書き込みエラー: {e}")
-                return f"ファイルの書き込みに失敗しました: {e}"
+            result = self._write_files([ExtractedFile(file_path, code_content)], get_work_dir(config))
+            logger.info("FileOperationAgent run終了: result=%s", preview(result))
+            return result
 
         except json.JSONDecodeError as e:
-            logging.error(f"JSONパースエラー: {e}")  # エラー内容を出力
-            logging.error(f"パース失敗した文字列: {response.content}")  # パースに失敗した文字列を出力
+            logger.error("JSONパースエラー: %s", e)  # エラー内容を出力
+            logger.error("パース失敗した文字列: %s", preview(response.content))  # パースに失敗した文字列を出力
             return "出力テキストがJSON形式ではありませんでした。"
 
     async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        import logging
-        logging.basicConfig(level=logging.INFO)
-        # logging.info(f"FileOperationAgent arun開始: input={input}")
-        raw_text = str(input)
-        messages = self.prompt.format_messages(raw_text=raw_text)
-        response = await self.llm.ainvoke(messages, config)
-        # logging.info(f"LLM response content: {response.content}")
+        # logger.info("FileOperationAgent arun開始: input=%s", preview(input))
+        raw_text, default_path, llm_text = self._split_input(input)
+        files = self._extract_fast(raw_text, default_path)
+        if files:
+            return await self._awrite_files(files, get_work_dir(config))
+
+        messages = self.prompt.format_messages(raw_text=llm_text)
+        response = await self.ainvoke_llm(messages, config)
+        # logger.info("LLM response content: %s", preview(response.content))
 
         try:
-            # logging.info(f"JSONパース前 (非同期): {response.content}")  # JSONパース前の内容を出力
+            # logger.info("JSONパース前 (非同期): %s", preview(response.content))  # JSONパース前の内容を出力
             # JSON形式の開始と終了のインデックスを見つける
             start_index = response.content.find('{')
             end_index = response.content.rfind('}') + 1
 
             if start_index != -1 and end_index > start_index:
                 json_string = response.content[start_index:end_index]
-                # logging.info(f"抽出されたJSON文字列 (非同期): {json_string}")
+                # logger.info("抽出されたJSON文字列 (非同期): %s", preview(json_string))
                 json_output = json.loads(json_string)
             else:
-                logging.error(f"JSON形式の文字列が見つかりませんでした (非同期): {response.content}")
+                logger.error("JSON形式の文字列が見つかりませんでした (非同期): %s", preview(response.content))
                 return "出力テキストからJSON形式の文字列を抽出できませんでした。"
 
             file_path = json_output.get("file_path")
             code_content = json_output.get("code")
 
             if not file_path or not code_content:
-                logging.info("FileOperationAgent: JSON出力からファイルパスまたはコードの内容を抽出できませんでした。")
+                logger.info("FileOperationAgent: JSON出力からファイルパスまたはコードの内容を抽出できませんでした。")
                 return "JSON出力からファイルパスまたはコードの内容を抽出できませんでした。"
 
             # ファイル書き込み処理 (非同期)
-            try:
-                async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-                    await f.write(code_content)
-                result = f"{file_path} にコードを書き込みました (非同期)。"
-                # logging.info(f"FileOperationAgent arun終了 (非同期): result={result}")
-                return result
-            except Exception as e:
-                logging.error(f"ファイルの書き込みエラー (非同期): {e}")
-                return f"ファイルの書き込みに失敗しました (非同期): {e}"
+            return await self._awrite_files([ExtractedFile(file_path, code_content)], get_work_dir(config))
 
         except json.JSONDecodeError as e:
-            logging.error(f"JSONパースエラー (非同期): {e}")  # エラー内容を出力
-            logging.error(f"パース失敗した文字列 (非同期): {response.content}")  # パースに失敗した文字列を出力
+            logger.error("JSONパースエラー (非同期): %s", e)  # エラー内容を出力
+            logger.error("パース失敗した文字列 (非同期): %s", preview(response.content))  # パースに失敗した文字列を出力
             return "出力テキストがJSON形式ではありませんでした。"
 
     def _process_file_operation(self, raw_text: str) -> str:
@@ -13,8 +13,8 @@ class PlanningAgent(BaseAgent):
     タスクの理解と要件定義に特化した機能を実装するエージェント。
     """
 
-    def __init__(self, llm, tools=None):
-        super().__init__(llm, tools)
+    def __init__(self, llm, tools=None, cache=None):
+        super().__init__(llm, tools, cache)
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", "You are a helpful planning assistant. Please analyze the task and create a requirement definition."),
             MessagesPlaceholder(variable_name="messages")
@@ -22,10 +22,10 @@ class PlanningAgent(BaseAgent):
 
     def run(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
         messages = self.prompt.format_messages(messages=input)
-        response = self.llm.invoke(messages, config)
+        response = self.invoke_llm(messages, config)
         return response
 
     async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
         messages = self.prompt.format_messages(messages=input)
-        response = await self.llm.ainvoke(messages, config)
+        response = await self.ainvoke_llm(messages, config)
         return response 
\ No newline at end of file
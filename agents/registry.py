@@ -0,0 +1,107 @@
+"""
+AgentRegistry: エージェントを初回利用時に生成するレジストリ
+ファクトリだけを登録しておき、ノードが実際に必要としたタイミングで生成・キャッシュします。
+browser_use や langchain_openai など重い依存のimportもファクトリ内に閉じ込めることで、
+ワークフローの起動を速くし、実行されないノードのためのリソース確保を避けます。
+"""
+
+import importlib
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+Factory = Callable[["AgentRegistry"], Any]
+
+
+def import_object(target: str) -> Any:
+    """'package.module:Name' 形式の文字列からオブジェクトをimportする"""
+    module_name, _, attr = target.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attr) if attr else module
+
+
+class AgentRegistry:
+    """
+    名前とファクトリの対応を保持し、get() の初回呼び出し時にインスタンスを生成する。
+    ファクトリはレジストリ自身を引数に受け取るため、他の登録済みオブジェクト（LLMなど）を参照できる。
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Factory] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Factory) -> None:
+        """ファクトリを登録する。既に生成済みのインスタンスは破棄される"""
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def register_class(self, name: str, target: str, *args: Any, **kwargs: Any) -> None:
+        """
+        'package.module:Class' 形式でクラスを登録する。モジュールは初回利用時にimportされる。
+        args / kwargs に Ref を渡すと、生成時に他の登録済みオブジェクトに解決される。
+        """
+        def factory(registry: "AgentRegistry") -> Any:
+            cls = import_object(target)
+            resolved_args = [registry._resolve(a) for a in args]
+            resolved_kwargs = {k: registry._resolve(v) for k, v in kwargs.items()}
+            return cls(*resolved_args, **resolved_kwargs)
+        self.register(name, factory)
+
+    def register_instance(self, name: str, instance: Any) -> None:
+        """生成済みのインスタンスをそのまま登録する"""
+        with self._lock:
+            self._factories[name] = lambda registry: instance
+            self._instances[name] = instance
+
+    def _resolve(self, value: Any) -> Any:
+        return self.get(value.name) if isinstance(value, Ref) else value
+
+    def get(self, name: str) -> Any:
+        """インスタンスを取得する。未生成であればファクトリを呼び出して生成する"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            factory = self._factories.get(name)
+            if factory is None:
+                raise KeyError(f"'{name}' is not registered")
+            instance = factory(self)
+            self._instances[name] = instance
+            return instance
+
+    def is_loaded(self, name: str) -> bool:
+        """インスタンスが既に生成されているかを返す"""
+        return name in self._instances
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factories
+
+
+class Ref:
+    """register_class の引数で、他の登録済みオブジェクトを参照するためのマーカー"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"Ref({self.name!r})"
+
+
+def resolve_agent(config: RunnableConfig, name: str) -> Any:
+    """
+    config からエージェント（またはツール）を取得する。
+    configurable に直接渡されていればそれを使い、なければ agent_registry から遅延生成する。
+    """
+    configurable = config.get("configurable", {})
+    agent = configurable.get(name)
+    if agent is not None:
+        return agent
+    registry: Optional[AgentRegistry] = configurable.get("agent_registry")
+    if registry is not None and name in registry:
+        return registry.get(name)
+    raise ValueError(f"{name} is not configured")
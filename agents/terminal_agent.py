@@ -1,72 +1,126 @@
 import logging
-import subprocess
 import json
 from typing import Any, Optional
 from pydantic import BaseModel, ValidationError
 from langchain_core.runnables import RunnableConfig
 from agents.base_agent import BaseAgent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-import asyncio
+from utils.tracing import span
+from utils.log import preview
+from utils.loop_bridge import run_sync
+from utils.workspace import get_work_dir
+from tools.process_engine import ProcessEngine, OutputCallback, default_engine
+from tools.service_manager import ServiceManager, ReadinessProbe, default_service_manager, detect_service, service_name
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+logger = logging.getLogger(__name__)
 
 class CommandResult(BaseModel):
     command: str
 
 class TerminalTool:
-    def __init__(self):
+    def __init__(self, engine: Optional[ProcessEngine] = None, timeout: Optional[float] = None, idle_timeout: Optional[float] = None):
         self.name = "terminal"
+        self.engine = engine or default_engine
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
 
-    def run(self, command: str) -> str:
-        logging.info(f"Executing command: {command}")
-        try:
-            logging.info("###################################")
-            logging.info(f"subprocess.run args: command={command}, shell=True, capture_output=True, text=True, check=True")
-            logging.info("###################################")
-            process = subprocess.run(
+    def run(self, command: str, cwd: Optional[str] = None) -> str:
+        """コマンドを同期的に実行する（常駐するイベントループ上で ProcessEngine を使用）"""
+        return run_sync(self.arun(command, cwd=cwd))
+
+    async def arun(self, command: str, on_output: Optional[OutputCallback] = None, cwd: Optional[str] = None) -> str:
+        """
+        コマンドを非同期に実行する（cwd 指定時はそのディレクトリで実行する）。
+        出力は逐次読み取られ、後続ノードには先頭と末尾のみが渡される。
+        """
+        logger.info("Executing command: %s", preview(command))
+        with span("subprocess", "subprocess", command=command) as span_args:
+            result = await self.engine.run(
                 command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=True
+                timeout=self.timeout,
+                idle_timeout=self.idle_timeout,
+                on_output=on_output,
+                cwd=cwd,
             )
-            logging.info(f"Command output: {process.stdout}")
-            return process.stdout
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Command error: {e.stderr}")
-            return e.stderr
+            span_args["returncode"] = result.returncode
+            span_args["stdout_bytes"] = result.stdout_bytes
+            span_args["stderr_bytes"] = result.stderr_bytes
+            if result.timed_out:
+                span_args["timed_out"] = result.timed_out
+                logger.error("Command timed out (%s): %s", result.timed_out, preview(command))
+                return f"{result.stdout}{result.stderr}\n[タイムアウト({result.timed_out})によりコマンドを終了しました]"
+            if result.returncode != 0:
+                logger.error("Command error: %s", preview(result.stderr))
+                return result.stderr
+            logger.info("Command output: %s", preview(result.stdout))
+            return result.stdout
 
 class TerminalAgent(BaseAgent):
-    def __init__(self, llm=None, tools=None):
+    def __init__(self, llm=None, tools=None, service_manager: Optional[ServiceManager] = None):
         super().__init__(llm, tools)
+        self.service_manager = service_manager or default_service_manager
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", "あなたはターミナルコマンドを実行するエージェントです。ユーザーの指示に従って、適切なターミナルコマンドを生成し、以下のJSON形式で出力してください。\n\n```json\n{\"command\": \"生成するコマンド\"}\n```"),
             MessagesPlaceholder(variable_name="messages")
         ])
 
     def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        logging.info("TerminalAgent.run開始")
-        # logging.debug(f"Input: {input}")
+        logger.info("TerminalAgent.run開始")
+        # logger.debug("Input: %s", preview(input))
 
         if isinstance(input, str):
-            logging.info(f"直接実行するコマンド: {input}")
+            logger.info("直接実行するコマンド: %s", preview(input))
+            cwd = get_work_dir(config)
+            probe = detect_service(input, cwd)
+            if probe is not None:
+                return run_sync(self.start_service(input, probe, cwd))
             terminal_tool = next((t for t in (self.tools or []) if t.name == "terminal"), None)
             if terminal_tool:
-                logging.debug("TerminalTool.run を呼び出します。")
-                return terminal_tool.run(input)  # ここでコマンドが実行される
+                logger.debug("TerminalTool.run を呼び出します。")
+                return terminal_tool.run(input, cwd=cwd)  # ここでコマンドが実行される
             else:
-                logging.warning("TerminalToolが見つかりませんでした。コマンド実行スキップ。")
+                logger.warning("TerminalToolが見つかりませんでした。コマンド実行スキップ。")
                 return ""
         else:
-            logging.info("###################################")
-            logging.info(f"input: {input}")
-            logging.info("###################################")
-            logging.error("TerminalAgentは文字列のコマンド入力を期待しています。")
+            logger.info("input: %s", preview(input))
+            logger.error("TerminalAgentは文字列のコマンド入力を期待しています。")
             return ""
 
     async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
-        logging.info("TerminalAgent.arun開始")
-        return await asyncio.to_thread(self.run, input, config)
\ No newline at end of file
+        logger.info("TerminalAgent.arun開始")
+
+        if not isinstance(input, str):
+            logger.error("TerminalAgentは文字列のコマンド入力を期待しています。")
+            return ""
+
+        cwd = get_work_dir(config)
+        probe = detect_service(input, cwd)
+        if probe is not None:
+            return await self.start_service(input, probe, cwd)
+
+        terminal_tool = next((t for t in (self.tools or []) if t.name == "terminal"), None)
+        if terminal_tool is None:
+            logger.warning("TerminalToolが見つかりませんでした。コマンド実行スキップ。")
+            return ""
+        return await terminal_tool.arun(input, cwd=cwd)
+
+    async def start_service(self, command: str, probe: ReadinessProbe, cwd: Optional[str] = None) -> str:
+        """
+        サーバーなど終了しないコマンドをバックグラウンドで起動し、準備完了を待って結果を返す。
+        cwd 指定時は名前に作業ディレクトリを含め、別のタスクのサービスを再利用しないようにする。
+        """
+        name = service_name(command)
+        if cwd:
+            name = f"{name}@{cwd}"
+        with span("service.start", "subprocess", command=command, service=name, port=probe.port) as span_args:
+            service = await self.service_manager.start(name, command, probe, cwd=cwd)
+            span_args["ready"] = service.ready
+        if service.ready:
+            return (
+                f"サービス '{name}' をバックグラウンドで起動しました ({probe.url})。\n"
+                f"{service.logs(tail=20)}"
+            )
+        return (
+            f"サービス '{name}' の起動を確認できませんでした。\n"
+            f"{service.logs(tail=50)}"
+        )
\ No newline at end of file
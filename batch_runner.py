@@ -0,0 +1,302 @@
+"""
+バッチ実行: JSONLファイルのタスクをワークフローで並列に実行する
+各行は {"id": "...", "task": "..."} 形式（id は省略可）。
+graph.astream で最大 workers 件を同時に実行し、完了したものから結果をJSONLで書き出します。
+
+実行例:
+    python batch_runner.py tasks.jsonl --output results.jsonl --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage
+
+from utils.stats import latency_summary
+
+# 結果に含める AgentState のフィールド（messages のような大きな値は含めない）
+RESULT_FIELDS = [
+    "target_file_path",
+    "requirements",
+    "review_result",
+    "file_operation_result",
+    "generated_command",
+    "terminal_command",
+    "browser_result",
+    "budget_exhausted",
+]
+
+
+@dataclass
+class BatchTask:
+    id: str
+    task: str
+
+
+@dataclass
+class BatchReport:
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        ok = [r for r in self.results if r["status"] == "ok"]
+        return {
+            "total": len(self.results),
+            "ok": len(ok),
+            "failed": len(self.results) - len(ok),
+            "elapsed": self.elapsed,
+            "throughput": len(self.results) / self.elapsed if self.elapsed else 0.0,
+            "latency": latency_summary([r["elapsed"] for r in self.results]),
+        }
+
+
+def load_tasks(path: str) -> List[BatchTask]:
+    """JSONLファイルからタスクを読み込む"""
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            tasks.append(BatchTask(id=str(data.get("id", line_no)), task=data["task"]))
+    return tasks
+
+
+def isolated_config(base_config: Dict[str, Any], task: BatchTask, work_root: Optional[str] = None) -> Dict[str, Any]:
+    """
+    タスクごとに独立したconfigを作成する（configurable は浅いコピー、run_id / thread_id を付与）。
+    run_budget はタスクごとに未使用の予算に置き換える。
+    work_root 指定時はその下にタスクごとの作業ディレクトリ（work_dir）を作り、target_file_path を
+    その中に置く。ファイルの書き込み・コマンド・サービスは work_dir で実行され、タスクどうしで衝突しない。
+    """
+    run_id = str(uuid.uuid4())
+    configurable = dict(base_config.get("configurable", {}))
+    configurable.update({"thread_id": run_id, "batch_task_id": task.id})
+    if configurable.get("run_budget") is not None:
+        configurable["run_budget"] = configurable["run_budget"].fresh()
+    if work_root is not None:
+        safe_id = re.sub(r"[^\w.-]", "_", task.id)
+        work_dir = os.path.abspath(os.path.join(work_root, f"{safe_id}-{run_id[:8]}"))
+        os.makedirs(work_dir, exist_ok=True)
+        configurable["work_dir"] = work_dir
+        configurable["target_file_path"] = os.path.join(work_dir, configurable.get("target_file_path", "generate/target.py"))
+    return {
+        **{k: v for k, v in base_config.items() if k != "configurable"},
+        "configurable": configurable,
+        "run_id": run_id,
+        "run_name": f"batch:{task.id}",
+    }
+
+
+def _to_jsonable(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    return str(getattr(value, "content", value))
+
+
+async def run_task(graph, task: BatchTask, config: Dict[str, Any]) -> Dict[str, Any]:
+    """1件のタスクを graph.astream で実行し、結果を返す"""
+    inputs = {"messages": [HumanMessage(content=task.task)]}
+    final: Dict[str, Any] = {}
+    nodes: List[str] = []
+    start = time.perf_counter()
+    try:
+        async for output in graph.astream(inputs, config, stream_mode="updates"):
+            for node_name, update in output.items():
+                nodes.append(node_name)
+                for key in RESULT_FIELDS:
+                    if isinstance(update, dict) and key in update:
+                        final[key] = _to_jsonable(update[key])
+        status, error = "ok", None
+    except Exception as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+    budget = config.get("configurable", {}).get("run_budget")
+    return {
+        "id": task.id,
+        "run_id": config.get("configurable", {}).get("thread_id"),
+        "status": status,
+        "error": error,
+        "elapsed": time.perf_counter() - start,
+        "nodes": nodes,
+        "work_dir": config.get("configurable", {}).get("work_dir"),
+        "result": final,
+        "budget": budget.report() if budget is not None else None,
+    }
+
+
+async def run_batch(
+    graph,
+    tasks: List[BatchTask],
+    base_config: Dict[str, Any],
+    workers: int = 4,
+    on_result: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+    work_root: Optional[str] = None,
+) -> BatchReport:
+    """
+    タスクを最大 workers 件まで並列に実行する。
+    on_result(result, done, total) は各タスクの完了ごとに呼ばれる。
+    work_root はタスクごとの作業ディレクトリを作る場所（isolated_config を参照）。
+    """
+    semaphore = asyncio.Semaphore(workers)
+    report = BatchReport()
+    done = 0
+
+    async def worker(task: BatchTask) -> None:
+        nonlocal done
+        async with semaphore:
+            result = await run_task(graph, task, isolated_config(base_config, task, work_root))
+        report.results.append(result)
+        done += 1
+        if on_result is not None:
+            on_result(result, done, len(tasks))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(task) for task in tasks))
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    latency = summary["latency"]
+    print(
+        f"total={summary['total']} ok={summary['ok']} failed={summary['failed']} "
+        f"elapsed={summary['elapsed']:.2f}s throughput={summary['throughput']:.2f} tasks/s",
+        file=sys.stderr,
+    )
+    print(
+        f"latency mean={latency['mean']:.2f}s p50={latency['p50']:.2f}s "
+        f"p95={latency['p95']:.2f}s max={latency['max']:.2f}s",
+        file=sys.stderr,
+    )
+
+
+def print_router_stats(stats: Dict[str, Dict[str, Any]]) -> None:
+    for name, model in stats.items():
+        latency = model["latency"]
+        unhealthy = f" unhealthy=({model['unhealthy']})" if model["unhealthy"] else ""
+        print(
+            f"model {name}: calls={model['calls']} errors={model['errors']} "
+            f"p50={latency['p50']:.2f}s p95={latency['p95']:.2f}s{unhealthy}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run workflow tasks from a JSONL file concurrently")
+    parser.add_argument("input", help="タスクのJSONLファイル")
+    parser.add_argument("--output", default="results.jsonl", help="結果を書き出すJSONLファイル")
+    parser.add_argument("--workers", type=int, default=4, help="同時に実行するタスク数")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--small-model", default=None, help="ファイル操作・コマンド生成に使う小さいモデル（--model とフェイルオーバーし合う）")
+    parser.add_argument("--max-p95", type=float, default=None, help="p95 レイテンシ（秒）がこれを超えたモデルを一時的に避ける")
+    parser.add_argument("--no-cache", action="store_true", help="LLM応答キャッシュを使わない")
+    parser.add_argument("--max-llm-calls", type=int, default=None, help="1タスクあたりのLLM呼び出し回数の上限")
+    parser.add_argument("--max-tokens", type=int, default=None, help="1タスクあたりのプロンプト+出力トークン数の上限")
+    parser.add_argument("--deadline", type=float, default=None, help="1タスクあたりの制限時間（秒）")
+    parser.add_argument("--record", default=None, help="LLMとのやりとりを記録するカセットファイル（.gz で圧縮）")
+    parser.add_argument("--replay", default=None, help="LLMの代わりに再生するカセットファイル")
+    parser.add_argument("--log-level", default="WARNING", help="ログレベル（JSON形式で標準エラーに出力）")
+    parser.add_argument("--parallel", action="store_true", help="依存のないノードを同時に実行し、短縮できた時間を表示する")
+    parser.add_argument("--speculative", action="store_true", help="review と並行してコーディングを投機的に実行する")
+    parser.add_argument("--blobs", default=None, help="大きな状態の値を保存するディレクトリ（\"memory\" ならプロセス内）")
+    parser.add_argument("--work-root", default="batch_work", help="タスクごとの作業ディレクトリを作るディレクトリ")
+    parser.add_argument("--checkpoints", default=None, help="各タスクの実行状態を保存するSQLiteファイル（run_id で resume できる）")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from agent_config import build_registry, model_routing, openai_llm_factory, recording_llm_factory, replay_llm_factory
+    from agents.terminal_agent import TerminalTool
+    from llm.cache import DiskCache, LLMCache
+    from tools.file_read_tool import FileReadTool
+    from utils.blob_store import DiskBlobStore, MemoryBlobStore
+    from utils.budget import RunBudget
+    from utils.checkpointer import SqliteCheckpointer
+    from utils.context_manager import ContextManager
+    from utils.log import configure_logging
+    from workflow import WORKFLOW_DEPENDENCIES, build_workflow
+
+    load_dotenv()
+    configure_logging(args.log_level)
+    file_read_tool = FileReadTool()
+    tools = [file_read_tool, TerminalTool()]
+    llm_cache = None if args.no_cache else LLMCache(disk=DiskCache(".cache/llm_cache.sqlite3"))
+    if args.replay:
+        llm_factory = replay_llm_factory(args.replay)
+    else:
+        llm_factory = openai_llm_factory(os.getenv("OPENAI_API_KEY"), model=args.model)
+        if args.record:
+            llm_factory = recording_llm_factory(llm_factory, args.record)
+    routing = None
+    if args.small_model and not args.replay:
+        small_factory = openai_llm_factory(os.getenv("OPENAI_API_KEY"), model=args.small_model)
+        if args.record:
+            small_factory = recording_llm_factory(small_factory, args.record)
+        routing = model_routing(llm_factory, small_factory, max_p95=args.max_p95)
+    registry = build_registry(llm_factory, tools, llm_cache, routing=routing)
+    base_config = {
+        "configurable": {
+            "agent_registry": registry,
+            "file_read_tool": file_read_tool,
+            "context_manager": ContextManager(),
+            "speculative_coding": args.speculative,
+        }
+    }
+    if args.blobs:
+        # 状態・チェックポイントには参照だけを入れ、内容は実行をまたいで一度だけ保存する
+        base_config["configurable"]["blob_store"] = MemoryBlobStore() if args.blobs == "memory" else DiskBlobStore(args.blobs)
+    if any(v is not None for v in (args.max_llm_calls, args.max_tokens, args.deadline)):
+        base_config["configurable"]["run_budget"] = RunBudget(args.max_llm_calls, args.max_tokens, args.deadline)
+    elif args.parallel:
+        # 上限は設けず、クリティカルパスを求めるためにノードごとの所要時間だけを記録する
+        base_config["configurable"]["run_budget"] = RunBudget()
+
+    tasks = load_tasks(args.input)
+    checkpointer = SqliteCheckpointer(args.checkpoints) if args.checkpoints else None
+    graph = build_workflow(checkpointer=checkpointer, parallel=args.parallel)
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        def on_result(result: Dict[str, Any], done: int, total: int) -> None:
+            if result["budget"] is not None:
+                durations = {name: stats["elapsed"] for name, stats in result["budget"]["nodes"].items()}
+                result["schedule"] = WORKFLOW_DEPENDENCIES.schedule_report(durations, result["elapsed"])
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"[{done}/{total}] {result['id']} {result['status']} {result['elapsed']:.2f}s", file=sys.stderr)
+
+        report = asyncio.run(run_batch(graph, tasks, base_config, args.workers, on_result, args.work_root))
+
+    print_summary(report.summary())
+    schedules = [r["schedule"] for r in report.results if "schedule" in r]
+    if args.parallel and schedules:
+        print(
+            f"schedule sequential={sum(s['sequential'] for s in schedules) / len(schedules):.2f}s "
+            f"critical_path={sum(s['critical_path'] for s in schedules) / len(schedules):.2f}s "
+            f"saved={sum(s['saved'] for s in schedules) / len(schedules):.2f}s per task",
+            file=sys.stderr,
+        )
+    if args.speculative:
+        speculation = registry.get("coding_agent").speculation_metrics.stats()
+        print(
+            f"speculation hits={speculation['hits']} misses={speculation['misses']} failures={speculation['failures']} "
+            f"hit_rate={speculation['hit_rate']:.1%} saved={speculation['saved']:.2f}s wasted={speculation['wasted']:.2f}s",
+            file=sys.stderr,
+        )
+    if routing is not None:
+        print_router_stats(registry.get("model_router").stats())
+    if checkpointer is not None:
+        print(f"checkpoint writes: {checkpointer.metrics.stats()['put']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
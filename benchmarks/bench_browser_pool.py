@@ -0,0 +1,95 @@
+"""
+BrowserPool の計測（ローカルの静的HTTPサーバーを使用）
+一時ディレクトリを http.server で配信し、プールから借りたコンテキストでページを開いて
+起動コスト込みの初回貸し出しと、ウォーム状態での貸し出しのレイテンシを比較します。
+状態がリセットされていること（前回の localStorage が残っていないこと）も確認します。
+
+実行例（リポジトリのルートで）:
+    python -m benchmarks.bench_browser_pool --size 2 --leases 20 --max-uses 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from tools.browser_pool import BrowserPool
+from tools.service_manager import ReadinessProbe, ServiceManager
+
+INDEX_HTML = """<!doctype html>
+<html><head><title>bench</title></head>
+<body><script>
+document.body.dataset.previous = localStorage.getItem("visited") || "";
+localStorage.setItem("visited", "1");
+</script></body></html>
+"""
+
+
+async def lease_and_visit(pool: BrowserPool, url: str) -> dict:
+    start = time.perf_counter()
+    async with pool.lease() as lease:
+        page = await lease.context.get_current_page()
+        await page.goto(url)
+        previous = await page.evaluate("document.body.dataset.previous")
+    return {"elapsed": time.perf_counter() - start, "leaked_state": bool(previous)}
+
+
+async def run(args) -> None:
+    root = tempfile.mkdtemp(prefix="bench_browser_pool_")
+    with open(os.path.join(root, "index.html"), "w", encoding="utf-8") as f:
+        f.write(INDEX_HTML)
+
+    services = ServiceManager()
+    service = await services.start(
+        "static", f"python -m http.server {args.port} --bind 127.0.0.1",
+        ReadinessProbe(port=args.port, http_path="/index.html"), cwd=root,
+    )
+    if not service.ready:
+        raise RuntimeError(f"static server did not become ready:\n{service.logs()}")
+    url = f"http://127.0.0.1:{args.port}/index.html"
+
+    pool = BrowserPool(size=args.size, max_uses=args.max_uses, max_memory_mb=args.max_memory_mb)
+    try:
+        cold = await lease_and_visit(pool, url)
+        warm_start = time.perf_counter()
+        await pool.warm()
+        warm_time = time.perf_counter() - warm_start
+
+        semaphore = asyncio.Semaphore(args.size)
+
+        async def worker():
+            async with semaphore:
+                return await lease_and_visit(pool, url)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(worker() for _ in range(args.leases)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await pool.close()
+        services.stop_all()
+
+    latencies = [r["elapsed"] for r in results]
+    print(f"cold lease (includes Chromium launch): {cold['elapsed'] * 1000:.1f}ms")
+    print(f"warm() for remaining slots: {warm_time * 1000:.1f}ms")
+    print(
+        f"warm leases: n={len(latencies)} mean={statistics.mean(latencies) * 1000:.1f}ms "
+        f"max={max(latencies) * 1000:.1f}ms throughput={len(latencies) / elapsed:.1f}/s"
+    )
+    print(f"state leaked between leases: {any(r['leaked_state'] for r in results + [cold])}")
+    print(f"pool stats: {pool.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BrowserPool benchmark against a local static server")
+    parser.add_argument("--size", type=int, default=2)
+    parser.add_argument("--leases", type=int, default=20)
+    parser.add_argument("--max-uses", type=int, default=10)
+    parser.add_argument("--max-memory-mb", type=float, default=None)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
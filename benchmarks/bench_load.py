@@ -0,0 +1,184 @@
+"""
+負荷試験: OpenAI互換のモックサーバー（llm.mock_server）に対して多数のワークフローを並列に実行する
+ChatOpenAI を base_url でモックサーバーに向け、batch_runner.run_batch で tasks 件を workers 並列で実行し、
+E2Eのスループットとレイテンシ、サーバー側で観測したリクエスト数・429・エラー・同時実行数・TCP接続数を表示します。
+--base-url を省略すると、同じプロセス内の別スレッドでモックサーバーを起動します。
+--gateway を指定すると、エージェントは LLMGateway（流量制限・リトライ・相乗り・ヘッジ）を経由して呼び出し、
+--pool を指定すると keep-alive の共有コネクションプールを使います。
+--routing を指定すると、ファイル操作・コマンド生成は小さいモデル（mock-gpt-mini）に振り分け、
+--large-latency / --small-latency でモデルごとの応答時間を変えて、p95 によるフェイルオーバーを確認できます。
+
+実行例（リポジトリのルートで）:
+    python -m benchmarks.bench_load --tasks 200 --workers 32 --latency lognormal:0.2:0.4 --rate-limit-rate 0.05
+    python -m benchmarks.bench_load --tasks 200 --workers 32 --rpm 600 --gateway --gateway-rpm 600 --pool --hedge-after 1.0
+    python -m benchmarks.bench_load --tasks 100 --workers 16 --routing --small-latency lognormal:1.0:0.3 --max-p95 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+
+from agent_config import build_registry, model_routing, openai_llm_factory
+from agents.terminal_agent import TerminalTool
+from batch_runner import BatchTask, print_router_stats, print_summary, run_batch
+from benchmarks.bench_workflow import OfflineBrowserAgent, prepare_workspace
+from llm.gateway import shared_http_clients
+from llm.mock_server import LatencyDistribution, MockServerConfig, create_app
+from tools.file_read_tool import FileReadTool
+from utils.log import configure_logging
+from workflow import build_workflow
+
+TASK = "テキストファイルexample.txtの中で、頻出する単語の上位3位までのランキングを作成する。"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock_server(config: MockServerConfig) -> str:
+    """モックサーバーをデーモンスレッドで起動し、base_url を返す"""
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="mock-openai-server", daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("mock server did not start")
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def server_stats(base_url: str) -> Optional[Dict[str, Any]]:
+    try:
+        with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of build_workflow() against a mock OpenAI server")
+    parser.add_argument("--tasks", type=int, default=100, help="実行するワークフローの数")
+    parser.add_argument("--workers", type=int, default=16, help="同時に実行するワークフローの数")
+    parser.add_argument("--base-url", default=None, help="既に起動しているモックサーバー（省略時はプロセス内で起動）")
+    parser.add_argument("--latency", default="fixed:0.05", help="応答までの時間の分布（例: lognormal:0.2:0.4）")
+    parser.add_argument("--token-latency", default="fixed:0", help="ストリーミングの断片ごとの間隔の分布")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None, help="モックサーバーの1分あたりのリクエスト数の上限")
+    parser.add_argument("--max-retries", type=int, default=2, help="リトライ回数（429・5xx）。--gateway 時はゲートウェイが行う")
+    parser.add_argument("--gateway", action="store_true", help="LLMGateway を経由して呼び出す")
+    parser.add_argument("--gateway-rpm", type=float, default=None, help="ゲートウェイの1分あたりのリクエスト数の上限")
+    parser.add_argument("--gateway-tpm", type=float, default=None, help="ゲートウェイの1分あたりのトークン数の上限")
+    parser.add_argument("--hedge-after", type=float, default=None, help="この秒数を超えた呼び出しにヘッジを送る")
+    parser.add_argument("--no-coalesce", action="store_true", help="同一リクエストの相乗りを無効にする")
+    parser.add_argument("--pool", action="store_true", help="keep-alive の共有コネクションプールを使う")
+    parser.add_argument("--routing", action="store_true", help="エージェントごとに大小のモデルを振り分ける")
+    parser.add_argument("--large-latency", default=None, help="大きいモデル（mock-gpt）の応答時間の分布")
+    parser.add_argument("--small-latency", default=None, help="小さいモデル（mock-gpt-mini）の応答時間の分布")
+    parser.add_argument("--max-p95", type=float, default=None, help="p95 レイテンシ（秒）がこれを超えたモデルを一時的に避ける")
+    parser.add_argument("--stream", action="store_true", help="CodingAgent の出力をストリーミングで受け取る")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="結果をJSONで書き出すパス")
+    args = parser.parse_args()
+
+    configure_logging(logging.WARNING)
+    model_latency = {}
+    if args.large_latency:
+        model_latency["mock-gpt"] = LatencyDistribution.parse(args.large_latency)
+    if args.small_latency:
+        model_latency["mock-gpt-mini"] = LatencyDistribution.parse(args.small_latency)
+    base_url = args.base_url or start_mock_server(MockServerConfig(
+        latency=LatencyDistribution.parse(args.latency),
+        token_latency=LatencyDistribution.parse(args.token_latency),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        requests_per_minute=args.rpm,
+        model_latency=model_latency,
+        seed=args.seed,
+    ))
+
+    file_read_tool = FileReadTool()
+    tools = [file_read_tool, TerminalTool()]
+    http_client, http_async_client = shared_http_clients(max_connections=args.workers * 2) if args.pool else (None, None)
+    def mock_llm_factory(model: str):
+        return openai_llm_factory(
+            "sk-mock", model=model, base_url=base_url,
+            max_retries=0 if args.gateway else args.max_retries,
+            http_client=http_client, http_async_client=http_async_client,
+        )
+
+    llm_factory = mock_llm_factory("mock-gpt")
+    routing = model_routing(llm_factory, mock_llm_factory("mock-gpt-mini"), max_p95=args.max_p95) if args.routing else None
+    gateway = None
+    if args.gateway:
+        gateway = {
+            "requests_per_minute": args.gateway_rpm,
+            "tokens_per_minute": args.gateway_tpm,
+            "max_retries": args.max_retries,
+            "coalesce": not args.no_coalesce,
+            "hedge_after": args.hedge_after,
+        }
+    registry = build_registry(llm_factory, tools, gateway=gateway, routing=routing)
+    registry.register_instance("browser_agent", OfflineBrowserAgent(None, tools))
+    base_config = {
+        "configurable": {
+            "agent_registry": registry,
+            "file_read_tool": file_read_tool,
+            "stream_code": args.stream,
+        }
+    }
+    tasks = [BatchTask(id=str(i), task=TASK) for i in range(args.tasks)]
+    graph = build_workflow()
+
+    cwd = os.getcwd()
+    os.chdir(prepare_workspace())
+    try:
+        report = asyncio.run(run_batch(graph, tasks, base_config, args.workers))
+    finally:
+        os.chdir(cwd)
+
+    summary = report.summary()
+    stats = server_stats(base_url)
+    print_summary(summary)
+    if stats is not None:
+        print(
+            f"server requests={stats['requests']} streamed={stats['streamed']} 429={stats['rate_limited']} "
+            f"errors={stats['errors']} peak_in_flight={stats['peak_in_flight']} connections={stats['connections']}",
+            file=sys.stderr,
+        )
+    router_stats = registry.get("model_router").stats() if args.routing else None
+    if router_stats is not None:
+        print_router_stats(router_stats)
+    gateway_stats = registry.get("llm_gateway").metrics.stats() if args.gateway and not args.routing else None
+    if gateway_stats is not None:
+        latency = gateway_stats["latency"]
+        print(
+            f"gateway calls={gateway_stats['calls']} upstream={gateway_stats['upstream']} "
+            f"coalesced={gateway_stats['coalesced']} retries={gateway_stats['retries']} failures={gateway_stats['failures']} "
+            f"hedges={gateway_stats['hedges']} hedge_wins={gateway_stats['hedge_wins']} "
+            f"throttle_wait={gateway_stats['throttle_wait']:.2f}s upstream_p95={latency['p95']:.3f}s",
+            file=sys.stderr,
+        )
+    failures = [r for r in report.results if r["status"] != "ok"]
+    for result in failures[:5]:
+        print(f"failed {result['id']}: {result['error']}", file=sys.stderr)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "server": stats, "gateway": gateway_stats, "router": router_stats}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
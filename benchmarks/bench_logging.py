@@ -0,0 +1,128 @@
+"""
+ノードごとのログ処理のオーバーヘッド計測
+terminal_node 相当のログ出力（ステート全体・メッセージ履歴・コマンド・実行結果）を1ステップとして繰り返し、
+呼び出し元のスレッドで1ステップあたりにかかる時間を、従来の書き方と utils.log の書き方で比較します。
+
+- before: logging.basicConfig(DEBUG) の StreamHandler に f-string でステート全体を渡す（従来の nodes.py）
+- after:  configure_logging() のキュー経由ハンドラに preview() を %s 引数で渡す
+
+実行例（リポジトリのルートで）:
+    python -m benchmarks.bench_logging --steps 2000 --code-kb 64 --messages 40
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from utils.log import configure_logging, preview, shutdown_logging
+
+
+class _Message:
+    """langchain のメッセージと同じく type / content を持つ軽量な代用品（repr は BaseMessage と同程度に長い）"""
+
+    def __init__(self, type: str, content: str):
+        self.type = type
+        self.content = content
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(content={self.content!r}, additional_kwargs={{}}, response_metadata={{}}, type={self.type!r})"
+
+
+def make_state(code_kb: int, messages: int) -> Dict[str, Any]:
+    code = ("def handler(request):\n    return {'status': 'ok', 'items': list(range(10))}\n" * (code_kb * 1024 // 70 + 1))[: code_kb * 1024]
+    history: List[_Message] = []
+    for i in range(messages):
+        history.append(_Message("human" if i % 2 == 0 else "ai", f"turn {i}: " + "要件とレビューのやりとり。" * 40))
+    return {
+        "messages": history,
+        "requirements": "要件定義:\n" + "- 機能要件\n" * 50,
+        "review_result": "The requirement definition looks good.",
+        "existing_code": code,
+        "coding_result": {"code": code, "file_path": "generate/target.py"},
+        "target_file_path": "generate/target.py",
+        "generated_command": "python generate/target.py",
+    }
+
+
+def before_step(state: Dict[str, Any], result: str) -> None:
+    messages = state.get("messages", [])
+    generated_command = state.get("generated_command", "")
+    logging.info(f"terminal_node - state: {state}")
+    logging.info(f"messages: {messages}")
+    logging.debug(f"terminal_node - generated_command type: {type(generated_command)}, value: {generated_command}")
+    logging.info(f"terminal_node - 抽出されたコマンド: {generated_command}")
+    logging.info(f"terminal_node - コマンド実行結果: {result}")
+
+
+_logger = logging.getLogger("nodes.nodes")
+
+
+def after_step(state: Dict[str, Any], result: str) -> None:
+    messages = state.get("messages", [])
+    generated_command = state.get("generated_command", "")
+    _logger.debug("terminal_node - state: %s", preview(state))
+    _logger.debug("terminal_node - messages: %s", preview(messages))
+    _logger.debug("terminal_node - generated_command type: %s, value: %s", type(generated_command), preview(generated_command))
+    _logger.info("terminal_node - 抽出されたコマンド: %s", preview(generated_command))
+    _logger.info("terminal_node - コマンド実行結果: %s", preview(result))
+
+
+def measure(step: Callable[[Dict[str, Any], str], None], state: Dict[str, Any], result: str, steps: int) -> Dict[str, float]:
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        step(state, result)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "mean_us": statistics.fmean(times) * 1e6,
+        "p50_us": times[len(times) // 2] * 1e6,
+        "p99_us": times[min(int(len(times) * 0.99), len(times) - 1)] * 1e6,
+    }
+
+
+def reset_root() -> logging.Logger:
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-node logging overhead benchmark")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--code-kb", type=int, default=64, help="ステートに含める既存コードのサイズ（KB）")
+    parser.add_argument("--messages", type=int, default=40, help="メッセージ履歴の件数")
+    args = parser.parse_args()
+
+    state = make_state(args.code_kb, args.messages)
+    result = "collected 12 items\n" + "test_case PASSED\n" * 500
+    devnull = open(os.devnull, "w", encoding="utf-8")
+
+    rows = []
+    for label, level in [("DEBUG", logging.DEBUG), ("INFO", logging.INFO), ("WARNING", logging.WARNING)]:
+        root = reset_root()
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(level)
+        rows.append((f"before {label}", measure(before_step, state, result, args.steps)))
+
+        reset_root()
+        configure_logging(level, stream=devnull)
+        rows.append((f"after  {label}", measure(after_step, state, result, args.steps)))
+        shutdown_logging()
+
+    devnull.close()
+    print(f"per node step (caller thread), state≈{args.code_kb}KB code + {args.messages} messages, steps={args.steps}")
+    for label, stats in rows:
+        print(f"{label:<16} mean={stats['mean_us']:9.1f}us p50={stats['p50_us']:9.1f}us p99={stats['p99_us']:9.1f}us")
+
+
+if __name__ == "__main__":
+    main()
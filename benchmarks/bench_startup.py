@@ -0,0 +1,78 @@
+"""
+build_workflow() のコールドスタート計測
+新しいPythonプロセスで `import workflow; build_workflow()` を繰り返し実行し、
+所要時間と、起動時に読み込まれてしまった重い依存モジュールを報告します。
+
+実行例（リポジトリのルートで）:
+    python -m benchmarks.bench_startup --runs 5 --top 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# 起動時に読み込まれるべきではない重い依存
+HEAVY_MODULES = ["browser_use", "playwright", "langchain_openai", "openai", "aiofiles"]
+
+PROBE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import workflow
+workflow.build_workflow()
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_probe(cwd: str) -> dict:
+    env = dict(os.environ, ANONYMIZED_TELEMETRY="false")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE_SCRIPT.format(heavy=HEAVY_MODULES)],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_time_top(cwd: str, top: int) -> list:
+    """-X importtime の累積時間が大きいトップレベルパッケージを返す"""
+    env = dict(os.environ, ANONYMIZED_TELEMETRY="false")
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import workflow; workflow.build_workflow()"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." not in name:
+            packages[name] = max(packages.get(name, 0), int(cumulative_us))
+    return sorted(((us, name) for name, us in packages.items()), reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for build_workflow()")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="表示する -X importtime の上位件数（0で省略）")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [run_probe(cwd) for _ in range(args.runs)]
+    times = [r["elapsed"] for r in results]
+    print(f"=== build_workflow() cold start ({args.runs} runs) ===")
+    print(f"min={min(times) * 1000:.1f}ms median={statistics.median(times) * 1000:.1f}ms max={max(times) * 1000:.1f}ms")
+    loaded = results[-1]["loaded"]
+    print(f"heavy modules loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+
+    if args.top:
+        print(f"=== top {args.top} top-level imports (cumulative) ===")
+        for cumulative_us, name in import_time_top(cwd, args.top):
+            print(f"{cumulative_us / 1000:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
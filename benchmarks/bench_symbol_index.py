@@ -0,0 +1,63 @@
+"""
+SymbolIndex の計測
+対象ディレクトリ（デフォルトはリポジトリ自身）について、初回の索引作成、変更なしの更新、
+1ファイル変更後の差分更新、タスク文による検索の所要時間と、選ばれたコードのトークン数を表示します。
+
+実行例（リポジトリのルートで）:
+    python -m benchmarks.bench_symbol_index --root . --task "FileOperationAgent の書き込み処理を修正する"
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from tools.symbol_index import SymbolIndex
+from utils.tokens import count_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SymbolIndex build/update/query benchmark")
+    parser.add_argument("--root", default=".")
+    parser.add_argument("--task", default="FileOperationAgent の書き込み処理とコードの抽出を修正する")
+    parser.add_argument("--budget", type=int, default=4000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    index_path = os.path.join(tempfile.mkdtemp(prefix="bench_symbol_index_"), "index.json")
+
+    cold = SymbolIndex(args.root, index_path).update()
+    print(f"cold build: files={cold['files']} parsed={cold['parsed']} elapsed={cold['elapsed'] * 1000:.1f}ms")
+
+    index = SymbolIndex(args.root, index_path)
+    start = time.perf_counter()
+    index.load()
+    load_time = time.perf_counter() - start
+    warm = index.update()
+    print(f"load from disk: {load_time * 1000:.1f}ms, unchanged update: parsed={warm['parsed']} elapsed={warm['elapsed'] * 1000:.1f}ms")
+
+    if index.files:
+        touched = os.path.join(index.root, next(iter(index.files)))
+        os.utime(touched)
+        incremental = index.update()
+        print(f"after touching 1 file: parsed={incremental['parsed']} elapsed={incremental['elapsed'] * 1000:.1f}ms")
+
+    query_times = []
+    for _ in range(args.queries):
+        context = index.select_context(args.task, args.budget, update=False)
+        query_times.append(context.query_time)
+    print(
+        f"query: mean={statistics.mean(query_times) * 1000:.2f}ms max={max(query_times) * 1000:.2f}ms "
+        f"selected={len(context.symbols)} tokens={context.tokens}/{args.budget}"
+    )
+
+    whole_files = {symbol.split(":")[0] for symbol in context.symbols}
+    whole_tokens = sum(count_tokens(index.reader.read(os.path.join(index.root, path))) for path in whole_files)
+    print(f"whole files containing the selection: {len(whole_files)} files, {whole_tokens} tokens")
+    for symbol in context.symbols:
+        print(f"  {symbol}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+build_workflow() のオフラインベンチマーク
+ScriptedChatModel で OpenAI を置き換え、コンパイル済みグラフ全体を実行して
+ノードごとの実行時間、E2Eレイテンシ（p50/p95）、並列度ごとのスループットを計測します。
+
+--replay を指定すると、記録済みのカセット（llm.cassette）を ReplayChatModel で再生します。
+--parallel を指定すると、依存のないノードを同時に実行するグラフ（build_workflow(parallel=True)）を計測します。
+いずれの場合も、ノードごとの所要時間から逐次実行の合計・クリティカルパス・短縮できた時間を表示します。
+--speculative を指定すると、review と並行してコーディングし（投機）、hit 率と短縮した時間を表示します。
+--blobs を指定すると、大きな状態の値を utils.blob_store の参照に置き換え、stream のイベントの大きさを比較できます。
+
+実行例（リポジトリのルートで）:
+    python -m benchmarks.bench_workflow --runs 20 --concurrency 1,4,16 --latency 0.01
+    python -m benchmarks.bench_workflow --replay runs/prod.jsonl.gz --task "..." --realtime
+    python -m benchmarks.bench_workflow --runs 20 --latency 0.05 --parallel
+    python -m benchmarks.bench_workflow --runs 20 --latency 0.05 --speculative
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from agents.base_agent import BaseAgent
+from agents.coding_agent import CodingAgent
+from agents.command_generation_agent import CommandGenerationAgent
+from agents.file_operation_agent import FileOperationAgent
+from agents.planning_agent import PlanningAgent
+from agents.review_agent import ReviewAgent
+from agents.terminal_agent import TerminalAgent, TerminalTool
+from llm.cassette import Cassette, ReplayChatModel
+from llm.fake import DEFAULT_WORKFLOW_SCRIPT, ScriptedChatModel
+from tools.file_read_tool import FileReadTool
+from utils.blob_store import MemoryBlobStore
+from utils.budget import RunBudget
+from utils.log import configure_logging
+from utils.stats import percentile
+from utils.tracing import Tracer
+from workflow import WORKFLOW_DEPENDENCIES, build_workflow
+
+TASK = "テキストファイルexample.txtの中で、頻出する単語の上位3位までのランキングを作成する。"
+
+
+class OfflineBrowserAgent(BaseAgent):
+    """ブラウザを起動せずに即座に完了を返すベンチマーク用BrowserAgent"""
+
+    def run(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
+        return "BrowserAgent: タスクが完了しました。"
+
+    async def arun(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
+        return self.run(input, config)
+
+
+def build_config(llm: Any, stream_code: bool = False, edit_mode: str = "full", speculative_coding: bool = False,
+                 blob_store: Any = None) -> dict:
+    """フェイクLLMを使った各エージェントを構成する"""
+    file_read_tool = FileReadTool()
+    terminal_tool = TerminalTool()
+    tools = [file_read_tool, terminal_tool]
+    return {
+        "configurable": {
+            "coding_agent": CodingAgent(llm, tools),
+            "planning_agent": PlanningAgent(llm, tools),
+            "review_agent": ReviewAgent(llm, tools),
+            "file_read_tool": file_read_tool,
+            "file_operation_agent": FileOperationAgent(llm, tools),
+            "terminal_agent": TerminalAgent(llm, tools),
+            "browser_agent": OfflineBrowserAgent(llm, tools),
+            "command_generation_agent": CommandGenerationAgent(llm, tools),
+            "stream_code": stream_code,
+            "edit_mode": edit_mode,
+            "speculative_coding": speculative_coding,
+            "blob_store": blob_store,
+        }
+    }
+
+
+def make_inputs(task: str = TASK) -> dict:
+    return {"messages": [HumanMessage(content=task)]}
+
+
+def run_once_sync(graph, config: dict, task: str = TASK) -> Dict[str, Any]:
+    """
+    graph.stream で1回実行し、ノードごとの所要時間とクリティカルパスの集計を返す。
+    クリティカルパスには、RunBudget が記録するノードごとの実行時間（並列実行でも重ならない）を使う。
+    """
+    budget = RunBudget()
+    config = {**config, "configurable": {**config["configurable"], "run_budget": budget}}
+    node_times: Dict[str, float] = defaultdict(float)
+    stream_chars = 0
+    start = last = time.perf_counter()
+    for output in graph.stream(make_inputs(task), config, stream_mode="updates"):
+        now = time.perf_counter()
+        for node_name in output:
+            node_times[node_name] += now - last
+        stream_chars += len(repr(output))
+        last = now
+    total = time.perf_counter() - start
+    durations = {name: stats["elapsed"] for name, stats in budget.report()["nodes"].items()}
+    return {
+        "total": total,
+        "nodes": dict(node_times),
+        "stream_chars": stream_chars,
+        "schedule": WORKFLOW_DEPENDENCIES.schedule_report(durations, total),
+    }
+
+
+async def run_once_async(graph, config: dict, task: str = TASK) -> Dict[str, Any]:
+    """graph.astream で1回実行し、ノードごとの所要時間を返す"""
+    node_times: Dict[str, float] = defaultdict(float)
+    start = last = time.perf_counter()
+    async for output in graph.astream(make_inputs(task), config, stream_mode="updates"):
+        now = time.perf_counter()
+        for node_name in output:
+            node_times[node_name] += now - last
+        last = now
+    return {"total": time.perf_counter() - start, "nodes": dict(node_times)}
+
+
+async def measure_throughput(graph, config: dict, runs: int, concurrency: int, task: str = TASK) -> Dict[str, float]:
+    """指定の並列度で runs 回実行し、スループットとレイテンシを返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def worker():
+        async with semaphore:
+            result = await run_once_async(graph, config, task)
+            latencies.append(result["total"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(runs)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "runs": runs,
+        "elapsed": elapsed,
+        "throughput": runs / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+    }
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    totals = [r["total"] for r in results]
+    per_node: Dict[str, List[float]] = defaultdict(list)
+    for r in results:
+        for node_name, elapsed in r["nodes"].items():
+            per_node[node_name].append(elapsed)
+    schedules = [r["schedule"] for r in results if "schedule" in r]
+    return {
+        "runs": len(results),
+        "stream_chars": statistics.mean(r.get("stream_chars", 0) for r in results),
+        "schedule": {
+            key: statistics.mean(s[key] for s in schedules) for key in ("sequential", "critical_path", "wall", "saved")
+        } if schedules else None,
+        "critical_path": schedules[-1]["path"] if schedules else None,
+        "total": {
+            "mean": statistics.mean(totals),
+            "p50": percentile(totals, 50),
+            "p95": percentile(totals, 95),
+        },
+        "nodes": {
+            name: {"mean": statistics.mean(v), "p50": percentile(v, 50), "p95": percentile(v, 95)}
+            for name, v in per_node.items()
+        },
+    }
+
+
+def prepare_workspace() -> str:
+    """read_code_node が読む generate/target.py を含む一時作業ディレクトリを作成する"""
+    workspace = tempfile.mkdtemp(prefix="bench_workflow_")
+    os.makedirs(os.path.join(workspace, "generate"), exist_ok=True)
+    with open(os.path.join(workspace, "generate", "target.py"), "w", encoding="utf-8") as f:
+        f.write("print('hello')\n")
+    return workspace
+
+
+def print_report(sync_summary: Dict[str, Any], throughput: List[Dict[str, float]], extraction: Dict[str, Any],
+                 streaming: Optional[Dict[str, Any]] = None, patch: Optional[Dict[str, Any]] = None,
+                 speculation: Optional[Dict[str, Any]] = None) -> None:
+    print(f"=== E2E latency (sync stream, {sync_summary['runs']} runs) ===")
+    total = sync_summary["total"]
+    print(f"mean={total['mean'] * 1000:.2f}ms p50={total['p50'] * 1000:.2f}ms p95={total['p95'] * 1000:.2f}ms")
+    print(f"stream events={sync_summary['stream_chars'] / 1024:.1f}KiB/run (repr)")
+    print("=== per-node wall time ===")
+    for name, stats in sync_summary["nodes"].items():
+        print(f"{name:<20} mean={stats['mean'] * 1000:8.2f}ms p50={stats['p50'] * 1000:8.2f}ms p95={stats['p95'] * 1000:8.2f}ms")
+    schedule = sync_summary.get("schedule")
+    if schedule:
+        print("=== critical path ===")
+        print(
+            f"sequential={schedule['sequential'] * 1000:.2f}ms critical_path={schedule['critical_path'] * 1000:.2f}ms "
+            f"wall={schedule['wall'] * 1000:.2f}ms saved={schedule['saved'] * 1000:.2f}ms"
+        )
+        print(" -> ".join(sync_summary["critical_path"]))
+    print("=== throughput (async stream) ===")
+    for row in throughput:
+        print(
+            f"concurrency={row['concurrency']:<4} runs={row['runs']:<5} "
+            f"throughput={row['throughput']:8.2f} runs/s p50={row['p50'] * 1000:8.2f}ms p95={row['p95'] * 1000:8.2f}ms"
+        )
+    print("=== file extraction ===")
+    print(
+        f"fast_path_hits={extraction['fast_path_hits']} fallbacks={extraction['fallbacks']} "
+        f"hit_rate={extraction['hit_rate']:.1%}"
+    )
+    if streaming:
+        print("=== coding stream ===")
+        ttfb = streaming["ttfb"]
+        print(
+            f"streams={streaming['streams']} ttfb p50={ttfb['p50'] * 1000:.2f}ms p95={ttfb['p95'] * 1000:.2f}ms "
+            f"tokens/s={streaming['tokens_per_sec']:.1f}"
+        )
+    if speculation:
+        print("=== speculative coding ===")
+        saved = speculation["saved_per_run"]
+        print(
+            f"speculations={speculation['speculations']} hits={speculation['hits']} misses={speculation['misses']} "
+            f"failures={speculation['failures']} hit_rate={speculation['hit_rate']:.1%} "
+            f"saved/run mean={saved['mean'] * 1000:.2f}ms p50={saved['p50'] * 1000:.2f}ms "
+            f"wasted={speculation['wasted'] * 1000:.2f}ms"
+        )
+    if patch:
+        print("=== patch edits ===")
+        print(
+            f"applied={patch['applied']} fallbacks={patch['fallbacks']} "
+            f"output_tokens={patch['patch_tokens']} full_file_tokens={patch['full_file_tokens']} "
+            f"saved={patch['saved_tokens']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for build_workflow()")
+    parser.add_argument("--runs", type=int, default=10, help="計測する実行回数")
+    parser.add_argument("--concurrency", default="1,4,16", help="スループット計測の並列度（カンマ区切り）")
+    parser.add_argument("--latency", type=float, default=0.0, help="フェイクLLMの1呼び出しあたりのレイテンシ（秒）")
+    parser.add_argument("--latency-per-token", type=float, default=0.0, help="フェイクLLMのトークンあたりのレイテンシ（秒）")
+    parser.add_argument("--output-tokens", type=int, default=None, help="フェイクLLMの出力トークン数")
+    parser.add_argument("--stream", action="store_true", help="CodingAgent の出力をストリーミングでファイルに書き込む")
+    parser.add_argument("--edit-mode", choices=["full", "patch"], default="full", help="CodingAgent の出力形式")
+    parser.add_argument("--replay", default=None, help="フェイクLLMの代わりに再生するカセットファイル")
+    parser.add_argument("--realtime", action="store_true", help="--replay 時に記録時のレイテンシを再現する")
+    parser.add_argument("--speed", type=float, default=1.0, help="--realtime 時の再生速度の倍率")
+    parser.add_argument("--speculative", action="store_true", help="review と並行してコーディングを投機的に実行する")
+    parser.add_argument("--blobs", action="store_true", help="大きな状態の値を MemoryBlobStore の参照に置き換える")
+    parser.add_argument("--parallel", action="store_true", help="依存のないノードを同時に実行する")
+    parser.add_argument("--task", default=TASK, help="ワークフローに渡すタスク（カセットの記録時と同じものを指定する）")
+    parser.add_argument("--json", dest="json_path", default=None, help="結果をJSONで書き出すパス")
+    parser.add_argument("--trace", dest="trace_path", default=None, help="Chrome trace 形式のトレースを書き出すパス")
+    args = parser.parse_args()
+
+    configure_logging(logging.WARNING)
+
+    if args.replay:
+        llm = ReplayChatModel(cassette=Cassette.load(args.replay), realtime=args.realtime, speed=args.speed)
+    else:
+        llm = ScriptedChatModel(
+            script=DEFAULT_WORKFLOW_SCRIPT,
+            latency=args.latency,
+            latency_per_token=args.latency_per_token,
+            output_tokens=args.output_tokens,
+        )
+    config = build_config(llm, stream_code=args.stream, edit_mode=args.edit_mode, speculative_coding=args.speculative,
+                          blob_store=MemoryBlobStore() if args.blobs else None)
+    tracer = Tracer() if args.trace_path else None
+    graph = build_workflow(tracer, parallel=args.parallel)
+
+    cwd = os.getcwd()
+    os.chdir(prepare_workspace())
+    try:
+        sync_results = [run_once_sync(graph, config, args.task) for _ in range(args.runs)]
+        levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+        throughput = [asyncio.run(measure_throughput(graph, config, args.runs, c, args.task)) for c in levels]
+    finally:
+        os.chdir(cwd)
+
+    sync_summary = summarize(sync_results)
+    extraction = config["configurable"]["file_operation_agent"].extraction_metrics.stats()
+    streaming = config["configurable"]["coding_agent"].stream_metrics.summary() if args.stream else None
+    patch = config["configurable"]["coding_agent"].patch_metrics.stats() if args.edit_mode == "patch" else None
+    speculation = config["configurable"]["coding_agent"].speculation_metrics.stats() if args.speculative else None
+    print_report(sync_summary, throughput, extraction, streaming, patch, speculation)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"sync": sync_summary, "throughput": throughput, "extraction": extraction, "streaming": streaming, "patch": patch,
+                 "speculation": speculation},
+                f, indent=2,
+            )
+    if tracer is not None:
+        tracer.export_chrome_trace(args.trace_path)
+
+
+if __name__ == "__main__":
+    main()
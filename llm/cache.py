@@ -0,0 +1,244 @@
+"""
+LLMCache: LLM応答のキャッシュ
+フォーマット済みのプロンプトメッセージとモデルパラメータをキーとして、
+メモリ上のLRU層とディスク上の永続層（SQLite）の二段構成で応答を保持します。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.runnables import RunnableConfig
+
+
+def _message_fingerprint(message: Any) -> dict:
+    """キャッシュキー用にメッセージの意味を持つ部分だけを取り出す（idなど実行ごとに変わる値は除外）"""
+    if isinstance(message, BaseMessage):
+        return {
+            "type": message.type,
+            "content": message.content,
+            "name": message.name,
+            "tool_calls": getattr(message, "tool_calls", None) or None,
+        }
+    return {"type": type(message).__name__, "content": str(message)}
+
+
+def _model_params(llm: Any, config: Optional[RunnableConfig] = None) -> dict:
+    """
+    LLMインスタンスからキャッシュキーに含めるモデルパラメータを取得する。
+    LLMGateway や RecordingChatModel のようなラッパーは inner のモデルで判定し、包む前とキーを揃える。
+    RoutedChatModel のようにノードによって使うモデルが変わるラッパーは cache_model(config) のモデルで判定する。
+    """
+    while True:
+        cache_model = getattr(llm, "cache_model", None)
+        if cache_model is not None:
+            llm = cache_model(config)
+        elif getattr(llm, "inner", None) is not None:
+            llm = llm.inner
+        else:
+            break
+    params = getattr(llm, "_identifying_params", None)
+    if not isinstance(params, dict):
+        params = {"repr": repr(llm)}
+    return {"class": type(llm).__name__, **params}
+
+
+class MemoryLRU:
+    """件数上限付きのスレッドセーフなLRUキャッシュ"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache:
+    """SQLiteを用いた永続キャッシュ。TTLと件数・合計サイズの上限で古いエントリを削除する。"""
+
+    def __init__(
+        self,
+        path: str = ".cache/llm_cache.sqlite3",
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _is_expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self._is_expired(created, now):
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, now, now, len(payload)),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """期限切れのエントリを削除し、上限を超えていればアクセスの古い順に削除する"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed ASC").fetchall()
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LLMCache:
+    """
+    LRUメモリ層 → ディスク層 の順に参照するLLM応答キャッシュ。
+    全エージェントで1つのインスタンスを共有することを想定しています。
+    """
+
+    def __init__(self, memory: Optional[MemoryLRU] = None, disk: Optional[DiskCache] = None):
+        self.memory = memory if memory is not None else MemoryLRU()
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._stats_lock = threading.Lock()
+
+    def make_key(self, messages: Sequence[Any], llm: Any, config: Optional[RunnableConfig] = None) -> str:
+        """プロンプトメッセージとモデルパラメータからキャッシュキーを生成する"""
+        payload = {
+            "messages": [_message_fingerprint(m) for m in messages],
+            "model": _model_params(llm, config),
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        """キャッシュ済みの応答を取得する。存在しなければNoneを返す"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return messages_from_dict([value])[0]
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._count("disk_hits")
+                self.memory.set(key, value)
+                return messages_from_dict([value])[0]
+        self._count("misses")
+        return None
+
+    def set(self, key: str, response: BaseMessage) -> None:
+        """
+        応答を両方の層に保存する。
+        response_metadata に no_cache がある応答（キーのモデル以外が答えたもの）は保存しない。
+        """
+        if getattr(response, "response_metadata", {}).get("no_cache"):
+            self._count("skipped")
+            return
+        value = message_to_dict(response)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> dict:
+        """ヒット・ミスの統計を返す"""
+        total = self.hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,362 @@
+"""
+カセット: LLMとのやりとりを記録・再生する
+RecordingChatModel は実際のチャットモデルを包み、リクエストと応答（所要時間・ストリーミングの断片を含む）を
+カセットファイル（JSONL、拡張子が .gz なら gzip 圧縮）に追記します。
+ReplayChatModel は記録した応答をリクエストごとに決定的に返し、必要なら記録時のレイテンシを再現します。
+
+    # 記録
+    llm = RecordingChatModel(inner=ChatOpenAI(...), cassette=Cassette("runs/prod.jsonl.gz"))
+    # 再生（ネットワーク不要）
+    llm = ReplayChatModel(cassette=Cassette.load("runs/prod.jsonl.gz"), realtime=True)
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import IO, Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from llm.cache import _message_fingerprint
+
+
+class CassetteMiss(LookupError):
+    """カセットに記録されていないリクエストを再生しようとした"""
+
+
+def request_key(messages: Sequence[Any], stop: Optional[List[str]] = None) -> str:
+    """
+    リクエストを識別するキー。モデルのパラメータは含めないため、
+    記録時のモデルと再生用のモデルで同じキーになる。
+    """
+    payload = {"messages": [_message_fingerprint(m) for m in messages], "stop": stop or None}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """
+    記録したやりとりの集合。
+
+    各エントリは {"key", "response", "elapsed", "ttft", "chunks", "model", "recorded_at"} を持ち、
+    store_requests=True のときはリクエストのメッセージも保存する（デバッグ用。ファイルは大きくなる）。
+    path を指定すると、record() のたびにファイルへ追記する。
+    """
+
+    def __init__(self, path: Optional[str] = None, store_requests: bool = False):
+        self.path = path
+        self.store_requests = store_requests
+        self.entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        """カセットファイルを読み込む（再生用。追記はしない）"""
+        cassette = cls()
+        with _open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    cassette._add(json.loads(line))
+        return cassette
+
+    def _add(self, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+        self._by_key[entry["key"]].append(entry)
+
+    def record(
+        self,
+        messages: Sequence[BaseMessage],
+        stop: Optional[List[str]],
+        response: BaseMessage,
+        elapsed: float,
+        ttft: Optional[float] = None,
+        chunks: Optional[List[str]] = None,
+        model: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {
+            "key": request_key(messages, stop),
+            "response": message_to_dict(response),
+            "elapsed": round(elapsed, 6),
+            "ttft": round(ttft, 6) if ttft is not None else None,
+            "chunks": chunks,
+            "model": model,
+            "recorded_at": time.time(),
+        }
+        if self.store_requests:
+            entry["request"] = [message_to_dict(m) for m in messages]
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._add(entry)
+            if self.path:
+                with _open(self.path, "a") as f:
+                    f.write(line + "\n")
+        return entry
+
+    def next(self, messages: Sequence[BaseMessage], stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        リクエストに対応するエントリを返す。同じリクエストが複数回記録されていれば記録順に返し、
+        使い切った後は最後のエントリを返し続ける。
+        """
+        key = request_key(messages, stop)
+        with self._lock:
+            candidates = self._by_key.get(key)
+            if not candidates:
+                raise CassetteMiss(f"cassette has no recorded response for request {key[:12]}")
+            index = self._cursors[key]
+            self._cursors[key] = index + 1
+        return candidates[min(index, len(candidates) - 1)]
+
+    def rewind(self) -> None:
+        """再生位置を最初に戻す"""
+        with self._lock:
+            self._cursors.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _model_name(llm: Any) -> Optional[str]:
+    params = getattr(llm, "_identifying_params", None)
+    if isinstance(params, dict):
+        return params.get("model_name") or params.get("model")
+    return None
+
+
+class RecordingChatModel(BaseChatModel):
+    """
+    inner のチャットモデルを呼び出し、やりとりを cassette に記録するモデル。
+    _identifying_params は inner のものを返すため、LLMCache のキーは包む前と変わらない。
+    """
+
+    inner: BaseChatModel
+    cassette: Cassette
+
+    @property
+    def _llm_type(self) -> str:
+        return f"recording-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def _record(self, messages, stop, response, start, ttft=None, chunks=None) -> None:
+        self.cassette.record(messages, stop, response, time.perf_counter() - start, ttft, chunks, _model_name(self.inner))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.perf_counter()
+        response = self.inner.invoke(messages, stop=stop, **kwargs)
+        self._record(messages, stop, response, start)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.perf_counter()
+        response = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        self._record(messages, stop, response, start)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        ttft, chunks, response = None, [], None
+        for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            response = chunk if response is None else response + chunk
+            chunks.append(chunk.content if isinstance(chunk.content, str) else "")
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+        if response is not None:
+            self._record(messages, stop, response, start, ttft, chunks)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        ttft, chunks, response = None, [], None
+        async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            response = chunk if response is None else response + chunk
+            chunks.append(chunk.content if isinstance(chunk.content, str) else "")
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+        if response is not None:
+            self._record(messages, stop, response, start, ttft, chunks)
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    カセットに記録された応答を返す決定的なチャットモデル。
+
+    realtime=True のとき、記録時の所要時間（ストリーミングでは最初の断片までの時間と断片の間隔）を
+    speed で割った分だけ待つ。記録にないリクエストは CassetteMiss を送出するか、
+    fallback_response が指定されていればそれを返す。
+    """
+
+    cassette: Cassette
+    realtime: bool = False
+    speed: float = 1.0
+    fallback_response: Optional[str] = None
+    call_count: int = 0
+    miss_count: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-replay"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": "cassette-replay"}
+
+    def _lookup(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> Dict[str, Any]:
+        self.call_count += 1
+        try:
+            return self.cassette.next(messages, stop)
+        except CassetteMiss:
+            if self.fallback_response is None:
+                raise
+            self.miss_count += 1
+            return {"response": message_to_dict(AIMessage(content=self.fallback_response)), "elapsed": 0.0,
+                    "ttft": None, "chunks": None}
+
+    def _delay(self, seconds: Optional[float]) -> float:
+        if not self.realtime or not seconds:
+            return 0.0
+        return seconds / self.speed
+
+    @staticmethod
+    def _message(entry: Dict[str, Any]) -> BaseMessage:
+        return messages_from_dict([entry["response"]])[0]
+
+    def _chunks(self, entry: Dict[str, Any]) -> List[str]:
+        chunks = entry.get("chunks")
+        if chunks is None:
+            content = self._message(entry).content
+            chunks = [content if isinstance(content, str) else str(content)]
+        return chunks
+
+    def _chunk_plan(self, entry: Dict[str, Any]) -> tuple:
+        """(最初の断片までの待ち時間, 断片ごとの間隔, 断片) を返す"""
+        chunks = self._chunks(entry)
+        elapsed = entry.get("elapsed") or 0.0
+        ttft = entry.get("ttft")
+        if ttft is None:
+            ttft = elapsed
+        interval = (elapsed - ttft) / max(len(chunks) - 1, 1)
+        return self._delay(ttft), self._delay(interval), chunks
+
+    def _final_chunk(self, entry: Dict[str, Any]) -> ChatGenerationChunk:
+        """usage_metadata などを載せた空の最後の断片"""
+        message = self._message(entry)
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata=getattr(message, "usage_metadata", None),
+            response_metadata=getattr(message, "response_metadata", {}) or {},
+        ))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        entry = self._lookup(messages, stop)
+        delay = self._delay(entry.get("elapsed"))
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._message(entry))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        entry = self._lookup(messages, stop)
+        delay = self._delay(entry.get("elapsed"))
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._message(entry))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        entry = self._lookup(messages, stop)
+        first, interval, chunks = self._chunk_plan(entry)
+        for i, text in enumerate(chunks):
+            delay = first if i == 0 else interval
+            if delay:
+                time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager and text:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(entry)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        entry = self._lookup(messages, stop)
+        first, interval, chunks = self._chunk_plan(entry)
+        for i, text in enumerate(chunks):
+            delay = first if i == 0 else interval
+            if delay:
+                await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager and text:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(entry)
@@ -0,0 +1,162 @@
+"""
+ScriptedChatModel: ネットワークを使わない決定的なフェイクチャットモデル
+システムプロンプトに含まれるキーワードごとに応答を台本として定義し、
+レイテンシと出力トークン数を設定できます。ベンチマークやオフライン検証で使用します。
+"""
+
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.tokens import approx_token_count
+
+
+def split_tokens(text: str) -> List[str]:
+    """テキストを空白区切りの疑似トークンに分割する（空白は直前のトークンに含める）"""
+    return re.findall(r"\s*\S+\s*|\s+", text)
+
+
+def scripted_response(script: Dict[str, str], system_text: str, default: str) -> str:
+    """システムプロンプトに含まれる最初のキーワードに対応する応答を返す（一致しなければ default）"""
+    for keyword, response in script.items():
+        if keyword in system_text:
+            return response
+    return default
+
+
+# build_workflow() の各エージェントのシステムプロンプトに対応するデフォルト台本
+DEFAULT_WORKFLOW_SCRIPT: Dict[str, str] = {
+    "planning assistant": "要件定義:\n1. テキストファイルを読み込む\n2. 単語の出現回数を数える\n3. 上位3件を表示する",
+    "review assistant": "The requirement definition looks good. No changes needed.",
+    "最小限の差分で修正": "ファイルパス: generate/target.py\n<<<<<<< SEARCH\nprint('hello')\n=======\nprint('hello')\n>>>>>>> REPLACE",
+    "コーディングアシスタント": "ファイルパス: generate/target.py\nコード: \n```python\nprint('hello')\n```",
+    "ファイルパスとコード内容を抽出": '{"file_path": "generate/target.py", "code": "print(\'hello\')\\n"}',
+    "コマンド生成アシスタント": '{"command": "echo ok"}',
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    台本に従って応答する決定的なチャットモデル。
+
+    script のキーがシステムプロンプトに含まれていれば対応する応答を返し、
+    どれにも一致しなければ default_response を返します。
+    """
+
+    script: Dict[str, str] = {}
+    default_response: str = "OK"
+    latency: float = 0.0
+    """1回の呼び出しごとの固定レイテンシ（秒）"""
+    latency_per_token: float = 0.0
+    """出力トークンごとに加算されるレイテンシ（秒）"""
+    output_tokens: Optional[int] = None
+    """指定した場合、応答をこのトークン数になるまでフィラーで埋める"""
+    call_count: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": "scripted-fake", "output_tokens": self.output_tokens}
+
+    def _select_response(self, messages: List[BaseMessage]) -> str:
+        system_text = "\n".join(str(m.content) for m in messages if m.type == "system")
+        return self._pad(scripted_response(self.script, system_text, self.default_response))
+
+    def _pad(self, text: str) -> str:
+        if self.output_tokens is None:
+            return text
+        missing = self.output_tokens - len(split_tokens(text))
+        if missing <= 0:
+            return text
+        return text + "\n# " + " ".join(["lorem"] * missing)
+
+    def _build_message(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        prompt_tokens = sum(approx_token_count(str(m.content)) for m in messages)
+        completion_tokens = len(split_tokens(text))
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"model_name": "scripted-fake"},
+        )
+
+    def _delay(self, text: str) -> float:
+        return self.latency + self.latency_per_token * len(split_tokens(text))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.call_count += 1
+        text = self._select_response(messages)
+        delay = self._delay(text)
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._build_message(messages, text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.call_count += 1
+        text = self._select_response(messages)
+        delay = self._delay(text)
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._build_message(messages, text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        self.call_count += 1
+        text = self._select_response(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        for token in split_tokens(text):
+            if self.latency_per_token:
+                time.sleep(self.latency_per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self.call_count += 1
+        text = self._select_response(messages)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for token in split_tokens(text):
+            if self.latency_per_token:
+                await asyncio.sleep(self.latency_per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
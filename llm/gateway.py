@@ -0,0 +1,384 @@
+"""
+LLMGateway: エージェントとチャットモデルの間に入り、同時に呼び出すすべてのエージェントを調整する
+- 1分あたりのリクエスト数・トークン数のトークンバケットによる流量制限
+- 429・5xx・接続エラーのジッター付き指数バックオフによるリトライ（retry-after を尊重）
+- 同一リクエストが実行中なら相乗りする single-flight
+- 一定時間応答がなければ同じリクエストをもう1本送る hedged request（非同期のみ）
+invoke / ainvoke / stream / astream を持つため、エージェントには llm の代わりにそのまま渡せます。
+HTTPの keep-alive コネクションプールは shared_http_clients() で作成し、ChatOpenAI に渡します。
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from llm.cache import _message_fingerprint, _model_params
+from utils.stats import latency_summary
+from utils.tokens import messages_tokens
+
+# リトライするHTTPステータス
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# ステータスを持たないがリトライする例外（openai / httpx のクラス名）
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "RemoteProtocolError"}
+
+
+def shared_http_clients(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 120.0,
+) -> Tuple[Any, Any]:
+    """
+    keep-alive を有効にした httpx.Client / httpx.AsyncClient の組を返す。
+    openai_llm_factory(http_client=..., http_async_client=...) に渡すと、全エージェントで接続を共有する。
+    """
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+class _LeaderCancelled(Exception):
+    """single-flight で実行していた呼び出し元がキャンセルされた（相乗りしていた側が実行を引き継ぐ）"""
+
+
+class TokenBucket:
+    """
+    1分あたり rate_per_minute 単位が補充されるトークンバケット（容量は1分ぶん）。
+    reserve() は残量が足りなくても先に予約し、待つべき秒数を返す（呼び出し側が sleep する）。
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """予約した量と実際の消費量の差を戻す（正なら返却、負なら追加で消費）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+class GatewayMetrics:
+    """ゲートウェイの呼び出し・相乗り・リトライ・ヘッジ・流量制限の待ち時間の集計"""
+
+    def __init__(self):
+        self.calls = 0
+        self.upstream = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.throttle_wait = 0.0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def latency(self, seconds: float) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "upstream": self.upstream,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "failures": self.failures,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "throttle_wait": self.throttle_wait,
+                "latency": latency_summary(self.latencies),
+            }
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in RETRYABLE_ERRORS or isinstance(error, (ConnectionError, TimeoutError))
+
+
+class LLMGateway:
+    """
+    チャットモデルの前段に置くゲートウェイ。
+
+    requests_per_minute / tokens_per_minute: 流量制限（None なら制限しない）。トークン数は呼び出し前に
+        プロンプトから見積もり、応答の usage_metadata で補正する。
+    max_retries: リトライ回数。ChatOpenAI 側のリトライと二重にならないよう、モデルは max_retries=0 で作成する。
+    backoff_base / backoff_max: バックオフの基準と上限（秒）。待ち時間は [0, min(max, base * 2^n)] の一様乱数。
+    coalesce: 同一のリクエスト（メッセージとモデルパラメータが同じ）が実行中なら、その結果を共有する。
+    hedge_after: 非同期呼び出しがこの秒数を超えても終わらなければ、同じリクエストをもう1本送り、早い方を使う。
+    """
+
+    def __init__(
+        self,
+        inner: Any,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        coalesce: bool = True,
+        hedge_after: Optional[float] = None,
+    ):
+        self.inner = inner
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.coalesce = coalesce
+        self.hedge_after = hedge_after
+        self.metrics = GatewayMetrics()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return getattr(self.inner, "_identifying_params", {})
+
+    def request_key(self, messages: Sequence[Any]) -> str:
+        payload = {"messages": [_message_fingerprint(m) for m in messages], "model": _model_params(self.inner)}
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # 流量制限
+
+    def _reserve(self, messages: Sequence[Any]) -> Tuple[float, int]:
+        """流量制限の枠を予約し、(待つ秒数, 見積もったトークン数) を返す"""
+        estimate = messages_tokens(messages) if self.token_bucket is not None else 0
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.reserve(estimate))
+        if wait:
+            self.metrics.add("throttle_wait", wait)
+        return wait, estimate
+
+    def _settle(self, estimate: int, response: Any) -> None:
+        if self.token_bucket is None:
+            return
+        usage = getattr(response, "usage_metadata", None) or {}
+        actual = usage.get("total_tokens")
+        if actual:
+            self.token_bucket.adjust(estimate - actual)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    # 同期
+
+    def _call(self, messages: Sequence[Any], config: Optional[RunnableConfig]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            wait, estimate = self._reserve(messages)
+            if wait:
+                time.sleep(wait)
+            start = time.perf_counter()
+            try:
+                self.metrics.add("upstream")
+                response = self.inner.invoke(messages, config)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.metrics.add("failures")
+                    raise
+                self.metrics.add("retries")
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self.metrics.latency(time.perf_counter() - start)
+            self._settle(estimate, response)
+            return response
+
+    def _single_flight(self, key: Optional[str]) -> Tuple[concurrent.futures.Future, bool]:
+        """(Future, 自分が実行する側か) を返す"""
+        if key is None:
+            return concurrent.futures.Future(), True
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.metrics.add("coalesced")
+                return future, False
+            future = self._inflight[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: Optional[str], future: concurrent.futures.Future, result: Any = None,
+                error: Optional[BaseException] = None) -> None:
+        if key is not None:
+            with self._lock:
+                self._inflight.pop(key, None)
+        if error is not None and not isinstance(error, Exception):
+            # CancelledError / KeyboardInterrupt は相乗りした側に伝えず、呼び出し直させる
+            error = _LeaderCancelled()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _copy(response: Any) -> Any:
+        """相乗りした呼び出し元には、共有しないよう応答のコピーを返す"""
+        copy = getattr(response, "model_copy", None)
+        return copy() if copy is not None else response
+
+    def invoke(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Any:
+        self.metrics.add("calls")
+        key = self.request_key(messages) if self.coalesce else None
+        while True:
+            future, leader = self._single_flight(key)
+            if leader:
+                break
+            try:
+                return self._copy(future.result())
+            except _LeaderCancelled:
+                continue
+        try:
+            response = self._call(messages, config)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response)
+        return response
+
+    def stream(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Iterator[Any]:
+        """ストリーミングは流量制限のみ適用する（途中まで受け取った応答はリトライできないため）"""
+        self.metrics.add("calls")
+        wait, estimate = self._reserve(messages)
+        if wait:
+            time.sleep(wait)
+        self.metrics.add("upstream")
+        response = None
+        for chunk in self.inner.stream(messages, config):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        self._settle(estimate, response)
+
+    # 非同期
+
+    async def _acall_once(self, messages: Sequence[Any], config: Optional[RunnableConfig]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            wait, estimate = self._reserve(messages)
+            if wait:
+                await asyncio.sleep(wait)
+            start = time.perf_counter()
+            try:
+                self.metrics.add("upstream")
+                response = await self.inner.ainvoke(messages, config)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.metrics.add("failures")
+                    raise
+                self.metrics.add("retries")
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self.metrics.latency(time.perf_counter() - start)
+            self._settle(estimate, response)
+            return response
+
+    async def _acall(self, messages: Sequence[Any], config: Optional[RunnableConfig]) -> Any:
+        if self.hedge_after is None:
+            return await self._acall_once(messages, config)
+        primary = asyncio.ensure_future(self._acall_once(messages, config))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self.metrics.add("hedges")
+        hedge = asyncio.ensure_future(self._acall_once(messages, config))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if succeeded[0] is hedge:
+                        self.metrics.add("hedge_wins")
+                    return succeeded[0].result()
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Any:
+        self.metrics.add("calls")
+        key = self.request_key(messages) if self.coalesce else None
+        while True:
+            future, leader = self._single_flight(key)
+            if leader:
+                break
+            try:
+                # shield: 相乗りした側がキャンセルされても、共有の Future はキャンセルしない
+                waiter = asyncio.wrap_future(future)
+                waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+                return self._copy(await asyncio.shield(waiter))
+            except _LeaderCancelled:
+                continue
+        try:
+            response = await self._acall(messages, config)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response)
+        return response
+
+    async def astream(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> AsyncIterator[Any]:
+        """stream の非同期版"""
+        self.metrics.add("calls")
+        wait, estimate = self._reserve(messages)
+        if wait:
+            await asyncio.sleep(wait)
+        self.metrics.add("upstream")
+        response = None
+        async for chunk in self.inner.astream(messages, config):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        self._settle(estimate, response)
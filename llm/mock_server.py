@@ -0,0 +1,302 @@
+"""
+OpenAI互換のモックサーバー: /v1/chat/completions をローカルで提供する
+システムプロンプトに応じた台本の応答（llm.fake.DEFAULT_WORKFLOW_SCRIPT）を返し、
+レイテンシの分布、ストリーミング（SSE）、429・5xxエラーの注入、1分あたりのリクエスト数の制限を設定できます。
+ChatOpenAI(base_url="http://127.0.0.1:8000/v1") を向けると、ネットワークなしでワークフロー全体に負荷をかけられます。
+
+実行例（リポジトリのルートで）:
+    python -m llm.mock_server --port 8000 --latency lognormal:0.3:0.5 --error-rate 0.01 --rate-limit-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm.fake import DEFAULT_WORKFLOW_SCRIPT, scripted_response, split_tokens
+from utils.tokens import approx_token_count
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    レイテンシ（秒）の分布。
+
+    kind: "fixed"（mean）、"uniform"（low〜high）、"normal"（mean, stddev）、
+          "lognormal"（中央値 mean, 対数の標準偏差 stddev）、"exponential"（平均 mean）
+    """
+
+    kind: str = "fixed"
+    mean: float = 0.0
+    stddev: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """"fixed:0.2" / "uniform:0.1:0.5" / "normal:0.3:0.1" / "lognormal:0.3:0.5" / "exponential:0.2" 形式"""
+        kind, *values = spec.split(":")
+        numbers = [float(v) for v in values]
+        if kind == "uniform":
+            return cls(kind, low=numbers[0], high=numbers[1])
+        return cls(kind, mean=numbers[0] if numbers else 0.0, stddev=numbers[1] if len(numbers) > 1 else 0.0)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.low, self.high)
+        elif self.kind == "normal":
+            value = rng.gauss(self.mean, self.stddev)
+        elif self.kind == "lognormal":
+            value = self.mean * rng.lognormvariate(0.0, self.stddev) if self.mean > 0 else 0.0
+        elif self.kind == "exponential":
+            value = rng.expovariate(1.0 / self.mean) if self.mean > 0 else 0.0
+        else:
+            value = self.mean
+        return max(value, 0.0)
+
+
+@dataclass
+class MockServerConfig:
+    """
+    モックサーバーの動作設定。
+
+    latency: 応答（ストリーミングでは最初の断片）までの時間の分布。
+    token_latency: ストリーミングの断片ごとの間隔の分布。
+    error_rate / rate_limit_rate: 500エラー / 429エラーを返す確率。
+    requests_per_minute: 指定した場合、直近60秒のリクエスト数が上限を超えると429を返す。
+    model_latency: リクエストの model ごとに latency を上書きする（モデルの振り分けの検証用）。
+    """
+
+    script: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_WORKFLOW_SCRIPT))
+    default_response: str = "OK"
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    token_latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    requests_per_minute: Optional[int] = None
+    model: str = "mock-gpt"
+    model_latency: Dict[str, LatencyDistribution] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+
+class MockServerStats:
+    """リクエスト数・エラー数・同時実行数・接続数の集計"""
+
+    def __init__(self):
+        self.requests = 0
+        self.streamed = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections: Set[Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+
+    def begin(self, client: Optional[Tuple[str, int]], stream: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.streamed += int(stream)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if client is not None:
+                self.connections.add(client)
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "streamed": self.streamed,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                # クライアントのTCP接続数（コネクションプールが効いていれば requests より十分小さい）
+                "connections": len(self.connections),
+            }
+
+
+def _system_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        if message.get("role") in ("system", "developer"):
+            content = message.get("content")
+            parts.append(content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+    return "\n".join(parts)
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(approx_token_count(str(m.get("content", ""))) for m in messages)
+
+
+def create_app(config: Optional[MockServerConfig] = None) -> FastAPI:
+    """モックサーバーの FastAPI アプリを作成する（統計は app.state.stats）"""
+    config = config or MockServerConfig()
+    app = FastAPI(title="agents_arcadia mock OpenAI server")
+    stats = MockServerStats()
+    rng = random.Random(config.seed)
+    window: Deque[float] = deque()
+    window_lock = threading.Lock()
+    app.state.stats = stats
+    app.state.config = config
+
+    def over_rate_limit() -> bool:
+        if config.requests_per_minute is None:
+            return False
+        now = time.monotonic()
+        with window_lock:
+            while window and now - window[0] > 60.0:
+                window.popleft()
+            if len(window) >= config.requests_per_minute:
+                return True
+            window.append(now)
+            return False
+
+    def error(status: int, message: str, kind: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+        return JSONResponse({"error": {"message": message, "type": kind, "code": status}}, status_code=status, headers=headers)
+
+    @app.get("/v1/models")
+    async def models() -> Dict[str, Any]:
+        return {"object": "list", "data": [{"id": config.model, "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/stats")
+    async def get_stats() -> Dict[str, Any]:
+        return stats.to_dict()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        client = (request.client.host, request.client.port) if request.client else None
+        stats.begin(client, stream)
+        # ストリーミング応答では、送信が終わった時点で _stream_events が stats.end() を呼ぶ
+        handed_off = False
+        try:
+            if over_rate_limit() or rng.random() < config.rate_limit_rate:
+                stats.count("rate_limited")
+                return error(429, "Rate limit reached (mock)", "rate_limit_exceeded",
+                             {"retry-after": str(config.retry_after)})
+            if rng.random() < config.error_rate:
+                stats.count("errors")
+                return error(500, "Internal server error (mock)", "server_error")
+
+            messages = body.get("messages", [])
+            text = scripted_response(config.script, _system_text(messages), config.default_response)
+            model = body.get("model", config.model)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            prompt_tokens = _prompt_tokens(messages)
+            completion_tokens = len(split_tokens(text))
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            first_delay = config.model_latency.get(model, config.latency).sample(rng)
+
+            if stream:
+                delays = [config.token_latency.sample(rng) for _ in split_tokens(text)]
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                handed_off = True
+                return StreamingResponse(
+                    _stream_events(completion_id, model, text, usage if include_usage else None, first_delay, delays, stats),
+                    media_type="text/event-stream",
+                )
+
+            await asyncio.sleep(first_delay)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+        finally:
+            if not handed_off:
+                stats.end()
+
+    return app
+
+
+async def _stream_events(
+    completion_id: str,
+    model: str,
+    text: str,
+    usage: Optional[Dict[str, int]],
+    first_delay: float,
+    delays: List[float],
+    stats: MockServerStats,
+) -> AsyncIterator[str]:
+    """chat.completion.chunk の SSE イベントを送出する"""
+    created = int(time.time())
+
+    def event(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            **extra,
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    try:
+        await asyncio.sleep(first_delay)
+        yield event({"role": "assistant", "content": ""})
+        for token, delay in zip(split_tokens(text), delays):
+            if delay:
+                await asyncio.sleep(delay)
+            yield event({"content": token})
+        yield event({}, "stop")
+        if usage is not None:
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        stats.end()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0", help="応答までの時間の分布（例: lognormal:0.3:0.5）")
+    parser.add_argument("--token-latency", default="fixed:0", help="ストリーミングの断片ごとの間隔の分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500エラーを返す確率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429エラーを返す確率")
+    parser.add_argument("--rpm", type=int, default=None, help="1分あたりのリクエスト数の上限（超えると429）")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = MockServerConfig(
+        latency=LatencyDistribution.parse(args.latency),
+        token_latency=LatencyDistribution.parse(args.token_latency),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        requests_per_minute=args.rpm,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
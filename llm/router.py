@@ -0,0 +1,293 @@
+"""
+ModelRouter: ノード・エージェントごとに使うモデルを振り分け、遅いモデル・失敗の多いモデルを避ける
+抽出だけを行う FileOperationAgent / CommandGenerationAgent には小さく速いモデルを、
+CodingAgent / PlanningAgent には大きなモデルを割り当てる、といった構成を routes で指定します。
+モデルごとに直近のレイテンシと成否を記録し、p95 レイテンシやエラー率がしきい値を超えたモデルは
+cooldown 秒のあいだ候補から外して次のモデルにフェイルオーバーします。
+振り分けの結果はトレースの "llm.route" スパン（model / reason / skipped）に記録されます。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from utils.budget import current_node
+from utils.stats import latency_summary, percentile
+from utils.tracing import span
+
+
+class ModelHealth:
+    """1つのモデルについて、直近 window 回の呼び出しのレイテンシと成否を保持する"""
+
+    def __init__(self, window: int = 50):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.unhealthy_until = 0.0
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.samples.append((seconds, ok))
+            self.calls += 1
+            self.errors += int(not ok)
+
+    def p95(self) -> float:
+        with self._lock:
+            return percentile([s for s, ok in self.samples if ok], 95)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.samples:
+                return 0.0
+            return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = [s for s, ok in self.samples if ok]
+            failed = sum(1 for _, ok in self.samples if not ok)
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "error_rate": failed / len(self.samples) if self.samples else 0.0,
+                "latency": latency_summary(latencies),
+                "unhealthy": self.reason if self.unhealthy_until > time.monotonic() else None,
+            }
+
+
+class ModelRouter:
+    """
+    名前付きのモデル群と、ノード・エージェントごとの候補の並び（routes）を保持する。
+
+    models: モデル名 -> モデル、またはモデルを返す引数なしの関数（初回利用時に生成する）。
+    routes: ノード名またはエージェント名 -> モデル名のリスト（先頭が第一候補）。
+        ノード名（config の metadata の langgraph_node）、エージェント名、"default" の順に探す。
+    max_p95 / max_error_rate: 直近 min_samples 回以上の記録があり、これらを超えたモデルを不調とみなす。
+    cooldown: 不調とみなしたモデルを候補から外す秒数。経過後は記録を消して再び試す。
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, Any],
+        routes: Dict[str, List[str]],
+        max_p95: Optional[float] = None,
+        max_error_rate: Optional[float] = 0.5,
+        min_samples: int = 10,
+        window: int = 50,
+        cooldown: float = 30.0,
+    ):
+        unknown = {name for route in routes.values() for name in route} - set(models)
+        if unknown:
+            raise ValueError(f"routes refer to unknown models: {sorted(unknown)}")
+        if "default" not in routes:
+            raise ValueError("routes must include a 'default' route")
+        self._models = dict(models)
+        self.routes = {key: list(route) for key, route in routes.items()}
+        self.max_p95 = max_p95
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.health = {name: ModelHealth(window) for name in models}
+        self._lock = threading.Lock()
+
+    def model(self, name: str) -> Any:
+        """モデルを取得する。関数が登録されていれば初回に呼び出して生成する"""
+        model = self._models[name]
+        if callable(model) and not hasattr(model, "invoke"):
+            with self._lock:
+                model = self._models[name]
+                if callable(model) and not hasattr(model, "invoke"):
+                    model = self._models[name] = model()
+        return model
+
+    def route_for(self, agent: str, config: Optional[RunnableConfig] = None) -> List[str]:
+        node = current_node(config, default="")
+        return self.routes.get(node) or self.routes.get(agent) or self.routes["default"]
+
+    def _check(self, name: str) -> Optional[str]:
+        """しきい値を超えていれば理由を返し、cooldown の間は不調として扱う"""
+        health = self.health[name]
+        now = time.monotonic()
+        if health.unhealthy_until > now:
+            return health.reason
+        if health.unhealthy_until:
+            # cooldown が明けたら過去の記録を捨てて再び試す
+            with health._lock:
+                health.samples.clear()
+                health.unhealthy_until = 0.0
+                health.reason = None
+            return None
+        if len(health.samples) < self.min_samples:
+            return None
+        reason = None
+        error_rate = health.error_rate()
+        p95 = health.p95()
+        if self.max_error_rate is not None and error_rate > self.max_error_rate:
+            reason = f"error_rate {error_rate:.2f} > {self.max_error_rate:.2f}"
+        elif self.max_p95 is not None and p95 > self.max_p95:
+            reason = f"p95 {p95:.2f}s > {self.max_p95:.2f}s"
+        if reason is not None:
+            with health._lock:
+                health.unhealthy_until = now + self.cooldown
+                health.reason = reason
+        return reason
+
+    def candidates(self, agent: str, config: Optional[RunnableConfig] = None) -> Tuple[List[str], Dict[str, str]]:
+        """
+        (試す順のモデル名, 候補から外したモデル名 -> 理由) を返す。
+        すべてが不調なら、並びのとおりにすべてを試す。
+        """
+        route = self.route_for(agent, config)
+        skipped = {}
+        healthy = []
+        for name in route:
+            reason = self._check(name)
+            if reason is None:
+                healthy.append(name)
+            else:
+                skipped[name] = reason
+        return (healthy or route), skipped
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        self.health[name].record(seconds, ok)
+
+    def for_agent(self, agent: str) -> "RoutedChatModel":
+        return RoutedChatModel(self, agent)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: health.stats() for name, health in self.health.items()}
+
+
+class RoutedChatModel:
+    """
+    ModelRouter をエージェントから1つのモデルとして使うためのラッパー。
+    invoke / ainvoke では候補のモデルを順に試し、失敗したら次のモデルにフェイルオーバーする。
+    stream / astream は最初の断片を受け取る前の失敗に限ってフェイルオーバーする。
+    """
+
+    def __init__(self, router: ModelRouter, agent: str):
+        self.router = router
+        self.agent = agent
+
+    def cache_model(self, config: Optional[RunnableConfig] = None) -> Any:
+        """
+        キャッシュのキーに使うモデル（ノードの routes を考慮した第一候補）。
+        第一候補以外が答えた応答には _mark で no_cache を付け、このキーでは保存させない。
+        """
+        return self.router.model(self.router.route_for(self.agent, config)[0])
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return getattr(self.cache_model(), "_identifying_params", {})
+
+    @staticmethod
+    def _mark(message: Any, span_args: Dict[str, Any]) -> Any:
+        reason = span_args["reason"]
+        metadata = getattr(message, "response_metadata", None)
+        if reason != "primary" and isinstance(metadata, dict):
+            metadata["no_cache"] = f"{reason}:{span_args['model']}"
+        return message
+
+    def _route(self, span_args: Dict[str, Any], config: Optional[RunnableConfig]) -> List[str]:
+        names, skipped = self.router.candidates(self.agent, config)
+        span_args["candidates"] = names
+        if skipped:
+            span_args["skipped"] = skipped
+        return names
+
+    def _chosen(self, span_args: Dict[str, Any], names: List[str], name: str, failed: List[str]) -> None:
+        span_args["model"] = name
+        if failed:
+            span_args["reason"] = "failover"
+            span_args["failed"] = failed
+        elif name != names[0] or span_args.get("skipped"):
+            span_args["reason"] = "unhealthy_primary"
+        else:
+            span_args["reason"] = "primary"
+
+    def invoke(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Any:
+        with span("llm.route", "llm", agent=self.agent) as span_args:
+            names = self._route(span_args, config)
+            failed: List[str] = []
+            for i, name in enumerate(names):
+                start = time.perf_counter()
+                try:
+                    response = self.router.model(name).invoke(messages, config)
+                except Exception:
+                    self.router.record(name, time.perf_counter() - start, False)
+                    failed.append(name)
+                    if i == len(names) - 1:
+                        raise
+                    continue
+                self.router.record(name, time.perf_counter() - start, True)
+                self._chosen(span_args, names, name, failed)
+                return self._mark(response, span_args)
+
+    async def ainvoke(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Any:
+        with span("llm.route", "llm", agent=self.agent) as span_args:
+            names = self._route(span_args, config)
+            failed: List[str] = []
+            for i, name in enumerate(names):
+                start = time.perf_counter()
+                try:
+                    response = await self.router.model(name).ainvoke(messages, config)
+                except Exception:
+                    self.router.record(name, time.perf_counter() - start, False)
+                    failed.append(name)
+                    if i == len(names) - 1:
+                        raise
+                    continue
+                self.router.record(name, time.perf_counter() - start, True)
+                self._chosen(span_args, names, name, failed)
+                return self._mark(response, span_args)
+
+    def stream(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> Iterator[Any]:
+        with span("llm.route", "llm", agent=self.agent) as span_args:
+            names = self._route(span_args, config)
+            failed: List[str] = []
+            for i, name in enumerate(names):
+                start = time.perf_counter()
+                started = False
+                try:
+                    for chunk in self.router.model(name).stream(messages, config):
+                        if not started:
+                            started = True
+                            self._chosen(span_args, names, name, failed)
+                            chunk = self._mark(chunk, span_args)
+                        yield chunk
+                except Exception:
+                    self.router.record(name, time.perf_counter() - start, False)
+                    failed.append(name)
+                    if started or i == len(names) - 1:
+                        raise
+                    continue
+                self.router.record(name, time.perf_counter() - start, True)
+                return
+
+    async def astream(self, messages: Sequence[Any], config: Optional[RunnableConfig] = None) -> AsyncIterator[Any]:
+        with span("llm.route", "llm", agent=self.agent) as span_args:
+            names = self._route(span_args, config)
+            failed: List[str] = []
+            for i, name in enumerate(names):
+                start = time.perf_counter()
+                started = False
+                try:
+                    async for chunk in self.router.model(name).astream(messages, config):
+                        if not started:
+                            started = True
+                            self._chosen(span_args, names, name, failed)
+                            chunk = self._mark(chunk, span_args)
+                        yield chunk
+                except Exception:
+                    self.router.record(name, time.perf_counter() - start, False)
+                    failed.append(name)
+                    if started or i == len(names) - 1:
+                        raise
+                    continue
+                self.router.record(name, time.perf_counter() - start, True)
+                return
+
@@ -9,6 +9,12 @@ from typing import Annotated
 
 from typing import TypedDict
 
+
+def _first_reason(current: Optional[str], update: Optional[str]) -> Optional[str]:
+    """並列に実行したノードがそれぞれ予算切れを報告しても、最初の理由を残す"""
+    return current or update
+
+
 class AgentState(TypedDict):
     """エージェントの状態を表現するTypedDict"""
     messages: Annotated[Sequence[BaseMessage], add_messages]
@@ -16,5 +22,7 @@ class AgentState(TypedDict):
     review_result: Optional[str]       # レビュー結果
     coding_result: Optional[dict]      # コーディング結果（ファイルパスとコードを含む）
     existing_code: Optional[str]       # 既存のコードを保持
+    code_context: Optional[str]        # シンボル索引から選んだ、タスクに関連する既存コードの抜粋
     target_file_path: Optional[str]    # 対象のファイルパス 
-    generated_command: Optional[str]   # 生成されたコマンド
\ No newline at end of file
+    generated_command: Optional[str]   # 生成されたコマンド
+    budget_exhausted: Annotated[Optional[str], _first_reason]  # 実行の予算を使い切った理由（utils.budget.RunBudget）
\ No newline at end of file
@@ -3,120 +3,363 @@
 """
 from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableConfig, RunnableLambda
-from agents.coding_agent import CodingAgent
+from agents.coding_agent import CodeStreamResult, CodingAgent, PatchEditResult
 from agents.planning_agent import PlanningAgent
 from agents.review_agent import ReviewAgent
 from agents.file_operation_agent import FileOperationAgent
 from agents.command_generation_agent import CommandGenerationAgent
 from tools.file_read_tool import FileReadTool
+from tools.symbol_index import SymbolIndex
 from models.agent_state import AgentState
 from models.code_result import CodeResult
-from typing import Any, Optional
+from typing import Any, Optional, Tuple, TYPE_CHECKING
+from concurrent.futures import Future, ThreadPoolExecutor
 from pydantic import ValidationError
+import contextvars
 import json
 import logging
+import time
 from agents.terminal_agent import TerminalAgent
-from agents.browser_agent import BrowserAgent
+from agents.registry import resolve_agent
+from utils.context_manager import compact_messages
+from utils.log import preview
+from utils.blob_store import resolve_blob, resolve_messages, store_large
+from utils.loop_bridge import run_sync
+from utils.speculation import SpeculationMetrics
 import asyncio
 
-logging.basicConfig(level=logging.DEBUG)
+if TYPE_CHECKING:
+    # browser_use / Playwright の読み込みは重いため、型チェック時のみimportする
+    from agents.browser_agent import BrowserAgent
+
+logger = logging.getLogger(__name__)
+
+def _task_text(state: AgentState) -> str:
+    """ユーザーのタスク（HumanMessage）と要件定義をまとめたテキスト"""
+    parts = [m.content for m in state.get("messages", []) if m.type == "human" and isinstance(m.content, str)]
+    if state.get("requirements"):
+        parts.append(state["requirements"])
+    return "\n".join(parts)
+
+def _select_code_context(state: AgentState, config: RunnableConfig) -> Optional[str]:
+    """
+    config に symbol_index が設定されていれば、タスクに関連するシンボルの抜粋を
+    code_context_budget（デフォルト4000トークン）の範囲で選ぶ。
+    抜粋は参考として渡すもので、出力先のファイルは常に全体を existing_code として渡す
+    （抜粋だけを渡すと、ファイル全体を生成するモードで抜粋に含まれない部分が消えるため）。
+    """
+    configurable = config.get("configurable", {})
+    index: Optional[SymbolIndex] = configurable.get("symbol_index")
+    if index is None:
+        return None
+    context = index.select_context(_task_text(state), configurable.get("code_context_budget", 4000))
+    if not context.symbols:
+        return None
+    logger.info(
+        "read_code_node - symbols=%d tokens=%d update=%.1fms query=%.1fms",
+        len(context.symbols), context.tokens, context.update_time * 1000, context.query_time * 1000,
+    )
+    return context.text
+
+def _read_code_update(config: RunnableConfig, file_content: str, code_context: Optional[str], target_file_path: str) -> dict:
+    update = {
+        "existing_code": store_large(config, file_content),
+        "target_file_path": target_file_path
+    }
+    if code_context is not None:
+        update["code_context"] = store_large(config, code_context)
+    return update
 
 def read_code_node(state: AgentState, config: RunnableConfig):
     """
     /generate フォルダ内の指定ファイルを読み込むノード
+    symbol_index が設定されている場合は、関連するシンボルの抜粋も code_context として渡す。
     """
-    target_file_path = "generate/target.py"  # 修正対象のファイルパス（適宜変更可）
+    target_file_path = config.get("configurable", {}).get("target_file_path", "generate/target.py")
+
+    code_context = _select_code_context(state, config)
 
-    file_read_tool: FileReadTool = config["configurable"].get("file_read_tool")
-    if file_read_tool is None:
-        raise ValueError("FileReadTool is not configured")
+    file_read_tool: FileReadTool = resolve_agent(config, "file_read_tool")
 
     file_content = file_read_tool.run(target_file_path)
 
+    return _read_code_update(config, file_content, code_context, target_file_path)
+
+async def aread_code_node(state: AgentState, config: RunnableConfig):
+    """非同期版read_code_node（読み込みと索引の更新はスレッドで行い、イベントループを止めない）"""
+    target_file_path = config.get("configurable", {}).get("target_file_path", "generate/target.py")
+
+    code_context = await asyncio.to_thread(_select_code_context, state, config)
+
+    file_read_tool: FileReadTool = resolve_agent(config, "file_read_tool")
+
+    file_content = await file_read_tool.arun(target_file_path)
+
+    return _read_code_update(config, file_content, code_context, target_file_path)
+
+def _code_stream_emitter():
+    """
+    書き込んだコード片を graph.stream(..., stream_mode="custom") のイベントとして送出する関数を返す。
+    グラフの外から呼ばれた場合は None。
+    """
+    try:
+        from langgraph.config import get_stream_writer
+        writer = get_stream_writer()
+    except RuntimeError:
+        return None
+
+    def emit(file_path: str, text: str) -> None:
+        writer({"coding_stream": {"file_path": file_path, "text": text}})
+
+    return emit
+
+def _streamed_coding_update(config: RunnableConfig, streamed: CodeStreamResult, target_file_path: str) -> dict:
+    """ストリーミング生成の結果を coding_node の戻り値に変換する"""
+    code = store_large(config, streamed.text)
     return {
-        "existing_code": file_content,
-        "target_file_path": target_file_path
+        "messages": [code],
+        "coding_result": {
+            "code": code,
+            "file_path": target_file_path,
+            "written_files": streamed.files,
+            "stream_stats": streamed.stats.to_dict(),
+        }
     }
 
-async def acoding_node(state: AgentState, config: RunnableConfig):
-    """非同期版coding_node"""
-    agent: CodingAgent = config["configurable"]["coding_agent"]
-    messages = state["messages"]
-
-    existing_code = state.get("existing_code", "")
+def _existing_code_message(state: AgentState, config: RunnableConfig, target_file_path: str) -> HumanMessage:
+    """コーディングエージェントに渡す既存コードのメッセージ（blob_store の参照はここで内容に戻す）"""
+    content = f"以下は {target_file_path} の現在の内容です:\n\n{resolve_blob(config, state.get('existing_code', ''))}"
+    if state.get("code_context"):
+        content += (
+            "\n\n参考として、タスクに関連する既存のコードの抜粋を示します（他のファイルを含みます。変更は出力先のファイルにのみ行ってください）:"
+            f"\n\n{resolve_blob(config, state['code_context'])}"
+        )
+    return HumanMessage(content=content)
+
+def _coding_messages(state: AgentState, config: RunnableConfig) -> Tuple[list, str]:
+    """コーディングエージェントに渡すメッセージと出力先のファイルパス"""
     target_file_path = state.get("target_file_path", "generate/target.py")
 
-    messages_to_pass = list(messages)
-    messages_to_pass.append(
-        HumanMessage(content=f"以下は {target_file_path} の現在の内容です:\n\n{existing_code}")
-    )
+    messages_to_pass = list(state["messages"])
+    messages_to_pass.append(_existing_code_message(state, config, target_file_path))
 
-    response_str = await agent.arun(messages_to_pass, config)
+    return compact_messages(config, "coding_agent", messages_to_pass), target_file_path
 
+def _full_coding_update(config: RunnableConfig, response_str: str, target_file_path: str) -> dict:
+    """ファイル全体を生成した結果を coding_node の戻り値に変換する（書き込みは file_operation_node が行う）"""
+    code = store_large(config, response_str)
     return {
-        "messages": [response_str],
+        "messages": [code],
         "coding_result": {
-            "code": response_str,
+            "code": code,
             "file_path": target_file_path
         }
     }
 
+def _patched_coding_update(config: RunnableConfig, edit: PatchEditResult, target_file_path: str) -> dict:
+    """差分モードの結果を coding_node の戻り値に変換する"""
+    code = store_large(config, edit.text)
+    return {
+        "messages": [code],
+        "coding_result": {
+            "code": code,
+            "file_path": target_file_path,
+            "written_files": edit.files,
+            "patch_stats": {
+                "patch_tokens": edit.patch_tokens,
+                "full_file_tokens": edit.full_file_tokens,
+                "saved_tokens": edit.full_file_tokens - edit.patch_tokens,
+            },
+        }
+    }
+
+async def acoding_node(state: AgentState, config: RunnableConfig):
+    """非同期版coding_node"""
+    agent: CodingAgent = resolve_agent(config, "coding_agent")
+    messages_to_pass, target_file_path = _coding_messages(state, config)
+
+    if config.get("configurable", {}).get("edit_mode") == "patch":
+        edit = await agent.arun_patch(messages_to_pass, config, default_path=target_file_path)
+        if edit.applied:
+            return _patched_coding_update(config, edit, target_file_path)
+        logger.warning("差分を適用できないため、ファイル全体を生成します: %s", edit.error)
+
+    if config.get("configurable", {}).get("stream_code"):
+        streamed = await agent.astream_to_files(
+            messages_to_pass, config, default_path=target_file_path, on_write=_code_stream_emitter()
+        )
+        return _streamed_coding_update(config, streamed, target_file_path)
+
+    response_str = await agent.arun(messages_to_pass, config)
+
+    return _full_coding_update(config, response_str, target_file_path)
+
 def coding_node(state: AgentState, config: RunnableConfig):
     """同期版coding_node"""
-    agent: CodingAgent = config["configurable"]["coding_agent"]
-    messages = state["messages"]
+    agent: CodingAgent = resolve_agent(config, "coding_agent")
+    messages_to_pass, target_file_path = _coding_messages(state, config)
 
-    existing_code = state.get("existing_code", "")
-    target_file_path = state.get("target_file_path", "generate/target.py")
+    if config.get("configurable", {}).get("edit_mode") == "patch":
+        edit = agent.run_patch(messages_to_pass, config, default_path=target_file_path)
+        if edit.applied:
+            return _patched_coding_update(config, edit, target_file_path)
+        logger.warning("差分を適用できないため、ファイル全体を生成します: %s", edit.error)
 
-    messages_to_pass = list(messages)
-    messages_to_pass.append(
-        HumanMessage(content=f"以下は {target_file_path} の現在の内容です:\n\n{existing_code}")
-    )
+    if config.get("configurable", {}).get("stream_code"):
+        streamed = agent.stream_to_files(
+            messages_to_pass, config, default_path=target_file_path, on_write=_code_stream_emitter()
+        )
+        return _streamed_coding_update(config, streamed, target_file_path)
 
     response_str = agent.run(messages_to_pass, config)
 
-    return {
-        "messages": [response_str],
-        "coding_result": {
-            "code": response_str,
-            "file_path": target_file_path
-        }
-    }
+    return _full_coding_update(config, response_str, target_file_path)
 
 def planning_node(state: AgentState, config: RunnableConfig):
     """同期版planning_node"""
-    agent: PlanningAgent = config["configurable"]["planning_agent"]
-    messages = state["messages"]
+    agent: PlanningAgent = resolve_agent(config, "planning_agent")
+    messages = compact_messages(config, "planning_agent", state["messages"])
     response = agent.run(messages, config)
     return {"messages": [response], "requirements": response.content}
 
 async def aplanning_node(state: AgentState, config: RunnableConfig):
     """非同期版planning_node"""
-    agent: PlanningAgent = config["configurable"]["planning_agent"]
-    messages = state["messages"]
+    agent: PlanningAgent = resolve_agent(config, "planning_agent")
+    messages = compact_messages(config, "planning_agent", state["messages"])
     response = await agent.arun(messages, config)
     return {"messages": [response], "requirements": response.content}
 
+def review_approved(review_result: Optional[str]) -> bool:
+    """レビューが要件を承認したか（"Please revise" を含まなければ承認）"""
+    return "Please revise" not in (review_result or "")
+
+def _can_speculate(config: RunnableConfig) -> bool:
+    """
+    configurable の speculative_coding が有効で、コーディングがファイルを書き換えないモードのときだけ投機する。
+    stream_code / edit_mode="patch" では生成中にファイルへ書き込むため、レビューが修正を求めても破棄できない。
+    """
+    configurable = config.get("configurable", {})
+    return bool(configurable.get("speculative_coding")) and not configurable.get("stream_code") \
+        and configurable.get("edit_mode") != "patch"
+
+def _as_coding_node(config: RunnableConfig) -> RunnableConfig:
+    """投機的なコーディングのLLM呼び出しを coding ノードの消費として扱う（予算の記録・モデルの振り分け）"""
+    return {**config, "metadata": {**config.get("metadata", {}), "langgraph_node": "coding"}}
+
+# 同期実行でレビューと並行してコーディングするスレッド
+_speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative-coding")
+
+def _speculative_coding(state: AgentState, config: RunnableConfig) -> Tuple[dict, float]:
+    """レビュー前の要件でコーディングし、(coding_node と同じ戻り値, 所要時間) を返す"""
+    agent: CodingAgent = resolve_agent(config, "coding_agent")
+    messages_to_pass, target_file_path = _coding_messages(state, config)
+    start = time.perf_counter()
+    response_str = agent.run(messages_to_pass, _as_coding_node(config))
+    return _full_coding_update(config, response_str, target_file_path), time.perf_counter() - start
+
+async def _aspeculative_coding(state: AgentState, config: RunnableConfig) -> Tuple[dict, float]:
+    """_speculative_coding の非同期版"""
+    agent: CodingAgent = resolve_agent(config, "coding_agent")
+    messages_to_pass, target_file_path = _coding_messages(state, config)
+    start = time.perf_counter()
+    response_str = await agent.arun(messages_to_pass, _as_coding_node(config))
+    return _full_coding_update(config, response_str, target_file_path), time.perf_counter() - start
+
+def _speculation_metrics(config: RunnableConfig) -> SpeculationMetrics:
+    agent: CodingAgent = resolve_agent(config, "coding_agent")
+    return agent.speculation_metrics
+
+def _commit_speculation(update: dict, coding_update: dict, review_elapsed: float, coding_elapsed: float,
+                        metrics: SpeculationMetrics) -> dict:
+    """承認されたレビューの結果に、投機したコーディングの結果を合わせる（coding ノードは実行されない）"""
+    saved = metrics.record_hit(review_elapsed, coding_elapsed)
+    logger.info("review_node - 投機的なコーディングを採用しました（短縮 %.2fs）", saved)
+    coding_result = {
+        **coding_update["coding_result"],
+        "speculation": {"review": review_elapsed, "coding": coding_elapsed, "saved": saved},
+    }
+    return {**update, "messages": [*update["messages"], *coding_update["messages"]], "coding_result": coding_result}
+
 def review_node(state: AgentState, config: RunnableConfig):
-    """同期版review_node"""
-    agent: ReviewAgent = config["configurable"]["review_agent"]
-    messages = state["messages"]
-    messages.append(
-        HumanMessage(content=f"以下の要件をご確認ください:\n{state['requirements']}")
-    )
-    response = agent.run(messages, config)
-    return {"messages": [response], "review_result": response.content}
+    """
+    同期版review_node
+    speculative_coding が有効なら、レビューと並行して現在の要件でコーディングし、
+    承認されればその結果を coding_result として返す（修正を求められれば破棄する）。
+    """
+    agent: ReviewAgent = resolve_agent(config, "review_agent")
+    review_request = HumanMessage(content=f"以下の要件をご確認ください:\n{state['requirements']}")
+    messages = compact_messages(config, "review_agent", [*state["messages"], review_request])
+    if not _can_speculate(config):
+        response = agent.run(messages, config)
+        return {"messages": [review_request, response], "review_result": response.content}
+
+    metrics = _speculation_metrics(config)
+    speculation: Future = _speculation_pool.submit(contextvars.copy_context().run, _speculative_coding, state, config)
+    start = time.perf_counter()
+    try:
+        response = agent.run(messages, config)
+    except BaseException:
+        speculation.cancel()
+        raise
+    review_elapsed = time.perf_counter() - start
+    update = {"messages": [review_request, response], "review_result": response.content}
+
+    if not review_approved(response.content):
+        if speculation.cancel():
+            metrics.record_miss(review_elapsed, None)
+        else:
+            # 実行中のスレッドは止められないため、終わった時点で結果を捨てて無駄になった時間を記録する
+            speculation.add_done_callback(
+                lambda f: metrics.record_miss(review_elapsed, f.result()[1] if f.exception() is None else None)
+            )
+        logger.info("review_node - 修正が求められたため、投機的なコーディングを破棄します")
+        return update
+
+    try:
+        coding_update, coding_elapsed = speculation.result()
+    except Exception as e:
+        metrics.record_failure(review_elapsed, e)
+        logger.warning("review_node - 投機的なコーディングが失敗したため、通常どおりコーディングします: %s", e)
+        return update
+    return _commit_speculation(update, coding_update, review_elapsed, coding_elapsed, metrics)
 
 async def areview_node(state: AgentState, config: RunnableConfig):
-    """非同期版review_node"""
-    agent: ReviewAgent = config["configurable"]["review_agent"]
-    messages = state["messages"]
-    messages.append(
-        HumanMessage(content=f"以下の要件をご確認ください:\n{state['requirements']}")
-    )
-    response = await agent.arun(messages, config)
-    return {"messages": [response], "review_result": response.content}
+    """非同期版review_node（投機的なコーディングは同じイベントループのタスクとして実行し、不要ならキャンセルする）"""
+    agent: ReviewAgent = resolve_agent(config, "review_agent")
+    review_request = HumanMessage(content=f"以下の要件をご確認ください:\n{state['requirements']}")
+    messages = compact_messages(config, "review_agent", [*state["messages"], review_request])
+    if not _can_speculate(config):
+        response = await agent.arun(messages, config)
+        return {"messages": [review_request, response], "review_result": response.content}
+
+    metrics = _speculation_metrics(config)
+    speculation = asyncio.ensure_future(_aspeculative_coding(state, config))
+    start = time.perf_counter()
+    try:
+        response = await agent.arun(messages, config)
+    except BaseException:
+        speculation.cancel()
+        raise
+    review_elapsed = time.perf_counter() - start
+    update = {"messages": [review_request, response], "review_result": response.content}
+
+    if not review_approved(response.content):
+        if speculation.done():
+            failed = speculation.cancelled() or speculation.exception() is not None
+            metrics.record_miss(review_elapsed, None if failed else speculation.result()[1])
+        else:
+            speculation.cancel()
+            metrics.record_miss(review_elapsed, time.perf_counter() - start)
+        logger.info("areview_node - 修正が求められたため、投機的なコーディングを破棄します")
+        return update
+
+    try:
+        coding_update, coding_elapsed = await speculation
+    except Exception as e:
+        metrics.record_failure(review_elapsed, e)
+        logger.warning("areview_node - 投機的なコーディングが失敗したため、通常どおりコーディングします: %s", e)
+        return update
+    return _commit_speculation(update, coding_update, review_elapsed, coding_elapsed, metrics)
 
 def file_operation_node(state: AgentState, config: RunnableConfig):
     """
@@ -124,9 +367,9 @@ def file_operation_node(state: AgentState, config: RunnableConfig):
     coding_node / acoding_node が生成した coding_result["code"] を受け取り、
     FileOperationAgent に渡して実際のファイル操作を行うか判断・実行する。
     """
-    agent: FileOperationAgent = config["configurable"]["file_operation_agent"]
+    agent: FileOperationAgent = resolve_agent(config, "file_operation_agent")
     coding_result = state.get("coding_result", {})
-    raw_text = coding_result.get("code", "")
+    raw_text = resolve_blob(config, coding_result.get("code", ""))
     file_path = coding_result.get("file_path")
 
     if not raw_text.strip():
@@ -135,15 +378,19 @@ def file_operation_node(state: AgentState, config: RunnableConfig):
     if not file_path:
         return {"file_operation_result": "ファイルパスが指定されていません。"}
 
+    # コーディングノードがストリーミングで書き込み済みの場合は何もしない
+    if coding_result.get("written_files"):
+        return {"file_operation_result": "\n".join(f"{path} にコードを書き込みました。" for path in coding_result["written_files"])}
+
     # 同期呼び出し
-    result = agent.run(f'{{"file_path": "{file_path}", "code": "{raw_text}"}}', config)
+    result = agent.run({"raw_text": raw_text, "file_path": file_path}, config)
     return {"file_operation_result": result}
 
 async def afile_operation_node(state: AgentState, config: RunnableConfig):
     """非同期版ファイル操作ノード"""
-    agent: FileOperationAgent = config["configurable"]["file_operation_agent"]
+    agent: FileOperationAgent = resolve_agent(config, "file_operation_agent")
     coding_result = state.get("coding_result", {})
-    raw_text = coding_result.get("code", "")
+    raw_text = resolve_blob(config, coding_result.get("code", ""))
     file_path = coding_result.get("file_path")
 
     if not raw_text.strip():
@@ -152,8 +399,12 @@ async def afile_operation_node(state: AgentState, config: RunnableConfig):
     if not file_path:
         return {"file_operation_result": "ファイルパスが指定されていません。"}
 
+    # コーディングノードがストリーミングで書き込み済みの場合は何もしない
+    if coding_result.get("written_files"):
+        return {"file_operation_result": "\n".join(f"{path} にコードを書き込みました。" for path in coding_result["written_files"])}
+
     # 非同期呼び出し
-    result = await agent.arun(f'{{"file_path": "{file_path}", "code": "{raw_text}"}}', config)
+    result = await agent.arun({"raw_text": raw_text, "file_path": file_path}, config)
     return {"file_operation_result": result}
 
 def should_continue(state: AgentState) -> str:
@@ -171,38 +422,34 @@ def command_generation_node(state: AgentState, config: RunnableConfig):
     """
     CommandGenerationAgent を呼び出すノード。
     """
-    agent: CommandGenerationAgent = config["configurable"]["command_generation_agent"]
+    agent: CommandGenerationAgent = resolve_agent(config, "command_generation_agent")
     messages = state.get("messages", [])
     file_operation_result = state.get("file_operation_result", "")
 
-    logging.info(f"command_generation_node - state: {state}")  # ステートの内容を出力
+    logger.debug("command_generation_node - state: %s", preview(state))  # ステートの内容を出力
 
-    messages_to_pass = list(messages)
-    messages_to_pass.append(
-        HumanMessage(content=f"ファイル操作の結果: {file_operation_result}。これに基づき、次に実行すべきコマンドを生成してください。")
-    )
+    command_request = HumanMessage(content=f"ファイル操作の結果: {file_operation_result}。これに基づき、次に実行すべきコマンドを生成してください。")
+    messages_to_pass = [*messages, command_request]
 
-    command_json = agent.run(messages_to_pass, config)
+    command_json = agent.run(compact_messages(config, "command_generation_agent", messages_to_pass), config)
 
-    logging.info(f"command_generation_node - generated_command: {command_json}")  # 生成されたコマンドを出力
+    logger.info("command_generation_node - generated_command: %s", preview(command_json))  # 生成されたコマンドを出力
 
     # JSON 文字列からコマンドを抽出
     try:
         parsed_command = json.loads(command_json)
         command = parsed_command.get("command", "")
-        logging.info("##########################")
-        logging.info(f"command_generation_node - 抽出されたコマンド: {command}")
-        logging.info("##########################")
+        logger.info("command_generation_node - 抽出されたコマンド: %s", preview(command))
     except json.JSONDecodeError:
-        logging.error(f"command_generation_node - コマンドのパースに失敗しました。")
+        logger.error("command_generation_node - コマンドのパースに失敗しました。")
         return {
-            "messages": messages_to_pass,
+            "messages": [command_request],
             "generated_command": "",  # コマンドを空にする
             "file_operation_result": file_operation_result
         }
 
     return_value = {
-        "messages": messages_to_pass,
+        "messages": [command_request],
         "generated_command": command,
         "file_operation_result": file_operation_result
     }
@@ -214,39 +461,35 @@ async def acommand_generation_node(state: AgentState, config: RunnableConfig):
     """
     CommandGenerationAgent の非同期呼び出しノード。
     """
-    agent: CommandGenerationAgent = config["configurable"]["command_generation_agent"]
+    agent: CommandGenerationAgent = resolve_agent(config, "command_generation_agent")
     messages = state.get("messages", [])
     file_operation_result = state.get("file_operation_result", "")
 
-    logging.info(f"acommand_generation_node - state: {state}")
+    logger.debug("acommand_generation_node - state: %s", preview(state))
 
     # メッセージ履歴にファイル操作の結果を追加
-    messages_to_pass = list(messages)
-    messages_to_pass.append(
-        HumanMessage(content=f"ファイル操作の結果: {file_operation_result}。これに基づき、次に実行すべきコマンドを生成してください。")
-    )
+    command_request = HumanMessage(content=f"ファイル操作の結果: {file_operation_result}。これに基づき、次に実行すべきコマンドを生成してください。")
+    messages_to_pass = [*messages, command_request]
 
-    # CommandGenerationAgent に渡す input を修正
-    # messages キーを持つ辞書として渡す
-    command_json = await agent.arun({"messages": messages_to_pass}, config)
+    command_json = await agent.arun(compact_messages(config, "command_generation_agent", messages_to_pass), config)
 
-    logging.info(f"acommand_generation_node - generated_command: {command_json}")
+    logger.info("acommand_generation_node - generated_command: %s", preview(command_json))
 
     # JSON 文字列からコマンドを抽出
     try:
         parsed_command = json.loads(command_json)
         command = parsed_command.get("command", "")
-        logging.info(f"acommand_generation_node - 抽出されたコマンド: {command}")
+        logger.info("acommand_generation_node - 抽出されたコマンド: %s", preview(command))
     except json.JSONDecodeError:
-        logging.error(f"acommand_generation_node - コマンドのパースに失敗しました。")
+        logger.error("acommand_generation_node - コマンドのパースに失敗しました。")
         return {
-            "messages": messages_to_pass,
+            "messages": [command_request],
             "generated_command": "",
             "file_operation_result": file_operation_result
         }
 
     return {
-        "messages": messages_to_pass,
+        "messages": [command_request],
         "generated_command": command,  # 文字列として渡す
         "file_operation_result": file_operation_result
     }
@@ -255,29 +498,25 @@ async def aterminal_node(state: AgentState, config: RunnableConfig):
     """
     TerminalAgent の非同期呼び出しノード。
     """
-    agent: TerminalAgent = config["configurable"]["terminal_agent"]
-    messages = state.get("messages", [])
+    agent: TerminalAgent = resolve_agent(config, "terminal_agent")
     generated_command = state.get("generated_command", "")  # JSON ではなく、文字列として取得
 
-    logging.info(f"aterminal_node - state: {state}")  # ステートの内容を出力
+    logger.debug("aterminal_node - state: %s", preview(state))  # ステートの内容を出力
 
     if not generated_command:
-        logging.info("########################## aterminal_node")
-        logging.error(f"aterminal_node - コマンドが生成されていません。")
+        logger.error("aterminal_node - コマンドが生成されていません。")
         return {
-            "messages": messages,
             "terminal_command": "コマンドが生成されていません。"
         }
 
-    logging.info(f"aterminal_node - 抽出されたコマンド: {generated_command}")  # 抽出されたコマンドを出力
+    logger.info("aterminal_node - 抽出されたコマンド: %s", preview(generated_command))  # 抽出されたコマンドを出力
 
     # TerminalAgent.arun にコマンドを文字列として渡す
-    logging.info(f"aterminal_node - TerminalAgent.arun 呼び出し前の generated_command: {generated_command}")  # 呼び出し前にコマンドを出力
+    logger.info("aterminal_node - TerminalAgent.arun 呼び出し前の generated_command: %s", preview(generated_command))  # 呼び出し前にコマンドを出力
     command_result = await agent.arun(generated_command, config)  # config を追加
-    logging.info(f"aterminal_node - コマンド実行結果: {command_result}")  # 実行結果を出力
+    logger.info("aterminal_node - コマンド実行結果: %s", preview(command_result))  # 実行結果を出力
 
     return {
-        "messages": messages,  # 以前のメッセージ履歴を引き続き渡す
         "terminal_command": command_result  # エラーメッセージ含む実行結果を格納
     }
 
@@ -287,37 +526,33 @@ def terminal_node(state: AgentState, config: RunnableConfig):
     """
     try:
         
-        logging.info(f"terminal_node - state: {state}")
-        agent: TerminalAgent = config["configurable"]["terminal_agent"]
+        logger.debug("terminal_node - state: %s", preview(state))
+        agent: TerminalAgent = resolve_agent(config, "terminal_agent")
         messages = state.get("messages", [])
         generated_command = state.get("generated_command", "")
         
-        logging.info(f"messages: {messages}")
-        # logging.info(f"terminal_node - state: {state}")
-        logging.debug(f"terminal_node - generated_command type: {type(generated_command)}, value: {generated_command}")
+        logger.debug("terminal_node - messages: %s", preview(messages))
+        # logger.debug("terminal_node - state: %s", preview(state))
+        logger.debug("terminal_node - generated_command type: %s, value: %s", type(generated_command), preview(generated_command))
 
         if not generated_command:
-            logging.info("########################## terminal_node")
-            logging.error(f"terminal_node - コマンドが生成されていません。")
+            logger.error("terminal_node - コマンドが生成されていません。")
             return {
-                "messages": messages,
-                "terminal_command": "コマンドが生成されていません。"
+                    "terminal_command": "コマンドが生成されていません。"
             }
 
-        logging.info(f"terminal_node - 抽出されたコマンド: {generated_command}")
+        logger.info("terminal_node - 抽出されたコマンド: %s", preview(generated_command))
 
-        # 非同期関数を同期的に実行
-        command_result = asyncio.run(agent.arun(generated_command, config))
-        logging.info(f"terminal_node - コマンド実行結果: {command_result}")
+        # 非同期関数を常駐するイベントループで実行（呼び出しごとにループを作り直さない）
+        command_result = run_sync(agent.arun(generated_command, config))
+        logger.info("terminal_node - コマンド実行結果: %s", preview(command_result))
 
         return {
-            "messages": messages,
             "terminal_command": command_result
         }
     except Exception as e:
-        logging.error(f"terminal_node - 例外が発生しました: {e}")
+        logger.error("terminal_node - 例外が発生しました: %s", e)
         return {
-            "messages": messages,
             "terminal_command": f"エラーが発生しました: {e}"
         }
 
@@ -325,12 +560,11 @@ def browser_node(state: AgentState, config: RunnableConfig):
     """
     BrowserAgent を呼び出すノード。
     """
-    agent: BrowserAgent = config["configurable"]["browser_agent"]
+    agent: "BrowserAgent" = resolve_agent(config, "browser_agent")
     messages = state.get("messages", [])
     # ここでは任意の入力を想定
-    result = agent.run(messages, config)
+    result = agent.run(resolve_messages(config, messages), config)
     return {
-        "messages": messages,
         "browser_result": result
     }
 
@@ -338,10 +572,9 @@ async def abrowser_node(state: AgentState, config: RunnableConfig):
     """
     BrowserAgent の非同期呼び出しノード。
     """
-    agent: BrowserAgent = config["configurable"]["browser_agent"]
+    agent: "BrowserAgent" = resolve_agent(config, "browser_agent")
     messages = state.get("messages", [])
-    result = await agent.arun(messages, config)
+    result = await agent.arun(resolve_messages(config, messages), config)
     return {
-        "messages": messages,
         "browser_result": result
     }
\ No newline at end of file
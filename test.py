@@ -1,21 +1,20 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from tools.file_read_tool import FileReadTool
 from agents.terminal_agent import TerminalTool
-from agents.coding_agent import CodingAgent
-from agents.planning_agent import PlanningAgent
-from agents.review_agent import ReviewAgent
-from agents.file_operation_agent import FileOperationAgent
-from agents.terminal_agent import TerminalAgent
-from agents.browser_agent import BrowserAgent
-from agents.command_generation_agent import CommandGenerationAgent
+from agent_config import build_registry, model_routing, openai_llm_factory
 from workflow import build_workflow
 from langchain_core.messages import HumanMessage
+from llm.cache import LLMCache, DiskCache
+from utils.tracing import Tracer
+from utils.context_manager import ContextManager
+from utils.log import configure_logging
+from utils.blob_store import MemoryBlobStore
 
 def main():
     # .envファイルから環境変数を読み込む
     load_dotenv()
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"))
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
     # ツールを準備
@@ -23,24 +22,22 @@ def main():
     terminal_tool = TerminalTool()
     tools = [file_read_tool, terminal_tool]  # 必要に応じて追加
 
-    # LLMを準備
-    llm = ChatOpenAI(
-        temperature=0,
-        model="gpt-4o",  # 適宜変更
-        openai_api_key=OPENAI_API_KEY
-    )
+    # LLM応答キャッシュ（全エージェントで共有）
+    llm_cache = LLMCache(disk=DiskCache(".cache/llm_cache.sqlite3"))
 
-    # 各エージェントのインスタンスを作成
-    coding_agent = CodingAgent(llm, tools)
-    planning_agent = PlanningAgent(llm, tools)
-    review_agent = ReviewAgent(llm, tools)
-    file_operation_agent = FileOperationAgent(llm, tools)
-    terminal_agent = TerminalAgent(llm, tools)
-    browser_agent = BrowserAgent(llm, tools)
-    command_generation_agent = CommandGenerationAgent(llm, tools)
+    # LLMと各エージェントは初回利用時に生成する
+    # エージェントは LLMGateway を経由して呼び出す（リトライはゲートウェイが行うため ChatOpenAI 側では無効にする）
+    # ファイル操作・コマンド生成は gpt-4o-mini、コーディング・計画は gpt-4o を使い、不調なときは互いにフェイルオーバーする
+    routing = model_routing(
+        large=openai_llm_factory(OPENAI_API_KEY, max_retries=0),
+        small=openai_llm_factory(OPENAI_API_KEY, model="gpt-4o-mini", max_retries=0),
+        max_p95=30.0,
+    )
+    registry = build_registry(openai_llm_factory(OPENAI_API_KEY, max_retries=0), tools, llm_cache, gateway={}, routing=routing)
 
-    # ワークフロー構築
-    graph = build_workflow()
+    # ワークフロー構築（各ノードの実行をトレース）
+    tracer = Tracer()
+    graph = build_workflow(tracer)
 
     # 入力例
     inputs = {
@@ -52,14 +49,17 @@ def main():
     # Config
     config = {
         "configurable": {
-            "coding_agent": coding_agent,
-            "planning_agent": planning_agent,
-            "review_agent": review_agent,
+            "agent_registry": registry,
             "file_read_tool": file_read_tool,
-            "file_operation_agent": file_operation_agent,
-            "terminal_agent": terminal_agent,
-            "browser_agent": browser_agent,
-            "command_generation_agent": command_generation_agent,
+            # 既存コードや生成コードなどの大きな文字列は状態に参照だけを入れる（出力する状態が小さくなる）
+            "blob_store": MemoryBlobStore(),
+            # エージェントごとの会話履歴のトークン予算
+            "context_manager": ContextManager(budgets={
+                "planning_agent": 4000,
+                "review_agent": 4000,
+                "coding_agent": 12000,
+                "command_generation_agent": 2000,
+            }),
         }
     }
 
@@ -68,6 +68,11 @@ def main():
         print("================")
         print(output)
 
+    print(f"LLMキャッシュ統計: {llm_cache.stats()}")
+
+    # トレース結果を書き出す（chrome://tracing や https://ui.perfetto.dev で表示）
+    tracer.export_chrome_trace("trace.json")
+
     # 非同期実行を行う場合
     # import asyncio
     # async def run_async():
@@ -0,0 +1,231 @@
+"""
+BrowserPool: 起動済みのブラウザを使い回すプール
+N個のChromiumインスタンスを保持し、browser_node の実行ごとに新しいコンテキストを貸し出します。
+コンテキストは返却時に閉じるため、Cookieやタブなどの状態は貸し出しごとにリセットされます。
+ブラウザは一定回数利用した後、またはそのスロットのブラウザのメモリ使用量が閾値を超えた場合に再起動します。
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def _descendant_pids() -> Optional[Set[int]]:
+    """このプロセスの子孫プロセスのPIDを返す。psutil が無ければNone"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return {child.pid for child in psutil.Process().children(recursive=True)}
+
+
+def _process_tree_rss_mb(pids: Iterable[int]) -> Optional[float]:
+    """pids のプロセスとその子孫の合計RSS（MB）を返す。psutil が無ければNone"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    seen: Set[int] = set()
+    total = 0
+    for pid in pids:
+        try:
+            root = psutil.Process(pid)
+            processes = [root, *root.children(recursive=True)]
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        for process in processes:
+            if process.pid in seen:
+                continue
+            seen.add(process.pid)
+            try:
+                total += process.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+    return total / (1024 * 1024)
+
+
+def _default_browser_factory(headless: bool) -> Any:
+    from browser_use import Browser, BrowserConfig
+    return Browser(config=BrowserConfig(headless=headless))
+
+
+@dataclass
+class PooledBrowser:
+    """プール内の1スロット。ブラウザは必要になった時点で起動する"""
+    index: int
+    browser: Any = None
+    uses: int = 0
+    launched_at: Optional[float] = None
+    # 起動時に増えた子孫プロセス（このスロットのブラウザのプロセス。max_memory_mb 指定時のみ記録する）
+    pids: Set[int] = field(default_factory=set)
+
+
+@dataclass
+class BrowserLease:
+    """貸し出し中のブラウザとコンテキスト"""
+    browser: Any
+    context: Any
+    slot: PooledBrowser
+    leased_at: float = field(default_factory=time.perf_counter)
+
+
+class BrowserPool:
+    """
+    ブラウザインスタンスのプール。
+    asyncio のキューを使うため、最初に lease() / warm() を呼んだイベントループで利用すること。
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_uses: int = 20,
+        max_memory_mb: Optional[float] = None,
+        headless: bool = True,
+        browser_factory: Optional[Callable[[], Any]] = None,
+        context_config: Any = None,
+    ):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.browser_factory = browser_factory or (lambda: _default_browser_factory(headless))
+        self.context_config = context_config
+        self._slots: List[PooledBrowser] = [PooledBrowser(index=i) for i in range(size)]
+        self._queue: Optional[asyncio.Queue] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._closed = False
+        self.launches = 0
+        self.leases = 0
+        self.recycles = 0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._launch_lock = asyncio.Lock()
+            for slot in self._slots:
+                self._queue.put_nowait(slot)
+        return self._queue
+
+    async def _ensure_browser(self, slot: PooledBrowser) -> Any:
+        if slot.browser is not None:
+            return slot.browser
+        if self.max_memory_mb is None:
+            await self._launch(slot)
+        else:
+            # 起動前後の子孫プロセスの差分をこのスロットのプロセスとするため、起動は1つずつ行う
+            async with self._launch_lock:
+                before = _descendant_pids()
+                await self._launch(slot)
+                after = _descendant_pids()
+            if before is not None and after is not None:
+                slot.pids = after - before
+        return slot.browser
+
+    async def _launch(self, slot: PooledBrowser) -> None:
+        """ブラウザを起動する。起動に失敗した場合、スロットは未起動のまま（次回の貸し出しで再試行する）"""
+        browser = self.browser_factory()
+        try:
+            # browser_use の Browser は初回アクセス時にPlaywrightを起動する
+            await browser.get_playwright_browser()
+        except BaseException:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.warning("BrowserPool - 起動に失敗したブラウザのクローズに失敗しました: %s", e)
+            raise
+        slot.browser = browser
+        slot.uses = 0
+        slot.launched_at = time.time()
+        self.launches += 1
+        logger.info("BrowserPool - ブラウザを起動しました (slot=%s)", slot.index)
+
+    async def warm(self) -> None:
+        """全スロットのブラウザを事前に起動しておく"""
+        queue = self._get_queue()
+        slots = [queue.get_nowait() for _ in range(queue.qsize())]
+        try:
+            await asyncio.gather(*(self._ensure_browser(slot) for slot in slots))
+        finally:
+            for slot in slots:
+                queue.put_nowait(slot)
+
+    async def _new_context(self, browser: Any) -> Any:
+        if self.context_config is not None:
+            return await browser.new_context(self.context_config)
+        return await browser.new_context()
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[BrowserLease]:
+        """
+        ブラウザとまっさらなコンテキストを貸し出す。ブロックを抜けるとコンテキストを閉じて返却する。
+        """
+        if self._closed:
+            raise RuntimeError("BrowserPool is closed")
+        queue = self._get_queue()
+        slot: PooledBrowser = await queue.get()
+        context = None
+        try:
+            browser = await self._ensure_browser(slot)
+            context = await self._new_context(browser)
+            self.leases += 1
+            yield BrowserLease(browser=browser, context=context, slot=slot)
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning("BrowserPool - コンテキストのクローズに失敗しました: %s", e)
+            slot.uses += 1
+            if self._should_recycle(slot):
+                await self._recycle(slot)
+            queue.put_nowait(slot)
+
+    def _should_recycle(self, slot: PooledBrowser) -> bool:
+        if self._closed:
+            return True
+        if slot.uses >= self.max_uses:
+            return True
+        if self.max_memory_mb is not None and slot.pids:
+            rss = _process_tree_rss_mb(slot.pids)
+            if rss is not None and rss > self.max_memory_mb:
+                logger.info("BrowserPool - メモリ使用量が閾値を超えました (slot=%s, %.0fMB > %sMB)", slot.index, rss, self.max_memory_mb)
+                return True
+        return False
+
+    async def _recycle(self, slot: PooledBrowser) -> None:
+        """ブラウザを終了し、次回の貸し出し時に起動し直す"""
+        if slot.browser is None:
+            return
+        try:
+            await slot.browser.close()
+        except Exception as e:
+            logger.warning("BrowserPool - ブラウザのクローズに失敗しました: %s", e)
+        slot.browser = None
+        slot.pids = set()
+        self.recycles += 1
+        logger.info("BrowserPool - ブラウザを再起動対象にしました (slot=%s, uses=%s)", slot.index, slot.uses)
+
+    async def close(self) -> None:
+        """待機中のブラウザを終了する。貸し出し中のものは返却時に終了する"""
+        self._closed = True
+        if self._queue is None:
+            return
+        idle = []
+        while not self._queue.empty():
+            idle.append(self._queue.get_nowait())
+        for slot in idle:
+            await self._recycle(slot)
+            self._queue.put_nowait(slot)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "launches": self.launches,
+            "leases": self.leases,
+            "recycles": self.recycles,
+            "live_browsers": sum(1 for s in self._slots if s.browser is not None),
+        }
@@ -0,0 +1,88 @@
+"""
+CodeExtractor: CodingAgent の出力からファイルパスとコードをローカルで抽出する
+CodingAgent のプロンプトが指定する「ファイルパス: <path>」行とフェンス付きコードブロックを解析し、
+1つの応答に含まれる複数ファイルにも対応します。抽出できない場合のみLLMにフォールバックします。
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+# 「ファイルパス: path」「File path: path」などの行（Markdownの装飾やバッククォートも許容）
+PATH_LINE_PATTERN = re.compile(
+    r"^[ \t]*(?:[#>*\-\d.]+[ \t]*)?\**(?:ファイルパス|ファイル名|File ?path|Filename|Path)\**[ \t]*[:：][ \t]*\**`?(?P<path>[^\s`*]+)`?\**[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# フェンス付きコードブロック（``` または ~~~、言語指定は任意）
+FENCE_PATTERN = re.compile(
+    r"^[ \t]*(?P<fence>```+|~~~+)[ \t]*(?P<lang>[\w+#.-]*)[^\n]*\n(?P<code>.*?)^[ \t]*(?P=fence)[ \t]*$",
+    re.DOTALL | re.MULTILINE,
+)
+
+
+@dataclass
+class ExtractedFile:
+    file_path: str
+    code: str
+    language: str = ""
+
+
+def extract_files(raw_text: str, default_path: Optional[str] = None) -> List[ExtractedFile]:
+    """
+    テキストから (ファイルパス, コード) の組を抽出する。
+    各コードブロックには直前に現れたファイルパス行を対応させる。
+    パス行が1つもなくコードブロックが1つだけの場合は default_path を使う。
+    抽出できなければ空リストを返す。
+    """
+    blocks = list(FENCE_PATTERN.finditer(raw_text))
+    if not blocks:
+        return []
+    paths = list(PATH_LINE_PATTERN.finditer(raw_text))
+
+    if not paths:
+        if default_path and len(blocks) == 1:
+            block = blocks[0]
+            return [ExtractedFile(default_path, block.group("code"), block.group("lang"))]
+        return []
+
+    files: List[ExtractedFile] = []
+    used_blocks = set()
+    for i, path_match in enumerate(paths):
+        next_path_start = paths[i + 1].start() if i + 1 < len(paths) else len(raw_text)
+        for j, block in enumerate(blocks):
+            if j in used_blocks:
+                continue
+            if path_match.end() <= block.start() < next_path_start:
+                files.append(ExtractedFile(path_match.group("path"), block.group("code"), block.group("lang")))
+                used_blocks.add(j)
+                break
+    return files
+
+
+class ExtractionMetrics:
+    """ローカル抽出（ファストパス）とLLMフォールバックの回数を数える"""
+
+    def __init__(self):
+        self.fast_path_hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def record(self, fast_path: bool) -> None:
+        with self._lock:
+            if fast_path:
+                self.fast_path_hits += 1
+            else:
+                self.fallbacks += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.fast_path_hits + self.fallbacks
+        return self.fast_path_hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "fast_path_hits": self.fast_path_hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": self.hit_rate,
+        }
@@ -1,29 +1,74 @@
 """
 FileReadTool: 指定ファイルの内容を読み込むツール
+読み込みは FileReader に委譲し、変更のないファイルはキャッシュから返します。
 """
 
+import logging
+
 from langchain_core.tools import BaseTool
-from typing import Any
+from pydantic import Field
+from typing import Dict, Iterable, Optional
+from tools.file_reader import FileReader, FileTooLargeError, default_file_reader
+
+logger = logging.getLogger(__name__)
 
 class FileReadTool(BaseTool):
     """Read text content from a specified file path."""
     name: str = "file_read"
-    description: str = "Read text content from a specified file path."
+    description: str = (
+        "Read text content from a specified file path. "
+        "Optionally pass start_line/end_line (1-based, inclusive) or offset/length (bytes) to read only a range."
+    )
+    reader: FileReader = Field(default_factory=lambda: default_file_reader, exclude=True)
+    # 上限を超えるファイルの代わりに返す先頭部分のバイト数
+    preview_bytes: int = 4096
+
+    def _too_large(self, error: FileTooLargeError, head: str) -> str:
+        """上限を超えるファイルは先頭 preview_bytes バイトだけを返す"""
+        logger.warning("FileReadTool - %s", error)
+        return (
+            f"{head}\n... [上限 {self.reader.max_size} バイトを超えるため先頭 {self.preview_bytes} バイト以降を省略。"
+            "start_line/end_line または offset/length で範囲を指定してください] ..."
+        )
 
-    def _run(self, file_path: str) -> str:
+    def _run(
+        self,
+        file_path: str,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> str:
         """同期処理でファイルを読み込む"""
-        import os
-        if not os.path.exists(file_path):
-            print(f"警告: ファイル {file_path} が存在しません。")
+        try:
+            return self.reader.read(file_path, start_line=start_line, end_line=end_line, offset=offset, length=length)
+        except FileNotFoundError:
+            logger.warning("FileReadTool - ファイル %s が存在しません。", file_path)
             return ""
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-
-    async def _arun(self, file_path: str) -> str:
-        """非同期処理でファイルを読み込む"""
-        import os
-        if not os.path.exists(file_path):
-            print(f"警告: ファイル {file_path} が存在しません。")
+        except FileTooLargeError as e:
+            return self._too_large(e, self.reader.read(file_path, offset=0, length=self.preview_bytes))
+
+    async def _arun(
+        self,
+        file_path: str,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> str:
+        """非同期処理でファイルを読み込む（読み込みはスレッドで行い、イベントループを止めない）"""
+        try:
+            return await self.reader.aread(file_path, start_line=start_line, end_line=end_line, offset=offset, length=length)
+        except FileNotFoundError:
+            logger.warning("FileReadTool - ファイル %s が存在しません。", file_path)
             return ""
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read() 
\ No newline at end of file
+        except FileTooLargeError as e:
+            return self._too_large(e, await self.reader.aread(file_path, offset=0, length=self.preview_bytes))
+
+    def read_many(self, file_paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """複数ファイルをまとめて読み込む（存在しないファイルは None）"""
+        return self.reader.read_many(file_paths)
+
+    async def aread_many(self, file_paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """複数ファイルを並行して読み込む（存在しないファイルは None）"""
+        return await self.reader.aread_many(file_paths)
@@ -0,0 +1,224 @@
+"""
+FileReader: stat 情報でキャッシュを検証するファイル読み込みエンジン
+(path, mtime, size, inode) が変わっていないファイルはキャッシュから返し、
+大きなファイルは mmap で必要な範囲だけを読みます。非同期版はスレッドで実行し、イベントループを止めません。
+"""
+
+import asyncio
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.tracing import span
+
+
+class FileTooLargeError(ValueError):
+    """max_size を超えるファイルを全体読み込みしようとした"""
+
+
+@dataclass(frozen=True)
+class FileSignature:
+    """キャッシュの有効性を判定するための stat 情報"""
+    mtime_ns: int
+    size: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "FileSignature":
+        return cls(st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class FileReader:
+    """
+    テキストファイルの読み込みをまとめて扱う。
+
+    max_entries / max_cache_bytes: キャッシュするファイル数と合計サイズの上限（LRUで追い出す）。
+    mmap_threshold: これ以上のサイズのファイルは範囲読み込みに mmap を使う。
+    max_size: 全体読み込みを許可する最大サイズ。超える場合は範囲を指定して読む。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        max_cache_bytes: int = 64 * 1024 * 1024,
+        mmap_threshold: int = 1024 * 1024,
+        max_size: int = 32 * 1024 * 1024,
+        encoding: str = "utf-8",
+    ):
+        self.max_entries = max_entries
+        self.max_cache_bytes = max_cache_bytes
+        self.mmap_threshold = mmap_threshold
+        self.max_size = max_size
+        self.encoding = encoding
+        self._cache: "OrderedDict[str, Tuple[FileSignature, str]]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- キャッシュ ---
+
+    def _cached(self, key: str, signature: FileSignature) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _store(self, key: str, signature: FileSignature, content: str) -> None:
+        if signature.size > self.max_cache_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._cache_bytes -= old[0].size
+            self._cache[key] = (signature, content)
+            self._cache_bytes += signature.size
+            while self._cache and (len(self._cache) > self.max_entries or self._cache_bytes > self.max_cache_bytes):
+                _, (evicted, _) = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.size
+
+    def invalidate(self, file_path: Optional[str] = None) -> None:
+        """指定ファイル（省略時はすべて）のキャッシュを破棄する"""
+        with self._lock:
+            if file_path is None:
+                self._cache.clear()
+                self._cache_bytes = 0
+                return
+            old = self._cache.pop(os.path.realpath(file_path), None)
+            if old is not None:
+                self._cache_bytes -= old[0].size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._cache),
+            "cached_bytes": self._cache_bytes,
+        }
+
+    # --- 読み込み ---
+
+    def read(
+        self,
+        file_path: str,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+    ) -> str:
+        """
+        ファイルを読み込む。
+        start_line / end_line: 1始まりの行範囲（両端を含む）。
+        offset / length: バイト範囲。行範囲とは同時に指定できない。
+        範囲を指定しない場合は全体を返し、max_size を超えるときは FileTooLargeError。
+        """
+        if (offset is not None or length is not None) and (start_line is not None or end_line is not None):
+            raise ValueError("行範囲とバイト範囲は同時に指定できません。")
+        key = os.path.realpath(file_path)
+        st = os.stat(key)
+        signature = FileSignature.from_stat(st)
+
+        with span("file_read", "tool", path=file_path, size=signature.size) as span_args:
+            if offset is not None or length is not None:
+                span_args["range"] = "bytes"
+                content = self._read_bytes(key, signature.size, offset or 0, length)
+            elif start_line is not None or end_line is not None:
+                span_args["range"] = "lines"
+                content = self._read_lines(key, signature, start_line or 1, end_line)
+            else:
+                content = self._read_full(key, signature, span_args)
+            span_args["chars"] = len(content)
+            return content
+
+    def _read_full(self, key: str, signature: FileSignature, span_args: dict) -> str:
+        content = self._cached(key, signature)
+        span_args["cache_hit"] = content is not None
+        if content is not None:
+            return content
+        if signature.size > self.max_size:
+            raise FileTooLargeError(
+                f"{key} は {signature.size} バイトで上限 {self.max_size} バイトを超えています。範囲を指定してください。"
+            )
+        with open(key, "r", encoding=self.encoding) as f:
+            content = f.read()
+        self._store(key, signature, content)
+        return content
+
+    def _read_bytes(self, key: str, size: int, offset: int, length: Optional[int]) -> str:
+        end = size if length is None else min(size, offset + length)
+        if offset >= end:
+            return ""
+        with open(key, "rb") as f:
+            if size >= self.mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = mm[offset:end]
+            else:
+                f.seek(offset)
+                data = f.read(end - offset)
+        # 範囲の境界でマルチバイト文字が切れる場合があるため置換文字で補う
+        return data.decode(self.encoding, errors="replace")
+
+    def _read_lines(self, key: str, signature: FileSignature, start_line: int, end_line: Optional[int]) -> str:
+        if start_line < 1 or (end_line is not None and end_line < start_line):
+            raise ValueError(f"不正な行範囲です: {start_line}-{end_line}")
+        if signature.size < self.mmap_threshold:
+            cached = self._read_full(key, signature, {})
+        else:
+            cached = self._cached(key, signature)
+        if cached is not None:
+            lines = cached.splitlines(keepends=True)
+            return "".join(lines[start_line - 1:end_line])
+        # 大きなファイルは mmap 上で改行を探し、必要な範囲だけをデコードする
+        with open(key, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = self._line_offset(mm, 0, start_line - 1)
+            if start is None:
+                return ""
+            end = len(mm) if end_line is None else self._line_offset(mm, start, end_line - start_line + 1)
+            return mm[start:len(mm) if end is None else end].decode(self.encoding, errors="replace")
+
+    @staticmethod
+    def _line_offset(mm: mmap.mmap, position: int, lines: int) -> Optional[int]:
+        """position から lines 行進んだ位置を返す。ファイル末尾を越える場合は None"""
+        for _ in range(lines):
+            newline = mm.find(b"\n", position)
+            if newline == -1:
+                return None
+            position = newline + 1
+        return position
+
+    def read_many(self, file_paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """複数ファイルをまとめて読み込む。存在しないファイルは None"""
+        results: Dict[str, Optional[str]] = {}
+        for file_path in file_paths:
+            try:
+                results[file_path] = self.read(file_path)
+            except FileNotFoundError:
+                results[file_path] = None
+        return results
+
+    async def aread(self, file_path: str, **kwargs) -> str:
+        """read の非同期版。読み込みはスレッドで実行する"""
+        return await asyncio.to_thread(self.read, file_path, **kwargs)
+
+    async def aread_many(self, file_paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """複数ファイルを並行して読み込む"""
+        file_paths = list(file_paths)
+
+        async def read_one(file_path: str) -> Optional[str]:
+            try:
+                return await self.aread(file_path)
+            except FileNotFoundError:
+                return None
+
+        contents = await asyncio.gather(*(read_one(p) for p in file_paths))
+        return dict(zip(file_paths, contents))
+
+
+default_file_reader = FileReader()
@@ -0,0 +1,287 @@
+"""
+PatchApplier: CodingAgent が出力した差分を既存のコードに適用する
+検索/置換ブロック（<<<<<<< SEARCH / ======= / >>>>>>> REPLACE）と unified diff の両方に対応します。
+一致箇所は完全一致 → 行末の空白を無視 → 前後の空白を無視（インデントは元のファイルに合わせる）の順に探し、
+一意に決まらない・見つからない場合は何も書き込まずに失敗として返します。
+"""
+
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tools.code_extractor import PATH_LINE_PATTERN
+from tools.file_reader import default_file_reader
+from utils.workspace import WorkDirError, resolve_path
+
+SEARCH_REPLACE_PATTERN = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(?P<search>.*?)^={5,9}[ \t]*\n(?P<replace>.*?)^>{5,9} ?REPLACE[ \t]*$",
+    re.DOTALL | re.MULTILINE,
+)
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(?P<old_start>\d+)(?:,(?P<old_count>\d+))? \+\d+(?:,\d+)? @@")
+
+
+class PatchError(ValueError):
+    """差分を安全に適用できなかった"""
+
+
+@dataclass
+class Edit:
+    """
+    1つの置換。old_lines を new_lines に置き換える。
+    hint は unified diff のハンクの位置（0始まり）。old_lines が空のハンク（挿入のみ）では挿入する位置。
+    """
+    file_path: str
+    old_lines: List[str]
+    new_lines: List[str]
+    hint: Optional[int] = None
+
+
+@dataclass
+class PatchResult:
+    files: Dict[str, str] = field(default_factory=dict)   # 適用後の内容
+    edits: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.edits > 0
+
+
+def _strip_diff_prefix(path: str) -> str:
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+
+def parse_search_replace(text: str, default_path: Optional[str] = None) -> List[Edit]:
+    """検索/置換ブロックを抽出する。各ブロックには直前の「ファイルパス:」行を対応させる"""
+    edits = []
+    paths = [(m.start(), m.group("path")) for m in PATH_LINE_PATTERN.finditer(text)]
+    for block in SEARCH_REPLACE_PATTERN.finditer(text):
+        preceding = [path for start, path in paths if start < block.start()]
+        file_path = preceding[-1] if preceding else default_path
+        if file_path is None:
+            raise PatchError("検索/置換ブロックの対象ファイルが分かりません。")
+        edits.append(Edit(file_path, block.group("search").splitlines(), block.group("replace").splitlines()))
+    return edits
+
+
+def parse_unified_diff(text: str, default_path: Optional[str] = None) -> List[Edit]:
+    """unified diff を抽出する。ハンクごとに1つの Edit を返す"""
+    edits = []
+    file_path = default_path
+    old_lines: List[str] = []
+    new_lines: List[str] = []
+    hint: Optional[int] = None
+    in_hunk = False
+
+    def flush():
+        if in_hunk and (old_lines or new_lines):
+            edits.append(Edit(file_path, list(old_lines), list(new_lines), hint))
+
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            flush()
+            in_hunk = False
+            new_path = lines[i + 1][4:].split("\t")[0].strip()
+            old_path = line[4:].split("\t")[0].strip()
+            file_path = _strip_diff_prefix(new_path if new_path != "/dev/null" else old_path)
+            i += 2
+            continue
+        header = HUNK_HEADER_PATTERN.match(line)
+        if header:
+            flush()
+            if file_path is None:
+                raise PatchError("unified diff の対象ファイルが分かりません。")
+            in_hunk = True
+            old_lines, new_lines = [], []
+            old_start = int(header.group("old_start"))
+            # 元の行数が0のハンク（diff -U0 の挿入など）の old_start は、挿入位置の直前の行を指す
+            hint = old_start if header.group("old_count") == "0" else max(old_start - 1, 0)
+        elif in_hunk:
+            if line.startswith("```"):
+                flush()
+                in_hunk = False
+            elif line.startswith("-"):
+                old_lines.append(line[1:])
+            elif line.startswith("+"):
+                new_lines.append(line[1:])
+            elif line.startswith(" ") or line == "":
+                old_lines.append(line[1:])
+                new_lines.append(line[1:])
+            elif not line.startswith("\\"):
+                flush()
+                in_hunk = False
+        i += 1
+    flush()
+    return edits
+
+
+def parse_patch(text: str, default_path: Optional[str] = None) -> List[Edit]:
+    """検索/置換ブロックがあればそれを、なければ unified diff として解析する"""
+    edits = parse_search_replace(text, default_path)
+    if edits:
+        return edits
+    return parse_unified_diff(text, default_path)
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _find(lines: List[str], old: List[str], normalize: Callable[[str], str], hint: Optional[int]) -> Optional[int]:
+    """old と一致する位置を返す。複数ある場合は hint に最も近いもの（hint がなければ曖昧としてエラー）"""
+    target = [normalize(line) for line in old]
+    normalized = [normalize(line) for line in lines]
+    matches = [
+        i for i in range(len(lines) - len(old) + 1)
+        if normalized[i:i + len(old)] == target
+    ]
+    if not matches:
+        return None
+    if len(matches) > 1:
+        if hint is None:
+            raise PatchError(f"置換対象が {len(matches)} 箇所に一致するため適用できません: {old[0].strip()!r}")
+        return min(matches, key=lambda i: abs(i - hint))
+    return matches[0]
+
+
+def apply_edit(lines: List[str], edit: Edit) -> List[str]:
+    """1つの置換を適用した新しい行のリストを返す"""
+    if not edit.old_lines:
+        if not lines:
+            return list(edit.new_lines)
+        if edit.hint is None:
+            raise PatchError(f"{edit.file_path}: 置換対象が空のブロックは新規ファイルにのみ使えます。")
+        # unified diff の挿入のみのハンクは、ハンクの位置に挿入する
+        position = min(edit.hint, len(lines))
+        return lines[:position] + list(edit.new_lines) + lines[position:]
+
+    strategies: List[Tuple[Callable[[str], str], bool]] = [
+        (lambda s: s, False),
+        (lambda s: s.rstrip(), False),
+        (lambda s: s.strip(), True),
+    ]
+    for normalize, reindent in strategies:
+        position = _find(lines, edit.old_lines, normalize, edit.hint)
+        if position is None:
+            continue
+        new_lines = list(edit.new_lines)
+        if reindent:
+            # 前後の空白を無視して一致した場合は、元のファイルのインデントに合わせる
+            original, proposed = _indent(lines[position]), _indent(edit.old_lines[0])
+            new_lines = [
+                original + line[len(proposed):] if line.startswith(proposed) else line
+                for line in new_lines
+            ]
+        return lines[:position] + new_lines + lines[position + len(edit.old_lines):]
+    raise PatchError(f"{edit.file_path}: 置換対象が見つかりません: {edit.old_lines[0].strip()!r}")
+
+
+def apply_patch(text: str, default_path: Optional[str] = None,
+                read_file: Optional[Callable[[str], Optional[str]]] = None,
+                work_dir: Optional[str] = None) -> PatchResult:
+    """
+    差分をメモリ上で適用し、適用後のファイル内容を返す（書き込みは行わない）。
+    1つでも適用できない置換があれば error を設定し、files は空にする。
+    work_dir 指定時は各ファイルのパスをその下に解決する（files のキーは解決後のパス）。外を指すパスは error。
+    """
+    read_file = read_file or _read_file
+    try:
+        edits = parse_patch(text, default_path)
+    except PatchError as e:
+        return PatchResult(error=str(e))
+    if not edits:
+        return PatchResult(error="差分が見つかりません。")
+
+    contents: Dict[str, Tuple[List[str], bool]] = {}
+    # unified diff の行番号は元のファイルのものなので、前のハンクで増減した行数だけ後のハンクの位置をずらす
+    offsets: Dict[str, int] = {}
+    try:
+        for edit in edits:
+            edit = replace(edit, file_path=resolve_path(work_dir, edit.file_path))
+            if edit.file_path not in contents:
+                original = read_file(edit.file_path)
+                original = original or ""
+                contents[edit.file_path] = (original.splitlines(), original.endswith("\n") or not original)
+                offsets[edit.file_path] = 0
+            if edit.hint is not None:
+                edit = replace(edit, hint=max(edit.hint + offsets[edit.file_path], 0))
+                offsets[edit.file_path] += len(edit.new_lines) - len(edit.old_lines)
+            lines, trailing_newline = contents[edit.file_path]
+            contents[edit.file_path] = (apply_edit(lines, edit), trailing_newline)
+    except (PatchError, WorkDirError) as e:
+        return PatchResult(edits=len(edits), error=str(e))
+
+    files = {
+        path: "\n".join(lines) + ("\n" if trailing_newline and lines else "")
+        for path, (lines, trailing_newline) in contents.items()
+    }
+    return PatchResult(files=files, edits=len(edits))
+
+
+def _read_file(file_path: str) -> Optional[str]:
+    try:
+        return default_file_reader.read(file_path)
+    except FileNotFoundError:
+        return None
+
+
+def atomic_write(file_path: str, content: str) -> None:
+    """一時ファイルに書き込んでからリネームする（既存ファイルのモードを引き継ぐ）"""
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        mode = os.stat(file_path).st_mode & 0o777 if os.path.exists(file_path) else 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PatchMetrics:
+    """差分モードの適用結果と、ファイル全体を出力した場合と比べて節約した出力トークン数を集計する"""
+
+    def __init__(self):
+        self.applied = 0
+        self.fallbacks = 0
+        self.patch_tokens = 0
+        self.full_file_tokens = 0
+        self.per_edit: List[Dict[str, int]] = []
+        self._lock = threading.Lock()
+
+    def record_applied(self, patch_tokens: int, full_file_tokens: int) -> None:
+        with self._lock:
+            self.applied += 1
+            self.patch_tokens += patch_tokens
+            self.full_file_tokens += full_file_tokens
+            self.per_edit.append({
+                "patch_tokens": patch_tokens,
+                "full_file_tokens": full_file_tokens,
+                "saved_tokens": full_file_tokens - patch_tokens,
+            })
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> Dict[str, float]:
+        total = self.applied + self.fallbacks
+        return {
+            "applied": self.applied,
+            "fallbacks": self.fallbacks,
+            "apply_rate": self.applied / total if total else 0.0,
+            "patch_tokens": self.patch_tokens,
+            "full_file_tokens": self.full_file_tokens,
+            "saved_tokens": self.full_file_tokens - self.patch_tokens,
+        }
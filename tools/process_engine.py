@@ -0,0 +1,276 @@
+"""
+ProcessEngine: asyncioネイティブのサブプロセス実行エンジン
+stdout/stderr を逐次読み取り、実行時間・無出力時間のタイムアウトを適用し、
+先頭と末尾のみを保持するバッファでメモリ使用量を一定に抑えます。
+同時実行数はスレッド・イベントループをまたいで共有されるセマフォで制限します。
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from utils.log import preview
+
+logger = logging.getLogger(__name__)
+
+OutputCallback = Callable[[str, str], None]
+
+
+class HeadTailBuffer:
+    """先頭 head_bytes と末尾 tail_bytes だけを保持する出力バッファ"""
+
+    def __init__(self, head_bytes: int = 4096, tail_bytes: int = 16384):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self._head = bytearray()
+        self._tail: "deque[bytes]" = deque()
+        self._tail_size = 0
+        self.total_bytes = 0
+
+    def write(self, data: bytes) -> None:
+        self.total_bytes += len(data)
+        if len(self._head) < self.head_bytes:
+            take = self.head_bytes - len(self._head)
+            self._head.extend(data[:take])
+            data = data[take:]
+        if not data:
+            return
+        self._tail.append(data)
+        self._tail_size += len(data)
+        while self._tail_size > self.tail_bytes:
+            overflow = self._tail_size - self.tail_bytes
+            first = self._tail[0]
+            if len(first) <= overflow:
+                self._tail.popleft()
+                self._tail_size -= len(first)
+            else:
+                self._tail[0] = first[overflow:]
+                self._tail_size -= overflow
+
+    @property
+    def omitted_bytes(self) -> int:
+        return self.total_bytes - len(self._head) - self._tail_size
+
+    def render(self) -> str:
+        """保持している先頭・末尾を文字列にする。省略があれば省略バイト数を挟む"""
+        head = bytes(self._head).decode("utf-8", errors="replace")
+        tail = b"".join(self._tail).decode("utf-8", errors="replace")
+        if self.omitted_bytes > 0:
+            return f"{head}\n... [{self.omitted_bytes} bytes omitted] ...\n{tail}"
+        return head + tail
+
+
+class ConcurrencyLimiter:
+    """
+    スレッド・イベントループをまたいで共有できる同時実行数の制限。
+    asyncio.Semaphore はイベントループに束縛されるため、空き枠の数と待機中の Future の列を
+    threading.Lock で守り、枠が空いたら待機者のループに call_soon_threadsafe で枠を渡す。
+    待機者はスレッドを占有せず、キャンセルされた待機者は列から外れるだけで済む。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._available = limit
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    raise
+            # 枠を渡された後にキャンセルされた場合は返却する（Future ごとキャンセルされた場合は _grant が返却する）
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                future = self._waiters.popleft()
+                try:
+                    future.get_loop().call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    # 待機者のイベントループが閉じている
+                    continue
+            if self._available >= self.limit:
+                raise ValueError("ConcurrencyLimiter released too many times")
+            self._available += 1
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.done():
+            # 枠を渡す前に待機者がキャンセルされた
+            self.release()
+        else:
+            future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+@dataclass
+class ProcessResult:
+    command: str
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    duration: float
+    stdout_bytes: int
+    stderr_bytes: int
+    timed_out: Optional[str] = None  # "wall" / "idle" / None
+
+    @property
+    def ok(self) -> bool:
+        return self.timed_out is None and self.returncode == 0
+
+
+class ProcessEngine:
+    """
+    コマンドを非同期に実行するエンジン。
+    timeout は実行全体の制限時間、idle_timeout は出力が途絶えてからの制限時間（秒）。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        timeout: Optional[float] = 300.0,
+        idle_timeout: Optional[float] = 60.0,
+        head_bytes: int = 4096,
+        tail_bytes: int = 16384,
+        chunk_size: int = 4096,
+    ):
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.chunk_size = chunk_size
+
+    async def run(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        idle_timeout: Optional[float] = None,
+        on_output: Optional[OutputCallback] = None,
+        cwd: Optional[str] = None,
+    ) -> ProcessResult:
+        """コマンドを実行し、出力をストリーミングで読みながら完了を待つ"""
+        timeout = self.timeout if timeout is None else timeout
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        async with self.limiter:
+            return await self._run(command, timeout, idle_timeout, on_output, cwd)
+
+    async def _run(
+        self,
+        command: str,
+        timeout: Optional[float],
+        idle_timeout: Optional[float],
+        on_output: Optional[OutputCallback],
+        cwd: Optional[str],
+    ) -> ProcessResult:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        last_activity = start
+        stdout = HeadTailBuffer(self.head_bytes, self.tail_bytes)
+        stderr = HeadTailBuffer(self.head_bytes, self.tail_bytes)
+
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            stdin=asyncio.subprocess.DEVNULL,
+            cwd=cwd,
+            start_new_session=True,
+        )
+
+        async def pump(stream: asyncio.StreamReader, buffer: HeadTailBuffer, name: str) -> None:
+            nonlocal last_activity
+            while True:
+                chunk = await stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                last_activity = loop.time()
+                buffer.write(chunk)
+                if on_output is not None:
+                    on_output(name, chunk.decode("utf-8", errors="replace"))
+
+        task = asyncio.ensure_future(asyncio.gather(
+            pump(process.stdout, stdout, "stdout"),
+            pump(process.stderr, stderr, "stderr"),
+            process.wait(),
+        ))
+
+        timed_out: Optional[str] = None
+        try:
+            while not task.done():
+                now = loop.time()
+                waits = []
+                if timeout is not None:
+                    waits.append(start + timeout - now)
+                if idle_timeout is not None:
+                    waits.append(last_activity + idle_timeout - now)
+                wait = max(0.0, min(waits)) if waits else None
+                await asyncio.wait({task}, timeout=wait)
+                if task.done():
+                    break
+                now = loop.time()
+                if timeout is not None and now - start >= timeout:
+                    timed_out = "wall"
+                elif idle_timeout is not None and now - last_activity >= idle_timeout:
+                    timed_out = "idle"
+                if timed_out:
+                    logger.warning("ProcessEngine - タイムアウト(%s)のためプロセスを終了します: %s", timed_out, preview(command))
+                    self._kill(process)
+                    break
+            await task
+        except asyncio.CancelledError:
+            self._kill(process)
+            task.cancel()
+            raise
+
+        return ProcessResult(
+            command=command,
+            returncode=process.returncode,
+            stdout=stdout.render(),
+            stderr=stderr.render(),
+            duration=loop.time() - start,
+            stdout_bytes=stdout.total_bytes,
+            stderr_bytes=stderr.total_bytes,
+            timed_out=timed_out,
+        )
+
+    @staticmethod
+    def _kill(process: asyncio.subprocess.Process) -> None:
+        """プロセスグループごと終了させる"""
+        if process.returncode is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+
+# 実行単位をまたいで同時実行数を共有するデフォルトのエンジン
+default_engine = ProcessEngine()
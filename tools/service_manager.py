@@ -0,0 +1,310 @@
+"""
+ServiceManager: サーバーなど終了しないコマンドをバックグラウンドで管理する
+プロセスを切り離して起動し、TCPポートまたはHTTPのレディネスプローブで起動完了を待ちます。
+プロセスごとに直近のログを保持し、名前でノードをまたいだ再利用・停止ができます。
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import re
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from utils.log import preview
+
+logger = logging.getLogger(__name__)
+
+# サーバーを起動するコマンドとみなすパターン
+# serve は単独では一般的な語なので、コマンドの先頭（npx serve を含む）か python -m <モジュール> serve の位置に限る
+SERVER_COMMAND_PATTERN = re.compile(
+    r"\b(uvicorn|gunicorn|hypercorn|flask\s+run|manage\.py\s+runserver|http\.server|streamlit\s+run|npm\s+(run\s+)?(start|dev))\b"
+    r"|(?:^|[;&|]\s*)(?:npx\s+)?serve\b"
+    r"|-m\s+[\w.]+\s+serve\b"
+)
+# スクリプト内でサーバーを起動しているとみなすパターン
+SERVER_SCRIPT_PATTERN = re.compile(r"(uvicorn\.run|app\.run|serve_forever|web\.run_app)\s*\(")
+# ポート番号の候補（上から順に優先する）
+PORT_FLAG_PATTERN = re.compile(r"(?:--port[ =]|(?<![\w-])-p\s+)(\d{2,5})\b")
+RUN_PORT_PATTERN = re.compile(r"(?:uvicorn\.run|app\.run|web\.run_app)\s*\([^)]*?\bport\s*=\s*(\d{2,5})\b")
+PORT_ASSIGN_PATTERN = re.compile(r"\bport\s*=\s*(\d{2,5})\b", re.IGNORECASE)
+# コロンの後の数字は host:port / URL の形に限る（lines[:20] のようなスライスを拾わない）
+HOST_PORT_PATTERN = re.compile(r"(?:https?://[\w.-]+|\blocalhost|\[::\]|(?<![\w.])\d{1,3}(?:\.\d{1,3}){3}):(\d{2,5})\b")
+BARE_PORT_PATTERN = re.compile(r"(?<![\w.-])(\d{4,5})(?![\w.])")
+
+
+@dataclass
+class ReadinessProbe:
+    """TCPポートの接続可否、または http_path 指定時はHTTP 200 で起動完了を判定する"""
+    port: Optional[int] = None
+    host: str = "127.0.0.1"
+    http_path: Optional[str] = None
+    deadline: float = 30.0
+    interval: float = 0.2
+
+    @property
+    def url(self) -> Optional[str]:
+        if self.port is None:
+            return None
+        return f"http://{self.host}:{self.port}{self.http_path or '/'}"
+
+    async def check(self) -> bool:
+        """1回だけプローブを実行する"""
+        if self.port is None:
+            return True
+        if self.http_path is not None:
+            return await asyncio.to_thread(self._http_ok)
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout=self.interval * 5)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    def _http_ok(self) -> bool:
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.interval * 5) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+
+@dataclass
+class ManagedService:
+    name: str
+    command: str
+    process: subprocess.Popen
+    probe: ReadinessProbe
+    log_lines: int = 500
+    cwd: Optional[str] = None
+    # 起動時のコマンドが参照するスクリプトの mtime（変わっていれば再利用せずに再起動する）
+    script_mtimes: Dict[str, int] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.time)
+    ready_at: Optional[float] = None
+    _log: "deque[str]" = field(init=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._log = deque(maxlen=self.log_lines)
+        threading.Thread(target=self._read_output, name=f"service-log-{self.name}", daemon=True).start()
+
+    def _read_output(self) -> None:
+        for line in iter(self.process.stdout.readline, b""):
+            with self._lock:
+                self._log.append(line.decode("utf-8", errors="replace").rstrip("\n"))
+        self.process.stdout.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None and self.alive
+
+    def logs(self, tail: Optional[int] = None) -> str:
+        with self._lock:
+            lines = list(self._log)
+        if tail is not None:
+            lines = lines[-tail:]
+        return "\n".join(lines)
+
+
+class ServiceManager:
+    """
+    名前付きのバックグラウンドプロセスを管理する。
+    プロセスは subprocess.Popen で起動するため、イベントループをまたいでも生存し続ける。
+    """
+
+    def __init__(self, log_lines: int = 500, stop_grace: float = 5.0):
+        self.log_lines = log_lines
+        self.stop_grace = stop_grace
+        self._services: Dict[str, ManagedService] = {}
+        self._lock = threading.Lock()
+        # 名前ごとの起動ロック（asyncio.Lock はイベントループに束縛されるため、ループごとに持つ）
+        self._start_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = weakref.WeakKeyDictionary()
+        atexit.register(self.stop_all)
+
+    def get(self, name: str) -> Optional[ManagedService]:
+        return self._services.get(name)
+
+    def _start_lock(self, name: str) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            locks = self._start_locks.setdefault(loop, {})
+            return locks.setdefault(name, asyncio.Lock())
+
+    async def start(self, name: str, command: str, probe: Optional[ReadinessProbe] = None, cwd: Optional[str] = None) -> ManagedService:
+        """
+        サービスを起動し、レディネスプローブが成功するまで待つ。
+        同じ名前・同じコマンドのサービスが生存していて、コマンドが参照するスクリプトが起動後に
+        変更されていなければ再利用する（変更されていれば古いコードのままにしないよう再起動する）。
+        同じ名前の start は1つずつ実行し、同時に呼ばれても二重に起動しない。
+        """
+        async with self._start_lock(name):
+            return await self._start(name, command, probe or ReadinessProbe(), cwd)
+
+    async def _start(self, name: str, command: str, probe: ReadinessProbe, cwd: Optional[str]) -> ManagedService:
+        with self._lock:
+            existing = self._services.get(name)
+        script_mtimes = _script_mtimes(command, cwd)
+        if existing is not None:
+            if existing.alive and existing.command == command and existing.cwd == cwd:
+                if existing.script_mtimes == script_mtimes:
+                    logger.info("ServiceManager - 既存のサービスを再利用します: %s", name)
+                    if not existing.ready:
+                        await self.wait_ready(existing)
+                    return existing
+                logger.info("ServiceManager - スクリプトが変更されたためサービスを再起動します: %s", name)
+            self.stop(name)
+
+        logger.info("ServiceManager - サービスを起動します: %s: %s", name, preview(command))
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            cwd=cwd,
+            start_new_session=True,
+        )
+        service = ManagedService(
+            name=name, command=command, process=process, probe=probe, log_lines=self.log_lines,
+            cwd=cwd, script_mtimes=script_mtimes,
+        )
+        with self._lock:
+            self._services[name] = service
+        await self.wait_ready(service)
+        return service
+
+    async def wait_ready(self, service: ManagedService) -> bool:
+        """期限までプローブをポーリングする。プロセスが終了した場合は即座に失敗とする"""
+        probe = service.probe
+        deadline = time.monotonic() + probe.deadline
+        while time.monotonic() < deadline:
+            if not service.alive:
+                logger.error("ServiceManager - サービスが終了しました: %s (returncode=%s)", service.name, service.process.returncode)
+                return False
+            if await probe.check():
+                service.ready_at = time.time()
+                logger.info("ServiceManager - サービスの準備が完了しました: %s (%.2fs)", service.name, service.ready_at - service.started_at)
+                return True
+            await asyncio.sleep(probe.interval)
+        logger.error("ServiceManager - レディネスプローブが期限内に成功しませんでした: %s", service.name)
+        return False
+
+    def stop(self, name: str) -> None:
+        """サービスをプロセスグループごと停止する（SIGTERM → 猶予後 SIGKILL）"""
+        with self._lock:
+            service = self._services.pop(name, None)
+        if service is None or not service.alive:
+            return
+        logger.info("ServiceManager - サービスを停止します: %s", name)
+        self._signal(service.process, signal.SIGTERM)
+        try:
+            service.process.wait(timeout=self.stop_grace)
+        except subprocess.TimeoutExpired:
+            self._signal(service.process, signal.SIGKILL)
+            service.process.wait()
+
+    def stop_all(self) -> None:
+        for name in list(self._services):
+            self.stop(name)
+
+    @staticmethod
+    def _signal(process: subprocess.Popen, sig: int) -> None:
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            try:
+                process.send_signal(sig)
+            except ProcessLookupError:
+                pass
+
+
+def detect_service(command: str, cwd: Optional[str] = None) -> Optional[ReadinessProbe]:
+    """
+    コマンドがサーバー起動（終了しないコマンド）かどうかを推定し、該当すればプローブを返す。
+    `python xxx.py` の場合はスクリプトの内容からサーバー起動とポート番号を判定する。
+    """
+    text = command
+    is_server = bool(SERVER_COMMAND_PATTERN.search(command))
+    for path in script_paths(command, cwd):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+        except OSError:
+            continue
+        if SERVER_SCRIPT_PATTERN.search(source):
+            is_server = True
+            text = f"{command}\n{source}"
+    if not is_server:
+        return None
+    return ReadinessProbe(port=_detect_port(command, text))
+
+
+def script_paths(command: str, cwd: Optional[str] = None) -> List[str]:
+    """コマンドの引数のうち .py のスクリプトのパス（cwd 基準）"""
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        args = command.split()
+    return [os.path.join(cwd or os.getcwd(), a) for a in args if a.endswith(".py")]
+
+
+def _script_mtimes(command: str, cwd: Optional[str]) -> Dict[str, int]:
+    mtimes = {}
+    for path in script_paths(command, cwd):
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+    return mtimes
+
+
+def _detect_port(command: str, text: str) -> int:
+    """--port 指定、*.run(port=...)、port = ...、host:port / URL、コマンド中の数字の順に探し、見つからなければ 8000"""
+    for pattern, target in (
+        (PORT_FLAG_PATTERN, command),
+        (RUN_PORT_PATTERN, text),
+        (PORT_FLAG_PATTERN, text),
+        (PORT_ASSIGN_PATTERN, text),
+        (HOST_PORT_PATTERN, text),
+        (BARE_PORT_PATTERN, command),
+    ):
+        match = pattern.search(target)
+        if match:
+            return int(match.group(1))
+    return 8000
+
+
+def service_name(command: str) -> str:
+    """コマンドからサービス名を生成する（スクリプト名またはコマンド名）"""
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        args = command.split()
+    for i, arg in enumerate(args):
+        if arg.endswith(".py"):
+            return os.path.splitext(os.path.basename(arg))[0]
+        if arg == "-m" and i + 1 < len(args):
+            return args[i + 1]
+    return args[0] if args else command
+
+
+# ノードをまたいでサービスを共有するデフォルトのマネージャー
+default_service_manager = ServiceManager()
@@ -0,0 +1,243 @@
+"""
+StreamingFileWriter: LLMのストリーミング出力をそのままファイルに書き込む
+トークンを受け取るたびに「ファイルパス: <path>」行とフェンス付きコードブロックを逐次解析し、
+コードブロックの内容を一時ファイルに書き込み、ブロックが閉じた時点でアトミックにリネームします。
+"""
+
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from tools.code_extractor import PATH_LINE_PATTERN
+from utils.log import preview, sampled
+from utils.stats import latency_summary
+from utils.workspace import WorkDirError, resolve_path
+
+logger = logging.getLogger(__name__)
+
+FENCE_OPEN_PATTERN = re.compile(r"^[ \t]*(?P<fence>```+|~~~+)")
+
+# on_write(file_path, written_text)
+WriteCallback = Callable[[str, str], None]
+
+
+@dataclass
+class StreamStats:
+    """1回のストリーミング生成の計測値（時刻は time.perf_counter の値）"""
+
+    started: float = field(default_factory=time.perf_counter)
+    first_token: Optional[float] = None
+    first_write: Optional[float] = None
+    finished: Optional[float] = None
+    chunks: int = 0
+    chars: int = 0
+    completion_tokens: Optional[int] = None
+
+    def on_chunk(self, text: str) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+        self.chars += len(text)
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        """最初のトークンが届くまでの時間（秒）"""
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def time_to_first_write(self) -> Optional[float]:
+        """最初のコード行がファイルに書き込まれるまでの時間（秒）"""
+        return None if self.first_write is None else self.first_write - self.started
+
+    @property
+    def tokens(self) -> int:
+        return self.completion_tokens if self.completion_tokens is not None else self.chunks
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """最初のトークンから完了までの生成速度"""
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return 0.0
+        return self.tokens / (self.finished - self.first_token)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ttfb": self.ttfb,
+            "time_to_first_write": self.time_to_first_write,
+            "duration": None if self.finished is None else self.finished - self.started,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens_per_sec,
+        }
+
+
+class StreamMetrics:
+    """複数回のストリーミング生成の計測値を集計する"""
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, stats: StreamStats) -> None:
+        with self._lock:
+            self.records.append(stats.to_dict())
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self.records)
+        ttfbs = [r["ttfb"] for r in records if r["ttfb"] is not None]
+        rates = [r["tokens_per_sec"] for r in records if r["tokens_per_sec"]]
+        return {
+            "streams": len(records),
+            "ttfb": latency_summary(ttfbs),
+            "tokens_per_sec": sum(rates) / len(rates) if rates else 0.0,
+        }
+
+
+class StreamingFileWriter:
+    """
+    テキストの断片を feed() で受け取り、コードブロックをファイルに書き出す。
+
+    default_path: パス行が1つもなくコードブロックが1つだけの応答の書き込み先（extract_files と同じ規則）。
+        パス行より前の最初のブロックは一時ファイルに書き、close() の時点で他のブロックもパス行も
+        現れていなければ default_path に置き換える（説明用のコード例で対象ファイルを上書きしない）。
+    on_write: コード行をファイルに書き込むたびに呼ばれるコールバック。
+    work_dir: 指定時はパスをその下に解決し、外を指すブロックは書き込まずに読み飛ばす。
+    ブロックは完全な行単位で書き込み、閉じフェンスを受け取った時点で一時ファイルを置き換えます。
+    閉じられないまま close() された場合は一時ファイルを削除し、元のファイルは変更しません。
+    """
+
+    def __init__(self, default_path: Optional[str] = None, on_write: Optional[WriteCallback] = None,
+                 stats: Optional[StreamStats] = None, work_dir: Optional[str] = None):
+        self.default_path = default_path
+        self.work_dir = work_dir
+        self.on_write = on_write
+        self.stats = stats
+        self.written: List[str] = []
+        self.incomplete: List[str] = []
+        self._partial = ""
+        self._pending_path: Optional[str] = None
+        self._fence: Optional[str] = None
+        self._current_path: Optional[str] = None
+        self._tmp_path: Optional[str] = None
+        self._file: Optional[TextIO] = None
+        self._skipping = False
+        self._blocks = 0
+        self._seen_path = False
+        # default_path に書く候補として閉じた最初のブロックの一時ファイルと書き込み先
+        self._deferred_tmp: Optional[str] = None
+        self._deferred_path: Optional[str] = None
+
+    def feed(self, text: str) -> None:
+        self._partial += text
+        *lines, self._partial = self._partial.split("\n")
+        for line in lines:
+            self._handle_line(line)
+
+    def close(self) -> List[str]:
+        """残りを処理し、書き込みが完了したファイルパスのリストを返す"""
+        if self._partial:
+            line, self._partial = self._partial, ""
+            self._handle_line(line)
+        if self._file is not None:
+            self.incomplete.append(self._current_path)
+            self.abort()
+        if self._deferred_tmp is not None:
+            tmp_path, self._deferred_tmp = self._deferred_tmp, None
+            self._commit(tmp_path, self._deferred_path)
+        return self.written
+
+    def abort(self) -> None:
+        """書き込み中の一時ファイルを破棄する"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path is not None and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._tmp_path = None
+        self._fence = None
+        self._discard_deferred()
+
+    def _discard_deferred(self) -> None:
+        """パス行または2つ目のブロックが現れたため、default_path 向けの最初のブロックを破棄する"""
+        if self._deferred_tmp is not None and os.path.exists(self._deferred_tmp):
+            os.remove(self._deferred_tmp)
+        self._deferred_tmp = None
+
+    def _handle_line(self, line: str) -> None:
+        if self._fence is not None:
+            if line.strip() == self._fence:
+                self._close_block()
+            elif not self._skipping:
+                self._write(line + "\n")
+            return
+
+        fence = FENCE_OPEN_PATTERN.match(line)
+        if fence:
+            self._open_block(fence.group("fence"))
+            return
+        path = PATH_LINE_PATTERN.match(line)
+        if path:
+            self._pending_path = path.group("path")
+            self._seen_path = True
+            self._discard_deferred()
+
+    def _open_block(self, fence: str) -> None:
+        self._fence = fence
+        self._blocks += 1
+        self._discard_deferred()
+        path = self._pending_path
+        if path is None and self._blocks == 1 and not self._seen_path and self.default_path:
+            path = self.default_path
+        self._pending_path = None
+        if path is not None:
+            try:
+                path = resolve_path(self.work_dir, path)
+            except WorkDirError as e:
+                logger.warning("StreamingFileWriter - ブロックを書き込みません: %s", e)
+                path = None
+        # パスの分からないブロック（説明用のコード例など）と作業ディレクトリの外を指すブロックは読み飛ばす
+        self._skipping = path is None
+        if self._skipping:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(
+            dir=directory or ".", prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self._current_path = path
+
+    def _write(self, text: str) -> None:
+        if self.stats is not None and self.stats.first_write is None:
+            self.stats.first_write = time.perf_counter()
+        self._file.write(text)
+        logger.debug("StreamingFileWriter - %s: %s", self._current_path, preview(text, 80), extra=sampled(50))
+        if self.on_write is not None:
+            self.on_write(self._current_path, text)
+
+    def _close_block(self) -> None:
+        self._fence = None
+        if self._skipping:
+            self._skipping = False
+            return
+        self._file.close()
+        self._file = None
+        tmp_path, self._tmp_path = self._tmp_path, None
+        if self._blocks == 1 and not self._seen_path:
+            # default_path に書くかどうかは応答の最後まで見てから決める
+            self._deferred_tmp, self._deferred_path = tmp_path, self._current_path
+            return
+        self._commit(tmp_path, self._current_path)
+
+    def _commit(self, tmp_path: str, path: str) -> None:
+        # mkstemp は 0600 で作成するため、既存ファイルのモード（なければ 0644）に合わせる
+        mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+        self.written.append(path)
@@ -0,0 +1,319 @@
+"""
+SymbolIndex: ワークスペースのPythonファイルを ast で解析したシンボル索引
+関数・クラス・メソッドの位置、docstring、参照している名前を記録してディスクに保存し、
+mtime / サイズが変わったファイルだけを再解析します。
+タスクの文章に関連するシンボルをトークン予算内で選び、コードの抜粋を組み立てます。
+"""
+
+import ast
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tools.file_reader import FileReader, default_file_reader
+from utils.tokens import count_tokens
+from utils.tracing import span
+
+INDEX_VERSION = 2
+DEFAULT_EXCLUDE_DIRS = {".git", "__pycache__", ".cache", ".venv", "venv", "node_modules", ".mypy_cache", ".pytest_cache", ".tox"}
+WORD_PATTERN = re.compile(r"[A-Za-z][a-z0-9]*|[A-Z]+(?![a-z])|\d+")
+# 関連度の計算で無視する一般的な語
+STOPWORDS = {"the", "a", "an", "to", "of", "and", "or", "in", "for", "is", "self", "def", "return", "none", "py", "file"}
+
+
+def split_words(text: str) -> Set[str]:
+    """識別子や文章を小文字の単語に分解する（snake_case / CamelCase も分割する）"""
+    words = set()
+    for token in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text):
+        words.add(token.lower())
+        for part in WORD_PATTERN.findall(token):
+            words.add(part.lower())
+    return {w for w in words if len(w) > 1 and w not in STOPWORDS}
+
+
+@dataclass
+class Symbol:
+    name: str
+    qualname: str
+    kind: str                 # "function" / "class" / "method"
+    file_path: str            # 索引のルートからの相対パス
+    start_line: int
+    end_line: int
+    tokens: int
+    doc: str = ""
+    references: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FileEntry:
+    mtime_ns: int
+    size: int
+    symbols: List[Symbol]
+
+
+@dataclass
+class CodeContext:
+    """select_context の結果"""
+    text: str
+    symbols: List[str]
+    tokens: int
+    update_time: float
+    query_time: float
+
+
+def _references(node: ast.AST) -> List[str]:
+    """参照している名前。属性は曖昧なため self.<name> の形のものだけを記録する"""
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            names.add(child.id)
+        elif isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name) and child.value.id == "self":
+            names.add(f"self.{child.attr}")
+    return sorted(names)
+
+
+def parse_symbols(source: str, file_path: str) -> List[Symbol]:
+    """ソースコードからトップレベルの関数・クラスとクラスのメソッドを抽出する"""
+    tree = ast.parse(source, filename=file_path)
+    lines = source.splitlines()
+    symbols: List[Symbol] = []
+
+    def add(node, kind: str, qualname: str) -> None:
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        end = node.end_lineno or node.lineno
+        doc = (ast.get_docstring(node) or "").strip().splitlines()
+        symbols.append(Symbol(
+            name=node.name,
+            qualname=qualname,
+            kind=kind,
+            file_path=file_path,
+            start_line=start,
+            end_line=end,
+            tokens=count_tokens("\n".join(lines[start - 1:end])),
+            doc=doc[0] if doc else "",
+            references=_references(node),
+        ))
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add(node, "function", node.name)
+        elif isinstance(node, ast.ClassDef):
+            add(node, "class", node.name)
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    add(child, "method", f"{node.name}.{child.name}")
+    return symbols
+
+
+class SymbolIndex:
+    """
+    ワークスペースのシンボル索引。
+
+    root: 索引を作成するディレクトリ。
+    index_path: 索引を保存するJSONファイル（None なら保存しない）。
+    exclude_dirs: 走査しないディレクトリ名。
+    update / save と検索はスレッドをまたいで同時に呼び出してよい（索引の更新はロックで直列化する）。
+    """
+
+    def __init__(
+        self,
+        root: str = ".",
+        index_path: Optional[str] = ".cache/symbol_index.json",
+        exclude_dirs: Optional[Iterable[str]] = None,
+        reader: Optional[FileReader] = None,
+    ):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.exclude_dirs = set(exclude_dirs) if exclude_dirs is not None else set(DEFAULT_EXCLUDE_DIRS)
+        self.reader = reader or default_file_reader
+        self.files: Dict[str, FileEntry] = {}
+        self.last_update: Dict[str, float] = {}
+        self.last_query: Dict[str, float] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # --- 永続化 ---
+
+    def load(self) -> None:
+        with self._lock:
+            self._loaded = True
+            if not self.index_path or not os.path.exists(self.index_path):
+                return
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return
+            if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+                return
+            self.files = {
+                path: FileEntry(entry["mtime_ns"], entry["size"], [Symbol(**s) for s in entry["symbols"]])
+                for path, entry in data["files"].items()
+            }
+
+    def save(self) -> None:
+        if not self.index_path:
+            return
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 古い内容で新しい内容を上書きしないよう、書き込みが終わるまでロックを保持する
+        with self._lock:
+            data = {
+                "version": INDEX_VERSION,
+                "root": self.root,
+                "files": {path: asdict(entry) for path, entry in self.files.items()},
+            }
+            # 一時ファイルは書き込みごとに別の名前にする（同じ index_path を使う別プロセスと衝突しない）
+            fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=f".{os.path.basename(self.index_path)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    # --- 更新 ---
+
+    def _walk(self) -> Iterable[Tuple[str, os.stat_result]]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in self.exclude_dirs]
+            for filename in filenames:
+                if filename.endswith(".py"):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        yield os.path.relpath(path, self.root), os.stat(path)
+                    except OSError:
+                        continue
+
+    def update(self) -> Dict[str, float]:
+        """変更のあったファイルだけを再解析し、索引を保存する（同時に呼ばれた場合は1つずつ実行する）"""
+        with self._lock:
+            return self._update()
+
+    def _update(self) -> Dict[str, float]:
+        start = time.perf_counter()
+        if not self._loaded:
+            self.load()
+        with span("symbol_index.update", "index") as span_args:
+            seen = set()
+            parsed = 0
+            for rel_path, st in self._walk():
+                seen.add(rel_path)
+                entry = self.files.get(rel_path)
+                if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                    continue
+                try:
+                    source = self.reader.read(os.path.join(self.root, rel_path))
+                    symbols = parse_symbols(source, rel_path)
+                except (SyntaxError, UnicodeDecodeError, ValueError, OSError):
+                    symbols = []
+                self.files[rel_path] = FileEntry(st.st_mtime_ns, st.st_size, symbols)
+                parsed += 1
+            removed = [path for path in self.files if path not in seen]
+            for path in removed:
+                del self.files[path]
+            if parsed or removed:
+                self.save()
+            self.last_update = {
+                "files": len(self.files),
+                "parsed": parsed,
+                "removed": len(removed),
+                "elapsed": time.perf_counter() - start,
+            }
+            span_args.update(self.last_update)
+        return self.last_update
+
+    def symbols(self) -> List[Symbol]:
+        with self._lock:
+            entries = list(self.files.values())
+        return [symbol for entry in entries for symbol in entry.symbols]
+
+    # --- 検索 ---
+
+    def query(self, text: str, limit: Optional[int] = None) -> List[Tuple[float, Symbol]]:
+        """タスクの文章との関連度が高い順にシンボルを返す（関連度0のものは含めない）"""
+        words = split_words(text)
+        all_symbols = self.symbols()
+        scored: Dict[str, Tuple[float, Symbol]] = {}
+        for symbol in all_symbols:
+            score = 0.0
+            if symbol.name.lower() in words:
+                score += 5
+            score += 2 * len(split_words(symbol.qualname) & words)
+            score += len(split_words(symbol.file_path) & words)
+            score += 0.5 * len(split_words(symbol.doc) & words)
+            if score:
+                scored[f"{symbol.file_path}:{symbol.qualname}"] = (score, symbol)
+
+        # 関連するシンボルが参照している定義も候補に加える（1段階のみ）
+        # 名前はトップレベルの関数・クラス、self.<name> は同じクラスのメソッドに対応させる
+        by_name: Dict[str, List[Symbol]] = {}
+        for symbol in all_symbols:
+            if symbol.kind == "method":
+                by_name.setdefault(f"{symbol.file_path}:{symbol.qualname}", []).append(symbol)
+            else:
+                by_name.setdefault(symbol.name, []).append(symbol)
+        for score, symbol in list(scored.values()):
+            class_name = symbol.qualname.split(".")[0]
+            for ref in symbol.references:
+                if ref.startswith("self."):
+                    ref = f"{symbol.file_path}:{class_name}.{ref[5:]}"
+                for target in by_name.get(ref, []):
+                    key = f"{target.file_path}:{target.qualname}"
+                    bonus = score * 0.3
+                    if key in scored:
+                        scored[key] = (scored[key][0] + bonus * 0.5, target)
+                    else:
+                        scored[key] = (bonus, target)
+
+        ranked = sorted(scored.values(), key=lambda item: (-item[0], item[1].tokens))
+        return ranked[:limit] if limit else ranked
+
+    def select_context(self, text: str, token_budget: int = 4000, update: bool = True) -> CodeContext:
+        """関連するシンボルのソースをトークン予算内で選び、抜粋テキストを返す"""
+        update_time = self.update()["elapsed"] if update else 0.0
+        start = time.perf_counter()
+        with span("symbol_index.query", "index", budget=token_budget) as span_args:
+            selected: List[Symbol] = []
+            used = 0
+            for _, symbol in self.query(text):
+                if used + symbol.tokens > token_budget:
+                    continue
+                # 既に選んだクラスに含まれるメソッドなど、範囲が重なるものは除く
+                if any(s.file_path == symbol.file_path and s.start_line <= symbol.start_line and symbol.end_line <= s.end_line
+                       for s in selected):
+                    continue
+                selected = [s for s in selected if not (
+                    s.file_path == symbol.file_path and symbol.start_line <= s.start_line and s.end_line <= symbol.end_line
+                )]
+                selected.append(symbol)
+                used = sum(s.tokens for s in selected)
+            text_out = self.render(selected)
+            query_time = time.perf_counter() - start
+            self.last_query = {"candidates": len(self.symbols()), "selected": len(selected), "tokens": used, "elapsed": query_time}
+            span_args.update(self.last_query)
+        return CodeContext(
+            text=text_out,
+            symbols=[f"{s.file_path}:{s.qualname}" for s in selected],
+            tokens=used,
+            update_time=update_time,
+            query_time=query_time,
+        )
+
+    def render(self, symbols: List[Symbol]) -> str:
+        """シンボルのソースをファイル・行番号順に並べた抜粋を作成する"""
+        parts = []
+        for symbol in sorted(symbols, key=lambda s: (s.file_path, s.start_line)):
+            source = self.reader.read(
+                os.path.join(self.root, symbol.file_path), start_line=symbol.start_line, end_line=symbol.end_line
+            )
+            parts.append(f"# {symbol.file_path}:{symbol.start_line}-{symbol.end_line} ({symbol.qualname})\n{source.rstrip()}")
+        return "\n\n".join(parts)
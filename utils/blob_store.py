@@ -0,0 +1,197 @@
+"""
+BlobStore: AgentState の大きな文字列（既存コード・生成コード・LLMの生の出力）を内容のハッシュで一度だけ保存する
+config["configurable"]["blob_store"] に設定すると、ノードは threshold 文字以上の値の代わりに
+"blob:sha256:<ハッシュ>:<バイト数>" 形式の参照（BlobRef）を状態に入れ、必要になった時点で resolve_blob() で読み出します。
+ステップごとの状態のコピー、graph.stream のイベント、チェックポイントはファイルの大きさによらず小さいままになります。
+MemoryBlobStore はプロセス内の辞書に、DiskBlobStore はディレクトリのファイルに保存します
+（チェックポイントから別のプロセスで resume する場合は DiskBlobStore を使います）。
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+
+BLOB_PREFIX = "blob:sha256:"
+
+
+class BlobRef(str):
+    """
+    ブロブへの参照。str のサブクラスなので、状態・stream のイベント・チェックポイントにそのまま入る
+    （シリアライズで普通の str に戻っても is_blob_ref() で判別できる）。
+    """
+
+    @property
+    def digest(self) -> str:
+        return self[len(BLOB_PREFIX):].split(":", 1)[0]
+
+    @property
+    def size(self) -> int:
+        return int(self.rsplit(":", 1)[1])
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_PREFIX)
+
+
+class BlobStore:
+    """
+    内容アドレスのブロブストアの共通部分。
+
+    threshold: store_large() が参照に置き換える最小の文字数。
+    """
+
+    def __init__(self, threshold: int = 2048):
+        self.threshold = threshold
+        self.puts = 0
+        self.dedup_hits = 0
+        self.gets = 0
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> BlobRef:
+        """text を保存して参照を返す（同じ内容は一度だけ保存する）"""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self.puts += 1
+            if self._contains(digest):
+                self.dedup_hits += 1
+            else:
+                self._write(digest, text, data)
+        return BlobRef(f"{BLOB_PREFIX}{digest}:{len(data)}")
+
+    def get(self, ref: str) -> str:
+        """参照が指す内容を返す。見つからなければ KeyError"""
+        digest = BlobRef(ref).digest
+        with self._lock:
+            self.gets += 1
+        return self._read(digest)
+
+    def resolve(self, value: Any) -> Any:
+        """参照なら内容に、それ以外はそのまま返す"""
+        return self.get(value) if is_blob_ref(value) else value
+
+    def _contains(self, digest: str) -> bool:
+        raise NotImplementedError
+
+    def _write(self, digest: str, text: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _read(self, digest: str) -> str:
+        raise NotImplementedError
+
+    def _footprint(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"puts": self.puts, "dedup_hits": self.dedup_hits, "gets": self.gets, **self._footprint()}
+
+
+class MemoryBlobStore(BlobStore):
+    """プロセス内の辞書に保存するブロブストア"""
+
+    def __init__(self, threshold: int = 2048):
+        super().__init__(threshold)
+        self._blobs: Dict[str, str] = {}
+        self._bytes = 0
+
+    def _contains(self, digest: str) -> bool:
+        return digest in self._blobs
+
+    def _write(self, digest: str, text: str, data: bytes) -> None:
+        self._blobs[digest] = text
+        self._bytes += len(data)
+
+    def _read(self, digest: str) -> str:
+        return self._blobs[digest]
+
+    def _footprint(self) -> Dict[str, int]:
+        return {"blobs": len(self._blobs), "bytes": self._bytes}
+
+
+class DiskBlobStore(BlobStore):
+    """
+    root/<ハッシュの先頭2文字>/<ハッシュ> に保存するブロブストア。
+    読み出しのたびにファイルを開いて閉じる（ファイル記述子を保持しないので、ブロブがいくつあっても
+    EMFILE にならない）。繰り返しの読み出しはOSのページキャッシュから行われる。
+    """
+
+    def __init__(self, root: str = ".cache/blobs", threshold: int = 2048):
+        super().__init__(threshold)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _contains(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def _write(self, digest: str, text: str, data: bytes) -> None:
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _read(self, digest: str) -> str:
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            raise KeyError(digest) from None
+
+    def _footprint(self) -> Dict[str, int]:
+        blobs = total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.startswith(".tmp-"):
+                    blobs += 1
+                    total += os.path.getsize(os.path.join(directory, name))
+        return {"blobs": blobs, "bytes": total}
+
+
+def get_blob_store(config: Optional[RunnableConfig]) -> Optional[BlobStore]:
+    if not config:
+        return None
+    return config.get("configurable", {}).get("blob_store")
+
+
+def store_large(config: Optional[RunnableConfig], value: Any) -> Any:
+    """blob_store が設定されていて、value が threshold 文字以上の文字列なら参照に置き換える"""
+    store = get_blob_store(config)
+    if store is None or not isinstance(value, str) or is_blob_ref(value) or len(value) < store.threshold:
+        return value
+    return store.put(value)
+
+
+def resolve_blob(config: Optional[RunnableConfig], value: Any) -> Any:
+    """参照なら blob_store から内容を読み出し、それ以外はそのまま返す"""
+    if not is_blob_ref(value):
+        return value
+    store = get_blob_store(config)
+    if store is None:
+        raise LookupError(f"{value} cannot be resolved: blob_store is not configured")
+    return store.get(value)
+
+
+def resolve_messages(config: Optional[RunnableConfig], messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """content が参照のメッセージを、内容に置き換えたコピーにする（エージェントに渡す直前に使う）"""
+    resolved = []
+    for message in messages:
+        content = getattr(message, "content", None)
+        if is_blob_ref(content):
+            message = message.model_copy(update={"content": resolve_blob(config, content)})
+        resolved.append(message)
+    return resolved
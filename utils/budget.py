@@ -0,0 +1,185 @@
+"""
+RunBudget: 1回のワークフロー実行で使えるLLM呼び出し回数・トークン数・時間の上限
+config["configurable"]["run_budget"] に設定すると、すべてのノードとエージェントで共有されます。
+上限に達すると以降のLLM呼び出しは BudgetExceeded になり、グラフはそれまでの結果を持ったまま終了します。
+非同期実行では期限を過ぎた時点で実行中のノード（LLM呼び出しを含む）をキャンセルします。
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+
+from utils.tokens import count_tokens, messages_tokens
+
+
+class BudgetExceeded(RuntimeError):
+    """実行の予算（LLM呼び出し回数・トークン数・期限）を使い切った"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RunBudget:
+    """
+    実行全体の予算。
+
+    max_llm_calls: LLM呼び出し回数の上限（キャッシュヒットは数えない）。
+    max_tokens: プロンプトと出力の合計トークン数の上限。
+    deadline_seconds: 最初に使われてからの制限時間（秒）。
+    いずれも None なら制限しない。
+    """
+
+    def __init__(
+        self,
+        max_llm_calls: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        deadline_seconds: Optional[float] = None,
+    ):
+        self.max_llm_calls = max_llm_calls
+        self.max_tokens = max_tokens
+        self.deadline_seconds = deadline_seconds
+        self.started: Optional[float] = None
+        self.llm_calls = 0
+        self.tokens = 0
+        self.exhausted: Optional[str] = None
+        self.per_node: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "elapsed": 0.0, "runs": 0}
+        )
+        self._lock = threading.Lock()
+
+    def fresh(self) -> "RunBudget":
+        """同じ上限を持つ未使用の予算を返す（バッチ実行でタスクごとに使う）"""
+        return RunBudget(self.max_llm_calls, self.max_tokens, self.deadline_seconds)
+
+    def start(self) -> None:
+        with self._lock:
+            if self.started is None:
+                self.started = time.monotonic()
+
+    def remaining_time(self) -> Optional[float]:
+        if self.deadline_seconds is None:
+            return None
+        self.start()
+        return max(self.deadline_seconds - (time.monotonic() - self.started), 0.0)
+
+    def _exhaust(self, reason: str) -> None:
+        if self.exhausted is None:
+            self.exhausted = reason
+
+    def check(self) -> None:
+        """上限に達していれば BudgetExceeded を送出する"""
+        remaining = self.remaining_time()
+        with self._lock:
+            if remaining is not None and remaining <= 0:
+                self._exhaust(f"deadline {self.deadline_seconds}s exceeded")
+            if self.max_llm_calls is not None and self.llm_calls >= self.max_llm_calls:
+                self._exhaust(f"max_llm_calls {self.max_llm_calls} reached")
+            if self.max_tokens is not None and self.tokens >= self.max_tokens:
+                self._exhaust(f"max_tokens {self.max_tokens} reached")
+            if self.exhausted is not None:
+                raise BudgetExceeded(self.exhausted)
+
+    def record_llm(self, node: str, messages: Sequence[Any], response: Any) -> None:
+        """LLM呼び出し1回分の消費を記録する（usage_metadata がなければトークン数を見積もる）"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens") or messages_tokens(messages)
+        content = getattr(response, "content", response)
+        completion_tokens = usage.get("output_tokens") or count_tokens(content if isinstance(content, str) else str(content))
+        with self._lock:
+            self.llm_calls += 1
+            self.tokens += prompt_tokens + completion_tokens
+            stats = self.per_node[node]
+            stats["llm_calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+    def record_node(self, node: str, elapsed: float) -> None:
+        with self._lock:
+            self.per_node[node]["elapsed"] += elapsed
+            self.per_node[node]["runs"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        """全体とノードごとの消費量"""
+        with self._lock:
+            return {
+                "llm_calls": self.llm_calls,
+                "max_llm_calls": self.max_llm_calls,
+                "tokens": self.tokens,
+                "max_tokens": self.max_tokens,
+                "elapsed": 0.0 if self.started is None else time.monotonic() - self.started,
+                "deadline_seconds": self.deadline_seconds,
+                "exhausted": self.exhausted,
+                "nodes": {name: dict(stats) for name, stats in self.per_node.items()},
+            }
+
+
+def get_budget(config: Optional[RunnableConfig]) -> Optional[RunBudget]:
+    if not config:
+        return None
+    return config.get("configurable", {}).get("run_budget")
+
+
+def current_node(config: Optional[RunnableConfig], default: str = "unknown") -> str:
+    """LangGraph が config の metadata に設定する実行中のノード名"""
+    if not config:
+        return default
+    return config.get("metadata", {}).get("langgraph_node", default)
+
+
+def budgeted(name: str) -> Callable[[Callable], Callable]:
+    """
+    ノード関数を予算の管理下で実行するデコレータ。
+    予算を使い切っている場合はノードを実行せず {"budget_exhausted": 理由} を返し、
+    非同期版は残り時間を超えたらノードをキャンセルする。ノードごとの所要時間も記録する。
+    """
+
+    def exhausted_update(budget: RunBudget, reason: str) -> Dict[str, Any]:
+        budget._exhaust(reason)
+        return {"budget_exhausted": budget.exhausted}
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(state, config: RunnableConfig):
+                budget = get_budget(config)
+                if budget is None:
+                    return await func(state, config)
+                start = time.perf_counter()
+                try:
+                    budget.check()
+                    return await asyncio.wait_for(func(state, config), budget.remaining_time())
+                except BudgetExceeded as e:
+                    return exhausted_update(budget, e.reason)
+                except asyncio.TimeoutError:
+                    # ノード内部のタイムアウト（LLM・HTTPクライアントなど）は期限切れとして扱わずにそのまま送出する
+                    remaining = budget.remaining_time()
+                    if remaining is None or remaining > 0:
+                        raise
+                    return exhausted_update(budget, f"deadline {budget.deadline_seconds}s exceeded in {name}")
+                finally:
+                    budget.record_node(name, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(state, config: RunnableConfig):
+            budget = get_budget(config)
+            if budget is None:
+                return func(state, config)
+            start = time.perf_counter()
+            try:
+                budget.check()
+                return func(state, config)
+            except BudgetExceeded as e:
+                return exhausted_update(budget, e.reason)
+            finally:
+                budget.record_node(name, time.perf_counter() - start)
+        return wrapper
+
+    return decorator
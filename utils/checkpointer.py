@@ -0,0 +1,415 @@
+"""
+SqliteCheckpointer: ワークフローの実行状態をローカルのSQLiteに保存するチェックポインタ
+build_workflow(checkpointer=...) でグラフに組み込むと、各ステップ後の AgentState が保存され、
+途中のノード（terminal / browser など）で失敗しても resume() で失敗したノードから再開できます。
+replay_from_node() は過去の実行を指定したノードの直前から分岐して再実行します。
+
+AgentState はチャネルごとに保存し、値が変わったチャネルだけを書き込みます（messages を毎回書き直さない）。
+大きな値は zlib で圧縮します。
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from utils.stats import latency_summary
+from utils.tracing import span
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    created REAL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """JsonPlusSerializer（msgpack）の出力が compress_threshold バイトを超える場合に zlib で圧縮する"""
+
+    def __init__(self, compress_threshold: int = 1024, level: int = 6):
+        super().__init__()
+        self.compress_threshold = compress_threshold
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if len(data) > self.compress_threshold:
+            return f"{type_}+zlib", zlib.compress(data, self.level)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith("+zlib"):
+            return super().loads_typed((type_[:-5], zlib.decompress(payload)))
+        return super().loads_typed((type_, payload))
+
+
+class CheckpointMetrics:
+    """チェックポイントの書き込みレイテンシとバイト数を集計する"""
+
+    def __init__(self):
+        self.put_latencies: List[float] = []
+        self.write_latencies: List[float] = []
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, elapsed: float, size: int) -> None:
+        with self._lock:
+            (self.put_latencies if kind == "put" else self.write_latencies).append(elapsed)
+            self.bytes_written += size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "put": latency_summary(self.put_latencies),
+            "put_writes": latency_summary(self.write_latencies),
+            "bytes_written": self.bytes_written,
+        }
+
+
+class SqliteCheckpointer(BaseCheckpointSaver[str]):
+    """
+    sqlite3 を使った BaseCheckpointSaver の実装。
+
+    path: データベースファイル（":memory:" も可）。
+    非同期メソッドはスレッドで実行し、イベントループを止めません。
+    """
+
+    def __init__(self, path: str = ".cache/checkpoints.sqlite3", serde: Optional[CompactSerializer] = None):
+        super().__init__(serde=serde or CompactSerializer())
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.metrics = CheckpointMetrics()
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    # --- 読み込み ---
+
+    def _load_channel_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            row = self.conn.execute(
+                "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is not None and row[0] != "empty":
+                values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_blob))
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints"
+        )
+        conditions, params = [], []
+        if config is not None:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                item = self._to_tuple(thread_id, checkpoint_ns, tuple(row))
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    # --- 書き込み ---
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        start = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint = checkpoint.copy()
+        values: Dict[str, Any] = checkpoint.pop("channel_values")  # type: ignore[misc]
+
+        # 変更のあったチャネルの値だけを保存する
+        blob_rows = []
+        for channel, version in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        size = len(checkpoint_blob) + len(metadata_blob) + sum(len(row[5]) for row in blob_rows)
+
+        with span("checkpoint.put", "checkpoint", bytes=size), self._lock:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                        checkpoint_type, checkpoint_blob, metadata_type, metadata_blob, time.time(),
+                    ),
+                )
+        self.metrics.record("put", time.perf_counter() - start, size)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        start = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, blob, task_path))
+        # 特殊チャネル（エラー等、idx < 0）は上書きし、通常の書き込みは最初の1回だけを残す
+        size = sum(len(row[7]) for row in rows)
+        with span("checkpoint.put_writes", "checkpoint", bytes=size), self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [r for r in rows if r[4] < 0]
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [r for r in rows if r[4] >= 0]
+                )
+        self.metrics.record("put_writes", time.perf_counter() - start, size)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self.conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # --- 非同期版（スレッドで実行する） ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+# --- 再開・再実行 ---
+
+def run_config(config: Optional[RunnableConfig], run_id: str, checkpoint_id: Optional[str] = None) -> RunnableConfig:
+    """config に thread_id（= run_id）と、必要なら checkpoint_id を設定したコピーを返す"""
+    config = dict(config or {})
+    configurable = dict(config.get("configurable", {}))
+    configurable["thread_id"] = run_id
+    configurable.pop("checkpoint_id", None)
+    if checkpoint_id is not None:
+        configurable["checkpoint_id"] = checkpoint_id
+    config["configurable"] = configurable
+    return config
+
+
+def _checkpoint_before(graph, config: RunnableConfig, node: str) -> RunnableConfig:
+    """node を次に実行する直近のチェックポイントの config を返す"""
+    for snapshot in graph.get_state_history(config):
+        if node in snapshot.next:
+            return snapshot.config
+    raise ValueError(f"{config['configurable']['thread_id']} に {node} を実行する前のチェックポイントがありません。")
+
+
+def resume(graph, run_id: str, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """
+    保存された最新のチェックポイントから実行を再開する。
+    失敗したノードから再実行され、それ以前のノード（LLM呼び出しを含む）は実行されない。
+    完了済みの実行はそのままの状態を返す。
+    """
+    config = run_config(config, run_id)
+    snapshot = graph.get_state(config)
+    if not snapshot.next:
+        return snapshot.values
+    return graph.invoke(None, config)
+
+
+async def aresume(graph, run_id: str, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """resume の非同期版"""
+    config = run_config(config, run_id)
+    snapshot = await graph.aget_state(config)
+    if not snapshot.next:
+        return snapshot.values
+    return await graph.ainvoke(None, config)
+
+
+def replay_from_node(graph, run_id: str, node: str, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """
+    過去の実行を node の直前のチェックポイントから分岐して再実行する。
+    node 以降のノードが再び実行され、新しいチェックポイントとして保存される。
+    """
+    base = run_config(config, run_id)
+    checkpoint = _checkpoint_before(graph, base, node)
+    return graph.invoke(None, run_config(config, run_id, checkpoint["configurable"]["checkpoint_id"]))
+
+
+async def areplay_from_node(graph, run_id: str, node: str, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """replay_from_node の非同期版"""
+    base = run_config(config, run_id)
+    checkpoint = await asyncio.to_thread(_checkpoint_before, graph, base, node)
+    return await graph.ainvoke(None, run_config(config, run_id, checkpoint["configurable"]["checkpoint_id"]))
@@ -0,0 +1,142 @@
+"""
+ContextManager: エージェントに渡す会話履歴をトークン予算内に収める
+ノードからエージェントを呼び出す直前に適用し、
+重複メッセージの除去、大きなツール出力の切り詰め、古いターンの要約を行います。
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+
+from utils.blob_store import resolve_messages
+from utils.tokens import count_tokens, message_tokens, messages_tokens
+from utils.tracing import span
+
+Summarizer = Callable[[List[BaseMessage]], str]
+
+
+def _content(message: Any) -> str:
+    content = getattr(message, "content", message)
+    return content if isinstance(content, str) else str(content)
+
+
+def _replace_content(message: BaseMessage, content: str) -> BaseMessage:
+    return message.model_copy(update={"content": content})
+
+
+def extractive_summary(messages: List[BaseMessage], max_chars_per_message: int = 200) -> str:
+    """LLMを使わない要約。各メッセージの先頭部分を役割付きで列挙する"""
+    lines = []
+    for message in messages:
+        text = " ".join(_content(message).split())
+        if len(text) > max_chars_per_message:
+            text = text[:max_chars_per_message] + "…"
+        lines.append(f"- {message.type}: {text}")
+    return "\n".join(lines)
+
+
+class ContextManager:
+    """
+    エージェントごとのトークン予算に従って会話履歴を圧縮する。
+
+    budgets: エージェント名（configurable のキー名）ごとの予算。未指定のエージェントは default_budget。
+    max_message_tokens: 1メッセージあたりの上限。超えた分は先頭と末尾を残して切り詰める。
+    keep_recent: 要約せずにそのまま残す直近のメッセージ数。
+    summarizer: 古いターンを要約する関数。省略時は extractive_summary。
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        default_budget: int = 6000,
+        max_message_tokens: int = 1500,
+        keep_recent: int = 4,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.max_message_tokens = max_message_tokens
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer or extractive_summary
+
+    def budget_for(self, agent_name: str) -> int:
+        return self.budgets.get(agent_name, self.default_budget)
+
+    def compact(self, messages: Sequence[BaseMessage], agent_name: str) -> List[BaseMessage]:
+        """予算内に収まるよう圧縮したメッセージのリストを返す（元のリストは変更しない）"""
+        budget = self.budget_for(agent_name)
+        with span("context.compact", "context", agent=agent_name, budget=budget) as span_args:
+            span_args["tokens_before"] = messages_tokens(messages)
+            compacted = self.deduplicate(messages)
+            compacted = self.truncate_large(compacted)
+            if messages_tokens(compacted) > budget:
+                compacted = self.summarize_older(compacted, budget)
+            span_args["tokens_after"] = messages_tokens(compacted)
+            span_args["messages_before"] = len(messages)
+            span_args["messages_after"] = len(compacted)
+            return compacted
+
+    def deduplicate(self, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        """役割と内容が同じメッセージは最後の1件だけを残す"""
+        last_index = {}
+        for i, message in enumerate(messages):
+            last_index[(message.type, _content(message))] = i
+        return [m for i, m in enumerate(messages) if last_index[(m.type, _content(m))] == i]
+
+    def truncate_large(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        上限を超える大きなメッセージ（ツール出力や過去の生成コードなど）を先頭と末尾だけに切り詰める。
+        最後のメッセージは現在の指示なので切り詰めない。
+        """
+        result = []
+        for i, message in enumerate(messages):
+            if i < len(messages) - 1 and message_tokens(message) > self.max_message_tokens:
+                message = _replace_content(message, self._head_tail(_content(message)))
+            result.append(message)
+        return result
+
+    def _head_tail(self, text: str) -> str:
+        total = count_tokens(text)
+        # トークン数と文字数の比率から残す文字数を見積もる
+        keep_chars = int(len(text) * (self.max_message_tokens / max(total, 1)) / 2)
+        omitted = total - self.max_message_tokens
+        return f"{text[:keep_chars]}\n... [約{omitted}トークン省略] ...\n{text[-keep_chars:]}"
+
+    @staticmethod
+    def _fit_tail(text: str, max_tokens: int) -> str:
+        """要約が長すぎる場合は、新しいターンに近い末尾側を残す"""
+        total = count_tokens(text)
+        if total <= max_tokens:
+            return text
+        keep_chars = int(len(text) * max_tokens / total)
+        return "…" + text[-keep_chars:]
+
+    def summarize_older(self, messages: List[BaseMessage], budget: int) -> List[BaseMessage]:
+        """
+        最初のメッセージ（タスク）と直近 keep_recent 件を残し、その間を要約1件に置き換える。
+        それでも予算を超える場合は、最後の1件を残して直近のものから古い順に落とす。
+        """
+        if len(messages) <= self.keep_recent + 1:
+            return messages
+        first = messages[0]
+        older = messages[1:-self.keep_recent]
+        recent = messages[-self.keep_recent:]
+        summary_text = self._fit_tail(self.summarizer(older), max(budget // 4, 1))
+        summary = SystemMessage(content=f"これまでの会話の要約:\n{summary_text}")
+        compacted = [first, summary, *recent]
+        while messages_tokens(compacted) > budget and len(compacted) > 3:
+            del compacted[2]
+        return compacted
+
+
+def compact_messages(config: RunnableConfig, agent_name: str, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    config に context_manager が設定されていれば、エージェントに渡すメッセージを圧縮する。
+    blob_store の参照になっているメッセージは、圧縮の前に内容に戻す。
+    """
+    messages = resolve_messages(config, messages)
+    manager: Optional[ContextManager] = config.get("configurable", {}).get("context_manager")
+    if manager is None:
+        return messages
+    return manager.compact(messages, agent_name)
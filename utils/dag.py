@@ -0,0 +1,132 @@
+"""
+DependencyGraph: 各ノードが読み書きする AgentState のキーから、ノード間の依存関係を求める
+ノードは本来の逐次実行の順に NodeSpec で宣言します。あるキーを読むノードは、それより前で
+そのキーを最後に書くノードに依存します（ファイルの書き込みなど状態を介さない依存は after に書く）。
+依存のないノードどうしは同時に実行でき、build_workflow(parallel=True) はこの依存からエッジを作ります。
+critical_path() / schedule_report() は、ノードごとの所要時間から逐次実行との差（短縮できた時間）を求めます。
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+@dataclass(frozen=True)
+class NodeSpec:
+    """
+    ノードが読み書きするキーの宣言。
+
+    reads / writes: AgentState のキー。
+    after: 状態を介さずに完了を待つノード（書き込んだファイルを実行する、など）。
+    """
+
+    name: str
+    reads: Tuple[str, ...] = ()
+    writes: Tuple[str, ...] = ()
+    after: Tuple[str, ...] = ()
+
+
+class DependencyGraph:
+    """
+    NodeSpec の並びから求めた依存関係。
+
+    shared: 複数のノードが同時に書いてもよいキー（messages のように reducer で合成されるもの）。
+        それ以外のキーを、同時に実行されうる2つのノードが書く宣言になっていれば ValueError にする。
+    """
+
+    def __init__(self, specs: Sequence[NodeSpec], shared: Iterable[str] = ()):
+        self.specs = {spec.name: spec for spec in specs}
+        self.order = [spec.name for spec in specs]
+        self.shared = set(shared)
+        self.deps: Dict[str, Set[str]] = {}
+        last_writer: Dict[str, str] = {}
+        for spec in specs:
+            unknown = set(spec.after) - set(self.deps)
+            if unknown:
+                raise ValueError(f"{spec.name} runs after undeclared or later nodes: {sorted(unknown)}")
+            deps = {last_writer[key] for key in spec.reads if key in last_writer}
+            self.deps[spec.name] = deps | set(spec.after)
+            for key in spec.writes:
+                last_writer[key] = spec.name
+        self._ancestors = {name: self._collect_ancestors(name) for name in self.order}
+        self._check_concurrent_writes()
+
+    def _collect_ancestors(self, name: str) -> Set[str]:
+        ancestors: Set[str] = set()
+        stack = list(self.deps[name])
+        while stack:
+            dep = stack.pop()
+            if dep not in ancestors:
+                ancestors.add(dep)
+                stack.extend(self.deps[dep])
+        return ancestors
+
+    def concurrent(self, a: str, b: str) -> bool:
+        """a と b の間に依存がなく、同時に実行されうるか"""
+        return a != b and a not in self._ancestors[b] and b not in self._ancestors[a]
+
+    def _check_concurrent_writes(self) -> None:
+        for i, a in enumerate(self.order):
+            for b in self.order[i + 1:]:
+                if not self.concurrent(a, b):
+                    continue
+                conflict = (set(self.specs[a].writes) & set(self.specs[b].writes)) - self.shared
+                if conflict:
+                    raise ValueError(f"{a} and {b} may run concurrently but both write {sorted(conflict)}")
+
+    def direct_deps(self, name: str) -> Set[str]:
+        """推移的に含まれる依存を除いた、直接の依存（エッジを張る相手）"""
+        deps = self.deps[name]
+        return {d for d in deps if not any(d in self._ancestors[other] for other in deps if other != d)}
+
+    def roots(self) -> List[str]:
+        return [name for name in self.order if not self.deps[name]]
+
+    def successors(self, name: str) -> List[str]:
+        return [other for other in self.order if name in self.direct_deps(other)]
+
+    def sinks(self) -> List[str]:
+        return [name for name in self.order if not self.successors(name)]
+
+    def levels(self) -> List[List[str]]:
+        """同時に実行できるノードの段（各ノードは依存がすべて前の段にある最初の段に入る）"""
+        depth: Dict[str, int] = {}
+        for name in self.order:
+            depth[name] = max((depth[d] + 1 for d in self.deps[name]), default=0)
+        levels: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name in self.order:
+            levels[depth[name]].append(name)
+        return levels
+
+    def critical_path(self, durations: Dict[str, float]) -> Tuple[List[str], float]:
+        """所要時間が最も長い依存の連鎖（クリティカルパス）とその長さを返す。実行されなかったノードは0秒"""
+        finish: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+        for name in self.order:
+            before = max(self.deps[name], key=lambda d: finish[d], default=None)
+            previous[name] = before
+            finish[name] = (finish[before] if before is not None else 0.0) + durations.get(name, 0.0)
+        if not finish:
+            return [], 0.0
+        node: Optional[str] = max(finish, key=finish.get)
+        length = finish[node]
+        path = []
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return path[::-1], length
+
+    def schedule_report(self, durations: Dict[str, float], wall: Optional[float] = None) -> Dict[str, Any]:
+        """
+        逐次実行した場合の合計時間、クリティカルパス、短縮できた時間を返す。
+        wall（実測の所要時間）を渡すと saved は実測、省略するとクリティカルパスから見積もる。
+        """
+        sequential = sum(durations.get(name, 0.0) for name in self.order)
+        path, length = self.critical_path(durations)
+        elapsed = wall if wall is not None else length
+        return {
+            "sequential": sequential,
+            "critical_path": length,
+            "path": path,
+            "wall": wall,
+            "saved": max(sequential - elapsed, 0.0),
+        }
@@ -0,0 +1,185 @@
+"""
+ログ設定: キュー経由の非同期ハンドラ、遅延フォーマット、JSON出力、コンポーネント別レベル、サンプリング
+各モジュールは `logger = logging.getLogger(__name__)` でロガーを取得し、
+エントリーポイントで一度だけ configure_logging() を呼び出します。
+
+    logger.debug("state: %s", preview(state))              # レベルで落ちれば整形しない
+    logger.info("chunk: %s", preview(text), extra=sampled(100))  # 同じメッセージは100件に1件だけ出力
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Any, Dict, Mapping, Optional, TextIO, Union
+
+# preview() のデフォルトの最大文字数
+DEFAULT_PREVIEW_CHARS = 300
+
+# LogRecord の標準属性（これ以外の属性は extra として JSON に含める）
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class Preview:
+    """
+    値の短いプレビュー。str() されたとき（ログが実際に出力されるとき）に初めて整形し、
+    limit 文字を超えた分は省略して元の長さを付記する。
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = DEFAULT_PREVIEW_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def _text(self, value: Any) -> str:
+        content = getattr(value, "content", None)
+        if isinstance(content, str):
+            return f"{getattr(value, 'type', type(value).__name__)}: {content}"
+        return value if isinstance(value, str) else repr(value)
+
+    def __str__(self) -> str:
+        value = self.value
+        if isinstance(value, Mapping):
+            # AgentState のような辞書は、キーごとに切り詰めて全体の巨大な repr を作らない
+            per_key = max(self.limit // max(len(value), 1), 40)
+            text = "{" + ", ".join(f"{k}: {_truncate(self._summarize(v), per_key)}" for k, v in value.items()) + "}"
+        else:
+            text = self._text(value)
+        return _truncate(text, self.limit)
+
+    def _summarize(self, value: Any) -> str:
+        if isinstance(value, (list, tuple)) and value:
+            return f"[{len(value)} items, last={self._text(value[-1])}]"
+        return self._text(value)
+
+    __repr__ = __str__
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+def preview(value: Any, limit: int = DEFAULT_PREVIEW_CHARS) -> Preview:
+    """ログの引数に渡す、遅延評価・サイズ上限付きのプレビュー"""
+    return Preview(value, limit)
+
+
+def sampled(every: int) -> Dict[str, int]:
+    """ホットパスのログ用の extra。同じロガー・メッセージのうち every 件に1件だけ出力する"""
+    return {"sample_every": every}
+
+
+class SamplingFilter(logging.Filter):
+    """extra=sampled(n) が付いたレコードを、ロガー名とメッセージのテンプレートごとに n 件に1件だけ通す"""
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", 1)
+        if every <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % every:
+            return False
+        record.sampled = f"1/{every}"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコードを1行のJSONにする（extra で渡した値もフィールドとして含める）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sample_every":
+                data[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    レコードをそのままキューに入れる QueueHandler。
+    標準の prepare() は呼び出し元のスレッドでメッセージを整形するが、ここでは整形をリスナースレッドに任せる。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def configure_logging(
+    level: Union[int, str] = logging.INFO,
+    levels: Optional[Dict[str, Union[int, str]]] = None,
+    json_output: bool = True,
+    stream: Optional[TextIO] = None,
+    filename: Optional[str] = None,
+) -> logging.Handler:
+    """
+    ルートロガーをキュー経由の非同期ハンドラで設定する（複数回呼ぶと設定を置き換える）。
+
+    levels: ロガー名ごとのレベル（例: {"nodes": "WARNING", "agents.terminal_agent": "DEBUG"}）。
+    json_output: False ならテキスト形式で出力する。
+    filename を指定するとファイルに、それ以外は stream（デフォルト stderr）に書き出す。
+    """
+    global _listener, _queue_handler
+    shutdown_logging()
+
+    handler: logging.Handler = (
+        logging.FileHandler(filename, encoding="utf-8") if filename else logging.StreamHandler(stream or sys.stderr)
+    )
+    handler.setFormatter(
+        JsonFormatter() if json_output else logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter())
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    for name, component_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(component_level)
+    return _queue_handler
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出してリスナースレッドを止める"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+atexit.register(shutdown_logging)
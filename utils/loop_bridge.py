@@ -0,0 +1,108 @@
+"""
+LoopBridge: 同期コードからコルーチンを実行するための、常駐するイベントループスレッド
+呼び出しごとに asyncio.run() でループを作り直す代わりに、1つのループをプロセスの間使い続けます。
+ループに束縛される資源（ProcessEngine のサブプロセス、BrowserPool のブラウザ、HTTPクライアントなど）を
+同期版のノードでも呼び出しをまたいで再利用できます。
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopBridge:
+    """
+    専用スレッドで動き続けるイベントループ。
+    run() はコルーチンをそのループに投入し、完了まで呼び出し元のスレッドをブロックする。
+    """
+
+    def __init__(self, name: str = "loop-bridge"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """ループを返す（初回アクセス時にスレッドを起動する）"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def serve() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._loop = loop
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        """コルーチンをループに投入し、concurrent.futures.Future を返す"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """
+        コルーチンをループで実行して結果を返す。
+        timeout を過ぎた場合や呼び出し元が中断された場合は、ループ側のタスクもキャンセルする。
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("LoopBridge.run() をブリッジのループ内から呼び出すとデッドロックします。await してください。")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self, timeout: float = 5.0) -> None:
+        """残っているタスクをキャンセルし、ループとスレッドを停止する"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None or loop.is_closed():
+            return
+
+        async def drain() -> None:
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout)
+        except (concurrent.futures.TimeoutError, RuntimeError):
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+
+default_bridge = LoopBridge()
+atexit.register(default_bridge.close)
+
+
+def run_sync(awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """同期コードから default_bridge のループでコルーチンを実行する"""
+    if not asyncio.iscoroutine(awaitable):
+        async def wrap() -> T:
+            return await awaitable
+        awaitable = wrap()
+    return default_bridge.run(awaitable, timeout)
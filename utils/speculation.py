@@ -0,0 +1,60 @@
+"""
+SpeculationMetrics: レビュー中に投機的に実行したコーディングの成否と、短縮・浪費した時間の集計
+レビューが承認すれば投機の結果を採用し（hit）、修正を求めれば破棄します（miss）。
+hit では逐次実行（review → coding）と比べて min(review, coding) 秒を短縮し、
+miss では投機に使ったコーディングの時間（とLLM呼び出し）が無駄になります。
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.stats import latency_summary
+
+
+class SpeculationMetrics:
+    """投機的コーディングの hit / miss と、実行ごとの短縮時間を集計する"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.saved = 0.0
+        self.wasted = 0.0
+        self.per_run: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record_hit(self, review: float, coding: float) -> float:
+        """採用した投機を記録し、短縮した秒数を返す"""
+        saved = min(review, coding)
+        with self._lock:
+            self.hits += 1
+            self.saved += saved
+            self.per_run.append({"outcome": "hit", "review": review, "coding": coding, "saved": saved})
+        return saved
+
+    def record_miss(self, review: float, coding: Optional[float]) -> None:
+        """レビューが修正を求めたため破棄した投機を記録する（coding は打ち切るまでの秒数、未開始なら None）"""
+        with self._lock:
+            self.misses += 1
+            self.wasted += coding or 0.0
+            self.per_run.append({"outcome": "miss", "review": review, "coding": coding, "saved": 0.0})
+
+    def record_failure(self, review: float, error: BaseException) -> None:
+        """投機が失敗したため、承認後に通常どおりコーディングしたことを記録する"""
+        with self._lock:
+            self.failures += 1
+            self.per_run.append({"outcome": "failed", "review": review, "error": repr(error), "saved": 0.0})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses + self.failures
+            return {
+                "speculations": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved": self.saved,
+                "wasted": self.wasted,
+                "saved_per_run": latency_summary([r["saved"] for r in self.per_run]),
+            }
@@ -0,0 +1,44 @@
+"""
+トークン数の見積もり
+tiktoken がインストールされていればそれを使い、なければ文字数からおおよその値を求めます。
+"""
+
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[Any]:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def approx_token_count(text: str) -> int:
+    """おおよそのトークン数を返す（英語は単語数、日本語など空白の少ない文字列は4文字=1トークン）"""
+    if not text:
+        return 0
+    return max(len(text.split()), len(text) // 4)
+
+
+def count_tokens(text: str) -> int:
+    """テキストのトークン数を返す"""
+    encoding = _encoding()
+    if encoding is None:
+        return approx_token_count(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message: Any) -> int:
+    """メッセージ1件のトークン数（ロール等のオーバーヘッドとして4トークンを加算）"""
+    content = getattr(message, "content", message)
+    return count_tokens(content if isinstance(content, str) else str(content)) + 4
+
+
+def messages_tokens(messages: Iterable[Any]) -> int:
+    return sum(message_tokens(m) for m in messages)
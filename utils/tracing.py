@@ -0,0 +1,180 @@
+"""
+Tracer: ノード・エージェント・LLM呼び出し・ツール実行のスパンを記録するトレーサー
+記録したスパンは Chrome trace 形式（chrome://tracing / Perfetto で表示可能）や
+flamegraph.pl / speedscope 用の folded stacks 形式で書き出せます。
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_current_tracer: contextvars.ContextVar[Optional["Tracer"]] = contextvars.ContextVar("current_tracer", default=None)
+_current_stack: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("current_stack", default=())
+
+
+def get_tracer() -> Optional["Tracer"]:
+    """現在のコンテキストで有効なトレーサーを返す（無効ならNone）"""
+    return _current_tracer.get()
+
+
+def _lane_id() -> int:
+    """スパンを表示するレーンID。asyncioタスク内ならタスクごと、それ以外はスレッドごとに分ける"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return id(task)
+    return threading.get_ident()
+
+
+class Tracer:
+    """
+    スパンを収集してエクスポートするトレーサー。
+    span() はトレーサーが有効なコンテキストでのみ記録し、それ以外では何もしません。
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._lanes: Dict[int, int] = {}
+
+    def _tid(self) -> int:
+        lane = _lane_id()
+        with self._lock:
+            return self._lanes.setdefault(lane, len(self._lanes) + 1)
+
+    @contextmanager
+    def activate(self) -> Iterator["Tracer"]:
+        """このトレーサーを現在のコンテキストで有効にする"""
+        token = _current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _current_tracer.reset(token)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "function", **args: Any) -> Iterator[Dict[str, Any]]:
+        """
+        スパンを記録する。yieldされる辞書に値を追加すると、スパンの引数として出力される。
+        """
+        stack = _current_stack.get() + (name,)
+        stack_token = _current_stack.set(stack)
+        tracer_token = _current_tracer.set(self)
+        tid = self._tid()
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            end = time.perf_counter()
+            _current_tracer.reset(tracer_token)
+            _current_stack.reset(stack_token)
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self.pid,
+                "tid": tid,
+                "args": {k: v if isinstance(v, (int, float, str, bool, type(None))) else str(v) for k, v in args.items()},
+                "stack": stack,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """スパン名ごとの呼び出し回数と合計時間（秒）を返す"""
+        result: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            entry = result.setdefault(event["name"], {"count": 0, "total": 0.0, "cat": event["cat"]})
+            entry["count"] += 1
+            entry["total"] += event["dur"] / 1e6
+        return result
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        with self._lock:
+            events = [{k: v for k, v in e.items() if k != "stack"} for e in self.events]
+        return {"traceEvents": sorted(events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Chrome trace 形式のJSONファイルを書き出す"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+
+    def export_folded(self, path: str) -> None:
+        """flamegraph.pl / speedscope 用の folded stacks（自己時間、マイクロ秒）を書き出す"""
+        with self._lock:
+            events = list(self.events)
+        self_time: Dict[Tuple[str, ...], float] = {}
+        for event in events:
+            self_time[event["stack"]] = self_time.get(event["stack"], 0.0) + event["dur"]
+        for event in events:
+            parent = event["stack"][:-1]
+            if parent in self_time:
+                self_time[parent] -= event["dur"]
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, dur in sorted(self_time.items()):
+                f.write(f"{';'.join(stack)} {max(0, int(dur))}\n")
+
+
+@contextmanager
+def span(name: str, cat: str = "function", **args: Any) -> Iterator[Dict[str, Any]]:
+    """有効なトレーサーがあればスパンを記録し、なければ何もしない"""
+    tracer = get_tracer()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, cat, **args) as span_args:
+        yield span_args
+
+
+def traced(name: str, cat: str = "function", tracer: Optional[Tracer] = None) -> Callable[[Callable], Callable]:
+    """
+    関数（同期・非同期）をスパンで包むデコレータ。
+    tracer を指定した場合はそのトレーサーを、省略した場合は現在のコンテキストのトレーサーを使用する。
+    """
+
+    def decorator(func: Callable) -> Callable:
+        def _span():
+            return tracer.span(name, cat) if tracer is not None else span(name, cat)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _span():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span():
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_llm_usage(span_args: Dict[str, Any], messages: Any, response: Any) -> None:
+    """LLM呼び出しスパンにトークン数とペイロードサイズを記録する"""
+    span_args["prompt_chars"] = sum(len(str(getattr(m, "content", m))) for m in messages)
+    content = getattr(response, "content", response)
+    span_args["completion_chars"] = len(str(content))
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage:
+        span_args["prompt_tokens"] = usage.get("input_tokens", 0)
+        span_args["completion_tokens"] = usage.get("output_tokens", 0)
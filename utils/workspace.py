@@ -0,0 +1,32 @@
+"""
+作業ディレクトリ: config["configurable"]["work_dir"] に設定したタスクごとのディレクトリ
+batch_runner の isolated_config がタスクごとに作成し、ファイルの書き込み・差分の適用・コマンドの実行は
+すべてこの中で行います。LLMが出力したパスは resolve_path() で work_dir の下に解決し、
+絶対パスや ../、シンボリックリンクで外に出るパスは WorkDirError にします。
+"""
+
+import os
+from typing import Optional
+
+from langchain_core.runnables import RunnableConfig
+
+
+class WorkDirError(ValueError):
+    """パスが作業ディレクトリの外を指している"""
+
+
+def get_work_dir(config: Optional[RunnableConfig]) -> Optional[str]:
+    if not config:
+        return None
+    return config.get("configurable", {}).get("work_dir")
+
+
+def resolve_path(work_dir: Optional[str], path: str) -> str:
+    """work_dir が指定されていれば、path を work_dir の下の実パスに解決する（外に出る場合は WorkDirError）"""
+    if not work_dir:
+        return path
+    root = os.path.realpath(work_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise WorkDirError(f"{path} は作業ディレクトリ {root} の外を指しています。")
+    return resolved
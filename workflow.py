@@ -1,11 +1,17 @@
 """
 StateGraphの定義と各ノードの紐付けを行う。
 """
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from langchain_core.runnables import RunnableLambda
+from typing import Callable, List, Optional
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from models.agent_state import AgentState
+from utils.budget import budgeted
+from utils.dag import DependencyGraph, NodeSpec
+from utils.tracing import Tracer, traced
 from nodes.nodes import (
     read_code_node,
+    aread_code_node,
     planning_node,
     aplanning_node,
     review_node,
@@ -13,6 +19,7 @@ from nodes.nodes import (
     coding_node,
     acoding_node,
     file_operation_node,
+    review_approved,
     should_continue,
     afile_operation_node,
     terminal_node,
@@ -23,61 +30,176 @@ from nodes.nodes import (
     acommand_generation_node
 )
 
-def build_workflow() -> StateGraph:
+# 各ノードが読み書きする AgentState のキー（逐次実行の順）。
+# file_operation_result / terminal_command / browser_result は AgentState に含まれないため、状態を介した依存にならない。
+# read_code は要件定義の前に実行されるため、symbol_index の検索にはユーザーのタスクだけが使われる。
+WORKFLOW_SPECS = [
+    NodeSpec("read_code", reads=("messages",), writes=("existing_code", "code_context", "target_file_path")),
+    NodeSpec("planning", reads=("messages",), writes=("messages", "requirements")),
+    NodeSpec("review", reads=("messages", "requirements"), writes=("messages", "review_result")),
+    NodeSpec(
+        "coding",
+        reads=("messages", "requirements", "existing_code", "code_context", "target_file_path"),
+        writes=("messages", "coding_result"),
+    ),
+    NodeSpec("file_operation", reads=("coding_result",)),
+    NodeSpec("command_generation", reads=("messages",), writes=("messages", "generated_command")),
+    # 書き込まれたファイルを実行するため、ファイル操作の完了を待つ
+    NodeSpec("terminal", reads=("generated_command",), after=("file_operation",)),
+    NodeSpec("browser", reads=("messages",), after=("terminal",)),
+]
+
+# messages と budget_exhausted は reducer で合成されるため、同時に書いてもよい
+WORKFLOW_DEPENDENCIES = DependencyGraph(WORKFLOW_SPECS, shared=("messages", "budget_exhausted"))
+
+# planning / review の条件付きエッジで実行が決まるノード
+ROUTED_NODES = {"planning", "review", "coding"}
+
+
+def build_workflow(tracer: Optional[Tracer] = None, checkpointer: Optional[BaseCheckpointSaver] = None,
+                   parallel: bool = False) -> StateGraph:
+    """
+    ワークフローを構築してコンパイルする。
+    tracer を指定すると、各ノードの実行がスパンとして記録される。
+    checkpointer（例: utils.checkpointer.SqliteCheckpointer）を指定すると、各ステップの状態が保存され、
+    config["configurable"]["thread_id"] を実行IDとして resume / replay_from_node で再開できる。
+    config["configurable"]["run_budget"]（utils.budget.RunBudget）を指定すると、予算を使い切った時点で
+    以降のノードを実行せずに END へ進み、それまでの結果を返す。
+    parallel=True にすると、WORKFLOW_DEPENDENCIES で依存のないノードを同時に実行する
+    （read_code と planning、file_operation と command_generation）。
+    config["configurable"]["speculative_coding"] を True にすると、review はレビューと並行してコーディングし、
+    承認されれば coding を飛ばしてその後続へ進む。
+    """
     workflow = StateGraph(AgentState)
 
+    def node(name: str, func: Callable, afunc: Optional[Callable] = None) -> RunnableLambda:
+        func = budgeted(name)(func)
+        afunc = budgeted(name)(afunc) if afunc is not None else None
+        if tracer is not None:
+            func = traced(name, "node", tracer)(func)
+            afunc = traced(name, "node", tracer)(afunc) if afunc is not None else None
+        return RunnableLambda(func, afunc=afunc)
+
     # ノードを追加
-    workflow.add_node("read_code", RunnableLambda(read_code_node))
-    workflow.add_node("planning", RunnableLambda(planning_node, afunc=aplanning_node))
-    workflow.add_node("review", RunnableLambda(review_node, afunc=areview_node))
-    workflow.add_node("coding", RunnableLambda(coding_node, afunc=acoding_node))
-    workflow.add_node("file_operation", RunnableLambda(file_operation_node, afunc=afile_operation_node))
-    workflow.add_node("command_generation", RunnableLambda(command_generation_node, afunc=acommand_generation_node))
-    workflow.add_node("terminal", RunnableLambda(terminal_node, afunc=aterminal_node))
-    workflow.add_node("browser", RunnableLambda(browser_node, afunc=abrowser_node))
+    workflow.add_node("read_code", node("read_code", read_code_node, aread_code_node))
+    workflow.add_node("planning", node("planning", planning_node, aplanning_node))
+    workflow.add_node("review", node("review", review_node, areview_node))
+    workflow.add_node("coding", node("coding", coding_node, acoding_node))
+    workflow.add_node("file_operation", node("file_operation", file_operation_node, afile_operation_node))
+    workflow.add_node("command_generation", node("command_generation", command_generation_node, acommand_generation_node))
+    workflow.add_node("terminal", node("terminal", terminal_node, aterminal_node))
+    workflow.add_node("browser", node("browser", browser_node, abrowser_node))
+
+    def unless_exhausted(route: Callable[[AgentState], str]) -> Callable[[AgentState], str]:
+        """予算を使い切っていれば END へ、そうでなければ route の行き先へ進める"""
+        return lambda state: END if state.get("budget_exhausted") else route(state)
+
+    def edge(source: str, target: str) -> None:
+        workflow.add_conditional_edges(source, unless_exhausted(lambda state: target), {target: target, END: END})
+
+    if parallel:
+        _add_parallel_edges(workflow, unless_exhausted)
+        return workflow.compile(checkpointer=checkpointer)
 
     # エントリーポイント
     workflow.set_entry_point("read_code")
-    workflow.add_edge("read_code", "planning")
+    edge("read_code", "planning")
+
+    _add_review_loop(workflow, unless_exhausted, ["file_operation"])
 
+    # コーディングエージェント → ファイル操作エージェント
+    edge("coding", "file_operation")
+
+    # ファイル操作エージェント → コマンド生成エージェント
+    edge("file_operation", "command_generation")
+
+    # コマンド生成エージェント → ターミナルエージェント
+    edge("command_generation", "terminal")
+
+    # ターミナルエージェント → ブラウザエージェント
+    edge("terminal", "browser")
+
+    # ブラウザエージェント → 終了
+    workflow.add_edge("browser", END)
+
+    # 終了点
+    workflow.set_finish_point("browser")
+
+    graph = workflow.compile(checkpointer=checkpointer)
+    return graph
+
+
+def _add_review_loop(workflow: StateGraph, unless_exhausted: Callable, after_coding: List[str]) -> None:
+    """
+    planning ⇄ review の条件付きエッジ（要件が承認されたら coding へ進む）。
+    review が投機的なコーディングの結果（coding_result）を返していれば、coding の後続 after_coding へ進む。
+    """
     # 条件付きエッジ（planning）
     workflow.add_conditional_edges(
         "planning",
-        should_continue,
+        unless_exhausted(should_continue),
         {
             "planning": "planning",
             "review": "review",
-            "coding": "coding"
+            "coding": "coding",
+            END: END
         }
     )
 
+    def after_review(state: AgentState):
+        if not review_approved(state.get("review_result")):
+            return "planning"
+        return after_coding if state.get("coding_result") else "coding"
+
     # 条件付きエッジ（review）
     workflow.add_conditional_edges(
         "review",
-        lambda state: "planning" if "Please revise" in state.get("review_result", "") else "coding",
+        unless_exhausted(after_review),
         {
             "planning": "planning",
-            "coding": "coding"
+            "coding": "coding",
+            **{target: target for target in after_coding},
+            END: END
         }
     )
 
-    # コーディングエージェント → ファイル操作エージェント
-    workflow.add_edge("coding", "file_operation")
 
-    # ファイル操作エージェント → コマンド生成エージェント
-    workflow.add_edge("file_operation", "command_generation")
-
-    # コマンド生成エージェント → ターミナルエージェント
-    workflow.add_edge("command_generation", "terminal")
+def _add_parallel_edges(workflow: StateGraph, unless_exhausted: Callable) -> None:
+    """
+    WORKFLOW_DEPENDENCIES からエッジを張る。
+    依存のないノードは START から同時に開始し、1つのノードに依存するノードは条件付きエッジのファンアウトで、
+    複数のノードに依存するノードはすべての完了を待つエッジ（join）で開始する。
+    planning ⇄ review ⇄ coding は逐次実行と同じ条件付きエッジで進む。coding が待つ他の依存（read_code）は
+    START から開始するノードであり、同じステップの planning より後に終わることはないため、エッジは不要になる。
+    """
+    dag = WORKFLOW_DEPENDENCIES
+    for name in ROUTED_NODES:
+        early = {d for d in dag.direct_deps(name) if d not in ROUTED_NODES} - set(dag.roots())
+        if early:
+            raise ValueError(f"{name} is entered by conditional edges but also waits for {sorted(early)}")
 
-    # ターミナルエージェント → ブラウザエージェント
-    workflow.add_edge("terminal", "browser")
+    def fan_out(name: str) -> List[str]:
+        return [s for s in dag.successors(name) if s not in ROUTED_NODES and len(dag.direct_deps(s)) == 1]
 
-    # ブラウザエージェント → 終了
-    workflow.add_edge("browser", END)
+    for root in dag.roots():
+        workflow.add_edge(START, root)
+    _add_review_loop(workflow, unless_exhausted, fan_out("coding"))
 
-    # 終了点
-    workflow.set_finish_point("browser")
+    joined = set()
+    for name in dag.order:
+        deps = dag.direct_deps(name)
+        if name not in ROUTED_NODES and len(deps) > 1:
+            # すべての依存の完了を待つ（予算切れでも各ノードは budgeted により実行されずに終わる）
+            workflow.add_edge(sorted(deps), name)
+            joined |= deps
 
-    graph = workflow.compile()
-    return graph
\ No newline at end of file
+    for name in dag.order:
+        if name in ("planning", "review"):
+            continue
+        targets = fan_out(name)
+        if targets:
+            # 1つ以上の後続へファンアウトする
+            route = unless_exhausted(lambda state, targets=targets: targets)
+            workflow.add_conditional_edges(name, route, {**{t: t for t in targets}, END: END})
+        elif name not in joined:
+            workflow.add_edge(name, END)